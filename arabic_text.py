@@ -0,0 +1,63 @@
+import re
+
+# --- 1. ثوابت التطبيع (Normalization Constants) ---
+
+# التشكيل وعلامات القرآن والتطويل
+TASHKEEL_PATTERN = re.compile('[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]')
+
+# توحيد أشكال الألف والياء والتاء المربوطة
+CHAR_MAP = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي',
+    'ؤ': 'و',
+    'ة': 'ه',
+    # الأرقام العربية الهندية والفارسية إلى أرقام لاتينية
+    '٠': '0', '١': '1', '٢': '2', '٣': '3', '٤': '4',
+    '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9',
+    '۰': '0', '۱': '1', '۲': '2', '۳': '3', '۴': '4',
+    '۵': '5', '۶': '6', '۷': '7', '۸': '8', '۹': '9',
+})
+
+# علامات الترقيم (العربية واللاتينية) التي لا تحمل معنى للمقارنة
+PUNCTUATION_PATTERN = re.compile(r'[^\w\s]|_')
+
+# عنوان المادة ومرساتها كما يكتبهما splitter.py داخل جسم الـ ALU
+ALU_HEADING_PATTERN = re.compile(r'^\s*#\s*المادة\s*\S+\s*$', re.MULTILINE)
+ALU_ANCHOR_PATTERN = re.compile(r'\{#art-[^}]*\}')
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# --- 2. توابع التطبيع (Normalization Functions) ---
+
+def strip_alu_markup(text):
+    """إزالة عنوان المادة ومرساتها من جسم الـ ALU حتى لا يؤثر رقم المادة على المقارنة."""
+    text = ALU_HEADING_PATTERN.sub(' ', text)
+    return ALU_ANCHOR_PATTERN.sub(' ', text)
+
+def strip_tashkeel(text):
+    """حذف التشكيل والتطويل فقط مع إبقاء الحروف كما هي (مناسب لمقارنة أخطاء OCR)."""
+    return TASHKEEL_PATTERN.sub('', text)
+
+def normalize_arabic(text):
+    """تطبيع النص العربي: حذف التشكيل والتطويل، توحيد الحروف والأرقام، وحذف الترقيم."""
+    text = TASHKEEL_PATTERN.sub('', text)
+    text = text.translate(CHAR_MAP)
+    text = PUNCTUATION_PATTERN.sub(' ', text)
+    return ' '.join(text.split())
+
+def tokenize(text):
+    """تقسيم نص مُطبَّع إلى كلمات."""
+    return TOKEN_PATTERN.findall(text)
+
+# --- 3. الكلمات الشائعة (Stopwords) ---
+
+# أدوات الربط والضمائر والأفعال المساعدة، وألفاظ الصياغة القانونية المتكررة في كل المواد
+_STOPWORDS = """
+في من إلى الى على عن مع عند لدى حتى منذ بين دون غير سوى خلال ضمن عبر نحو
+و أو ثم بل لكن إن أن إذا اذا لو لا لم لن ما ماذا كل بعض أي أية أيا قد كان كانت يكون تكون يكونا
+هو هي هم هن هما أنت نحن هذا هذه ذلك تلك هؤلاء أولئك الذي التي الذين اللذين اللتين اللاتي
+به بها بهم فيه فيها فيهم منه منها منهم عليه عليها عليهم له لها لهم إليه إليها عنه عنها ذاته
+ليس ليست كما مما فيما عما بما كذلك أيضا وفق وفقا طبقا بموجب بشأن حيث بحسب حسب إلا الا
+المادة مادة النظام نظام اللائحة القانون أحكام احكام حكم الفقرة البند ويجوز يجوز يتم تم
+"""
+ARABIC_STOPWORDS = frozenset(normalize_arabic(word) for word in _STOPWORDS.split())
@@ -0,0 +1,222 @@
+import io
+import json
+import time
+import random
+import struct
+import zipfile
+import argparse
+from pathlib import Path
+
+import zstandard as zstd
+
+from corpus_manifest import CorpusManifest, CORPUS_MANIFEST_FILE
+
+# --- ثوابت وإعدادات ---
+ARCHIVE_FILE = "corpus.alu.zst"          # الملف الافتراضي للتصدير (بجوار مجلد المخرجات)
+ARCHIVE_MAGIC = b'ALUZST01'
+FOOTER_FORMAT = '<Q8s'                   # موضع الفهرس + التوقيع في آخر 16 بايت
+DICTIONARY_SIZE = 112 * 1024             # حجم القاموس المدرَّب (الحجم الافتراضي لـ zstd --train)
+DICTIONARY_SAMPLES = 10000               # أقصى عدد ملفات عينة لتدريب القاموس
+# معاملات COVER ثابتة بدلاً من البحث الآلي عنها: أسرع بأضعاف ونتيجتها على مدونتنا مماثلة أو أفضل
+DICTIONARY_K = 1024
+DICTIONARY_D = 8
+COMPRESSION_LEVEL = 19
+INCLUDED_SUFFIXES = ('.manifest.json', '.ocr_review.json')   # ملفات الوثيقة المصدّرة بجانب المواد والملف الأم
+
+# --- 1. الملفات المصدّرة ---
+
+def export_entries(corpus_manifest):
+    """
+    (المسار النسبي، المسار على القرص) لكل ملف مصدّر بترتيب المدونة:
+    الملف الأم ومواد كل وثيقة (بترتيبها) وملفاتها المساعدة، ثم بيان المدونة.
+    """
+    base = corpus_manifest.base_folder
+    for doc_slug in corpus_manifest.doc_slugs:
+        entry = corpus_manifest.documents[doc_slug]
+        yield entry['parent_file'], base / entry['parent_file']
+        for alu in corpus_manifest.alus(doc_slug):
+            path = base / alu['file']
+            if not path.exists():
+                print(f"  ⚠️ ملف مادة مفقود لن يُصدَّر: {alu['file']} (شغّل integrity_check.py)")
+                continue
+            yield alu['file'], path
+        for suffix in INCLUDED_SUFFIXES:
+            path = corpus_manifest.document_file(doc_slug, suffix)
+            if path.exists():
+                yield f"{doc_slug}/{path.name}", path
+    manifest_path = base / CORPUS_MANIFEST_FILE
+    if manifest_path.exists():
+        yield CORPUS_MANIFEST_FILE, manifest_path
+
+def train_dictionary(paths, size=DICTIONARY_SIZE, max_samples=DICTIONARY_SAMPLES, seed=0):
+    """
+    تدريب قاموس zstd على عينة من ملفات المدونة (نص عربي قانوني ورؤوس YAML متكررة):
+    الملفات الصغيرة المضغوطة كل على حدة تستفيد من القاموس كأنها مضغوطة معاً.
+    """
+    sample_paths = list(paths)
+    if len(sample_paths) > max_samples:
+        sample_paths = random.Random(seed).sample(sample_paths, max_samples)
+    samples = [path.read_bytes() for path in sample_paths]
+    try:
+        return zstd.train_dictionary(size, samples, k=DICTIONARY_K, d=DICTIONARY_D, level=COMPRESSION_LEVEL)
+    except zstd.ZstdError as e:
+        # المدونات الصغيرة جداً لا تكفي لتدريب قاموس: يُضغط كل ملف دون قاموس
+        print(f"  ⚠️ تعذر تدريب القاموس ({e})؛ سيُضغط الأرشيف دون قاموس.")
+        return None
+
+# --- 2. الكتابة ---
+
+def export_archive(base_folder, archive_path, level=COMPRESSION_LEVEL):
+    """
+    كتابة الأرشيف: التوقيع، القاموس، ثم إطار zstd مستقل لكل ملف (بالقاموس) ليمكن استخراج
+    مادة واحدة دون فك غيرها، ثم الفهرس المضغوط، ثم تذييل بموضع الفهرس.
+    يعيد إحصاءات التصدير.
+    """
+    corpus_manifest = CorpusManifest.load(base_folder)
+    entries = list(export_entries(corpus_manifest))
+    dictionary = train_dictionary([path for name, path in entries if name.endswith('.md')])
+    compressor = zstd.ZstdCompressor(level=level, dict_data=dictionary, write_checksum=True)
+    dictionary_bytes = dictionary.as_bytes() if dictionary is not None else b''
+
+    index = {'files': {}, 'alus': {}}
+    raw_bytes = 0
+    with open(archive_path, 'wb') as out:
+        out.write(ARCHIVE_MAGIC + struct.pack('<I', len(dictionary_bytes)) + dictionary_bytes)
+        for name, path in entries:
+            data = path.read_bytes()
+            frame = compressor.compress(data)
+            index['files'][name] = [out.tell(), len(frame), len(data)]
+            out.write(frame)
+            raw_bytes += len(data)
+        for doc_slug in corpus_manifest.doc_slugs:
+            for alu in corpus_manifest.alus(doc_slug):
+                if alu['file'] in index['files']:
+                    index['alus'][alu['id']] = alu['file']
+
+        index_offset = out.tell()
+        out.write(zstd.ZstdCompressor(level=level).compress(json.dumps(index, ensure_ascii=False).encode('utf-8')))
+        out.write(struct.pack(FOOTER_FORMAT, index_offset, ARCHIVE_MAGIC))
+
+    return {
+        'files': len(entries),
+        'alus': len(index['alus']),
+        'raw_bytes': raw_bytes,
+        'archive_bytes': Path(archive_path).stat().st_size,
+        'dictionary_bytes': len(dictionary_bytes),
+    }
+
+def zip_size(base_folder):
+    """حجم أرشيف zip للملفات نفسها (للمقارنة مع طريقة التسليم الحالية)."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=9) as archive:
+        for name, path in export_entries(CorpusManifest.load(base_folder)):
+            archive.write(path, name)
+    return buffer.tell()
+
+# --- 3. القراءة ---
+
+class ArchiveReader:
+    """
+    قراءة الأرشيف بوصول عشوائي: يُحمَّل التذييل والفهرس والقاموس فقط،
+    وكل ملف يُفك من إطاره وحده.
+
+    مثال:
+        with ArchiveReader("corpus.alu.zst") as archive:
+            text = archive.read_alu("وثيقة-...--مادة-001")
+    """
+
+    def __init__(self, archive_path):
+        self.file = open(archive_path, 'rb')
+        header = self.file.read(len(ARCHIVE_MAGIC) + 4)
+        if header[:len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC:
+            raise ValueError(f"ليس أرشيف مدونة صالحاً: {archive_path}")
+        dictionary_length = struct.unpack('<I', header[len(ARCHIVE_MAGIC):])[0]
+        dictionary = zstd.ZstdCompressionDict(self.file.read(dictionary_length)) if dictionary_length else None
+        self.decompressor = zstd.ZstdDecompressor(dict_data=dictionary)
+
+        footer_size = struct.calcsize(FOOTER_FORMAT)
+        self.file.seek(-footer_size, 2)
+        index_offset, magic = struct.unpack(FOOTER_FORMAT, self.file.read(footer_size))
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError(f"تذييل الأرشيف تالف: {archive_path}")
+        end = self.file.tell() - footer_size
+        self.file.seek(index_offset)
+        index_frame = self.file.read(end - index_offset)
+        self.index = json.loads(zstd.ZstdDecompressor().decompress(index_frame))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def names(self):
+        return list(self.index['files'])
+
+    def read(self, name):
+        """فك ملف واحد بمساره النسبي."""
+        offset, length, size = self.index['files'][name]
+        self.file.seek(offset)
+        return self.decompressor.decompress(self.file.read(length), max_output_size=size)
+
+    def read_alu(self, alu_id):
+        return self.read(self.index['alus'][alu_id]).decode('utf-8')
+
+    def extract_all(self, target_folder):
+        """
+        استخراج كل الملفات إلى target_folder. الأسماء تأتي من فهرس الأرشيف نفسه (قد يصل من فريق آخر)،
+        فيُرفض الأرشيف كله قبل كتابة أي ملف إذا خرج أي مسار عن مجلد الهدف (مثل ../ أو مسار مطلق).
+        """
+        target = Path(target_folder).resolve()
+        paths = {}
+        for name in self.index['files']:
+            path = (target / name).resolve()
+            if path == target or not path.is_relative_to(target):
+                raise ValueError(f"مسار غير آمن في الأرشيف (خارج مجلد الاستخراج): {name}")
+            paths[name] = path
+        for name, path in paths.items():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(self.read(name))
+        return len(paths)
+
+# --- 4. التشغيل ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="تصدير المدونة كأرشيف zstd بقاموس مدرَّب وفهرس لكل مادة، أو الاستخراج منه.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="تصدير المدونة")
+    export_parser.add_argument("--input", default="processed_systems_output", help="مجلد المخرجات")
+    export_parser.add_argument("--output", default=ARCHIVE_FILE, help="مسار الأرشيف")
+    export_parser.add_argument("--level", type=int, default=COMPRESSION_LEVEL)
+    export_parser.add_argument("--compare-zip", action="store_true", help="حساب حجم zip للملفات نفسها للمقارنة")
+    extract_parser = commands.add_parser("extract", help="استخراج مادة أو كل الأرشيف")
+    extract_parser.add_argument("archive")
+    extract_parser.add_argument("--alu", default=None, help="معرف مادة تُطبع على المخرج القياسي")
+    extract_parser.add_argument("--target", default=None, help="استخراج كل الملفات إلى هذا المجلد")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        if not Path(args.input).exists():
+            print(f"❌ لم يتم العثور على مجلد المخرجات: {args.input}")
+            exit()
+        started = time.time()
+        stats = export_archive(args.input, args.output, args.level)
+        ratio = stats['raw_bytes'] / stats['archive_bytes'] if stats['archive_bytes'] else 0
+        print(f"✅ تم تصدير {stats['files']} ملف ({stats['alus']} مادة) إلى {args.output} في {time.time() - started:.1f} ث.")
+        print(f"  > الحجم: {stats['raw_bytes'] / 1024:.1f} KB -> {stats['archive_bytes'] / 1024:.1f} KB "
+              f"(نسبة {ratio:.1f}x، منها القاموس {stats['dictionary_bytes'] / 1024:.1f} KB)")
+        if args.compare_zip:
+            size = zip_size(args.input)
+            print(f"  > zip للملفات نفسها: {size / 1024:.1f} KB (أكبر بـ {size / stats['archive_bytes']:.1f}x)")
+
+    elif args.command == "extract":
+        with ArchiveReader(args.archive) as archive:
+            if args.alu:
+                print(archive.read_alu(args.alu))
+            elif args.target:
+                count = archive.extract_all(args.target)
+                print(f"✅ تم استخراج {count} ملف إلى {args.target}.")
+            else:
+                print(f"✅ الأرشيف يحوي {len(archive.names())} ملف و{len(archive.index['alus'])} مادة.")
@@ -0,0 +1,237 @@
+import json
+import time
+import zlib
+import argparse
+from pathlib import Path
+
+# المصنف اختياري: enricher.py وoffline_enricher.py يستوردان هذه الوحدة ويعملان دونه إذا غابت numpy/scipy
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+from arabic_text import normalize_arabic, strip_alu_markup, tokenize
+from corpus_manifest import CorpusManifest
+from integrity_check import parse_front_matter
+from response_schema import ASPECT_PROCEDURAL, ASPECT_SUBSTANTIVE
+
+# --- ثوابت وإعدادات ---
+ASPECT_MODEL_FILE = "aspect_model.npz"   # النموذج المحفوظ (داخل مجلد المخرجات)
+HASH_BITS = 18                           # 2^18 خانة للسمات المجزأة (كلمات وأزواج كلمات)
+CONFIDENCE_THRESHOLD = 0.95              # أقل ثقة يُعتمد عندها تصنيف المصنف بدلاً من LLM
+MIN_CONFIDENT_ACCURACY = 0.97            # أقل دقة (على العينة المحجوزة فوق حد الثقة) يُقبل عندها النموذج المحفوظ
+EPOCHS = 8
+BATCH_SIZE = 256
+LEARNING_RATE = 0.5
+L2_PENALTY = 1e-5
+VALIDATION_RATIO = 0.1                   # نسبة المواد المحجوزة لقياس الدقة قبل التدريب النهائي
+LOCAL_SOURCE = 'local'                   # قيمة aspect_source في رؤوس المواد التي صنفها المصنف (لا يُتدرب عليها)
+
+# --- 1. السمات ---
+
+def features(text):
+    """كلمات النص المُطبَّع وأزواجها المتتالية، مجزأة إلى أرقام خانات بوزن log(1+tf) ومُطبَّعة."""
+    tokens = tokenize(normalize_arabic(strip_alu_markup(text)))
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    counts = {}
+    mask = (1 << HASH_BITS) - 1
+    for gram in grams:
+        bucket = zlib.crc32(gram.encode('utf-8')) & mask
+        counts[bucket] = counts.get(bucket, 0) + 1
+    return counts
+
+def feature_matrix(texts):
+    """مصفوفة CSR للنصوص (صف لكل نص)، كل صف بطول 1."""
+    data, indices, indptr = [], [], [0]
+    for text in texts:
+        counts = features(text)
+        values = np.log1p(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+        norm = np.linalg.norm(values)
+        data.append(values / norm if norm else values)
+        indices.append(np.fromiter(counts.keys(), dtype=np.int32, count=len(counts)))
+        indptr.append(indptr[-1] + len(counts))
+    return sparse.csr_matrix(
+        (np.concatenate(data) if data else np.zeros(0, np.float32),
+         np.concatenate(indices) if indices else np.zeros(0, np.int32),
+         np.array(indptr, dtype=np.int64)),
+        shape=(len(texts), 1 << HASH_BITS),
+    )
+
+# --- 2. النموذج ---
+
+def _sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+class AspectClassifier:
+    """
+    انحدار لوجستي ثنائي (إجرائي مقابل موضوعي) على سمات مجزأة.
+    يُدرَّب من المواد المُثراة بـ LLM، ويصنف آلاف المواد في الثانية.
+    """
+
+    def __init__(self, weights=None, bias=0.0, info=None):
+        self.weights = weights if weights is not None else np.zeros(1 << HASH_BITS, dtype=np.float32)
+        self.bias = float(bias)
+        self.info = info or {}
+
+    def fit(self, matrix, labels, epochs=EPOCHS, seed=0):
+        """SGD بدفعات صغيرة مع خطوة Adagrad لكل سمة (السمات النادرة تتعلم أسرع)."""
+        rng = np.random.default_rng(seed)
+        labels = np.asarray(labels, dtype=np.float32)
+        weights = np.zeros(matrix.shape[1], dtype=np.float32)
+        bias = 0.0
+        grad_squares = np.full(matrix.shape[1], 1e-8, dtype=np.float32)
+        bias_squares = 1e-8
+        for _ in range(epochs):
+            order = rng.permutation(matrix.shape[0])
+            for start in range(0, len(order), BATCH_SIZE):
+                rows = order[start:start + BATCH_SIZE]
+                batch = matrix[rows]
+                error = _sigmoid(batch @ weights + bias) - labels[rows]
+                gradient = (batch.T @ error) / len(rows) + L2_PENALTY * weights
+                grad_squares += gradient ** 2
+                weights -= LEARNING_RATE * gradient / np.sqrt(grad_squares)
+                bias_gradient = float(error.mean())
+                bias_squares += bias_gradient ** 2
+                bias -= LEARNING_RATE * bias_gradient / np.sqrt(bias_squares)
+        self.weights, self.bias = weights.astype(np.float32), bias
+        return self
+
+    def predict_proba(self, texts):
+        """احتمال أن تكون كل مادة 'إجرائي'."""
+        return _sigmoid(feature_matrix(texts) @ self.weights + self.bias)
+
+    def classify(self, texts):
+        """[(التصنيف، الثقة)] لكل نص."""
+        return [
+            (ASPECT_PROCEDURAL, float(p)) if p >= 0.5 else (ASPECT_SUBSTANTIVE, float(1 - p))
+            for p in self.predict_proba(texts)
+        ]
+
+    def confident_label(self, text, threshold=CONFIDENCE_THRESHOLD):
+        """التصنيف إذا بلغت ثقته الحد، وإلا None (فيُترك التصنيف لـ LLM)."""
+        label, confidence = self.classify([text])[0]
+        return label if confidence >= threshold else None
+
+    def save(self, path):
+        np.savez_compressed(path, weights=self.weights, bias=np.float32(self.bias),
+                            info=np.array(json.dumps(self.info, ensure_ascii=False)))
+
+    @classmethod
+    def load(cls, path):
+        path = Path(path)
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            if data['weights'].shape[0] != 1 << HASH_BITS:
+                print(f"  ⚠️ نموذج الجانب {path.name} بُني بعدد خانات مختلف؛ أعد تدريبه.")
+                return None
+            return cls(data['weights'], float(data['bias']), json.loads(str(data['info'])))
+
+def _numpy_available():
+    if np is None:
+        print("  ⚠️ مصنف الجانب يتطلب numpy وscipy (pip install numpy scipy).")
+        return False
+    return True
+
+def load_classifier(base_folder="processed_systems_output"):
+    """
+    تحميل المصنف المحفوظ في مجلد المخرجات، أو None إذا لم يُدرَّب بعد، أو غابت numpy/scipy،
+    أو كانت دقته المقيسة عند التدريب دون MIN_CONFIDENT_ACCURACY (فتصنيفاته "الواثقة" لا يُعتمد عليها).
+    """
+    if not _numpy_available():
+        return None
+    classifier = AspectClassifier.load(Path(base_folder) / ASPECT_MODEL_FILE)
+    if classifier is None:
+        return None
+    confident_accuracy = classifier.info.get('confident_accuracy', 0.0)
+    if confident_accuracy < MIN_CONFIDENT_ACCURACY:
+        print(f"  ⚠️ دقة نموذج الجانب فوق حد الثقة {confident_accuracy:.1%} أقل من {MIN_CONFIDENT_ACCURACY:.0%}؛ "
+              "لن يُستخدم. أعد تدريبه بعد إثراء مواد أكثر.")
+        return None
+    return classifier
+
+# --- 3. التدريب من المدونة ---
+
+def training_examples(base_folder="processed_systems_output"):
+    """
+    (النصوص، التسميات) من المواد التي صنفها LLM فعلاً: تُستبعد المواد المُعاد استخدام إثرائها
+    والمواد التي صنفها المصنف نفسه حتى لا يتعلم من مخرجاته.
+    """
+    texts, labels = [], []
+    for file_path in CorpusManifest.load(base_folder).iter_alu_paths():
+        if not file_path.exists():
+            continue
+        metadata, body, _ = parse_front_matter(file_path.read_text(encoding='utf-8'))
+        if not metadata or metadata.get('aspect') not in (ASPECT_PROCEDURAL, ASPECT_SUBSTANTIVE):
+            continue
+        if 'enrichment_source' in metadata or metadata.get('aspect_source') == LOCAL_SOURCE:
+            continue
+        texts.append(body)
+        labels.append(1 if metadata['aspect'] == ASPECT_PROCEDURAL else 0)
+    return texts, np.array(labels, dtype=np.float32)
+
+def evaluate(classifier, matrix, labels, threshold=CONFIDENCE_THRESHOLD):
+    """الدقة الكلية، ونسبة المواد فوق حد الثقة (التي لن تُرسل للـ LLM) ودقتها."""
+    probabilities = _sigmoid(matrix @ classifier.weights + classifier.bias)
+    predicted = probabilities >= 0.5
+    correct = predicted == (labels == 1)
+    confident = np.maximum(probabilities, 1 - probabilities) >= threshold
+    return {
+        'accuracy': float(correct.mean()) if len(labels) else 0.0,
+        'coverage': float(confident.mean()) if len(labels) else 0.0,
+        'confident_accuracy': float(correct[confident].mean()) if confident.any() else 0.0,
+    }
+
+def train_classifier(base_folder="processed_systems_output", seed=0):
+    """قياس الدقة على عينة محجوزة، ثم التدريب النهائي على كل المواد (None إذا غابت numpy/scipy أو أحد التصنيفين)."""
+    if not _numpy_available():
+        return None
+    texts, labels = training_examples(base_folder)
+    if len(set(labels.tolist())) < 2:
+        return None
+    matrix = feature_matrix(texts)
+    order = np.random.default_rng(seed).permutation(len(texts))
+    held_out = order[:int(len(order) * VALIDATION_RATIO)]
+    train = order[len(held_out):]
+    metrics = evaluate(AspectClassifier().fit(matrix[train], labels[train], seed=seed), matrix[held_out], labels[held_out])
+
+    classifier = AspectClassifier().fit(matrix, labels, seed=seed)
+    classifier.info = {
+        'trained_at': time.time(),
+        'samples': len(texts),
+        'procedural_ratio': float(labels.mean()),
+        'threshold': CONFIDENCE_THRESHOLD,
+        **metrics,
+    }
+    return classifier
+
+# --- 4. التشغيل المستقل (التدريب) ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="تدريب مصنف محلي لحقل aspect من المواد المُثراة.")
+    parser.add_argument("--input", default="processed_systems_output", help="مجلد المخرجات")
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        print(f"❌ لم يتم العثور على مجلد المخرجات: {args.input}")
+        exit()
+
+    if np is None:
+        print("❌ التدريب يتطلب numpy وscipy: pip install numpy scipy")
+        exit()
+
+    started = time.time()
+    classifier = train_classifier(args.input)
+    if classifier is None:
+        print("❌ لا توجد مواد مُثراة كافية بالتصنيفين للتدريب. شغّل enricher.py أولاً.")
+        exit()
+    model_path = Path(args.input) / ASPECT_MODEL_FILE
+    classifier.save(model_path)
+    info = classifier.info
+    print(f"✅ تم تدريب مصنف الجانب على {info['samples']} مادة في {time.time() - started:.1f} ث.")
+    print(f"  > الدقة على العينة المحجوزة: {info['accuracy']:.1%}")
+    print(f"  > فوق حد الثقة {info['threshold']:.2f}: {info['coverage']:.1%} من المواد بدقة {info['confident_accuracy']:.1%}"
+          " (لن يُطلب لها التصنيف من LLM)")
+    print(f"  > تم الحفظ في: {model_path}")
+    if info['confident_accuracy'] < MIN_CONFIDENT_ACCURACY:
+        print(f"  ⚠️ الدقة فوق حد الثقة أقل من {MIN_CONFIDENT_ACCURACY:.0%}: لن يستخدم enricher.py هذا النموذج حتى يُعاد تدريبه.")
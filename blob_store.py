@@ -0,0 +1,357 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import argparse
+from pathlib import Path
+
+from corpus_manifest import CorpusManifest, CORPUS_MANIFEST_FILE, _file_lock
+
+# --- ثوابت وإعدادات ---
+BLOB_STORE_FOLDER = "blob_store"     # مخزن الكائنات (داخل مجلد المخرجات)
+PACKS_FOLDER = "packs"               # الكائنات مضغوطة ومُلحقة بملفات حزم (لا ملف لكل كائن)
+OBJECTS_INDEX_FILE = "objects.sqlite"  # البصمة -> (الحزمة، الموضع، الطول)
+SNAPSHOTS_FOLDER = "snapshots"       # لقطة لكل تشغيل: {الوثيقة: بصمة شجرتها}
+STAT_INDEX_FILE = "index.json"       # (وقت التعديل، الحجم) -> البصمات، لتخطي قراءة الملفات غير المتغيرة
+WRITE_LOCK_FILE = "write.lock"       # لقطة واحدة فقط تُلحق بالحزم في كل مرة
+COMPRESSION_LEVEL = 6
+PACK_MAX_BYTES = 64 * 1024 * 1024    # تبدأ حزمة جديدة بعد هذا الحجم
+HEADER_OPEN = b'---\n'
+HEADER_CLOSE = b'\n---\n'
+
+# --- 1. الكائنات ---
+
+def object_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+def split_header(data):
+    """
+    فصل رأس YAML عن الجسم كبايتات خام (الاسترجاع يعيد الملف حرفياً).
+    الرأس والجسم يُخزنان منفصلين: الإثراء يغير الرأس فقط فيبقى الجسم كائناً واحداً مشتركاً.
+    """
+    if data.startswith(HEADER_OPEN):
+        end = data.find(HEADER_CLOSE, len(HEADER_OPEN) - 1)
+        if end != -1:
+            end += len(HEADER_CLOSE)
+            return data[:end], data[end:]
+    return b'', data
+
+class BlobStore:
+    """
+    مخزن كائنات بالمحتوى (على غرار كائنات git): كل رأس وكل جسم يُخزن مرة واحدة ببصمته،
+    وكل وثيقة شجرة صغيرة من البصمات، واللقطة قاموس {الوثيقة: بصمة الشجرة}.
+    لقطة المدونة لا تكلف إلا ما تغير منذ آخر لقطة.
+
+    الكائنات تُلحق بملفات حزم بدلاً من ملف مستقل لكل كائن: عشرات آلاف الملفات الصغيرة
+    تشغل على القرص أضعاف حجمها (كتلة كاملة لكل ملف).
+    """
+
+    def __init__(self, base_folder="processed_systems_output"):
+        self.base_folder = Path(base_folder)
+        self.root = self.base_folder / BLOB_STORE_FOLDER
+        self.packs = self.root / PACKS_FOLDER
+        self.snapshots = self.root / SNAPSHOTS_FOLDER
+        self.packs.mkdir(parents=True, exist_ok=True)
+        self.snapshots.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.root / OBJECTS_INDEX_FILE))
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS objects (hash TEXT PRIMARY KEY, pack INTEGER, offset INTEGER, length INTEGER)"
+        )
+        self.known = {row[0] for row in self.conn.execute("SELECT hash FROM objects")}
+        self._writer = None
+        self._writer_pack = None
+        self._readers = {}
+        self._lock_path = self.root / WRITE_LOCK_FILE
+        self.written = 0
+        self.written_bytes = 0
+
+    def close(self):
+        """إنهاء الحزمة الجارية ثم تثبيت الفهرس (الكائنات على القرص قبل الإشارة إليها)."""
+        if self._writer is not None:
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+            self._writer.close()
+            self._writer = None
+        self.conn.commit()
+        for reader in self._readers.values():
+            reader.close()
+        self._readers = {}
+        self.conn.close()
+
+    def _pack_path(self, pack):
+        return self.packs / f"pack-{pack:05d}.pack"
+
+    def _open_writer(self):
+        if self._writer is None:
+            last = self.conn.execute("SELECT MAX(pack) FROM objects").fetchone()[0]
+            pack = last or 1
+            if self._pack_path(pack).exists() and self._pack_path(pack).stat().st_size >= PACK_MAX_BYTES:
+                pack += 1
+            self._writer_pack = pack
+            self._writer = open(self._pack_path(pack), 'ab')
+        elif self._writer.tell() >= PACK_MAX_BYTES:
+            self._writer.close()
+            self._writer_pack += 1
+            self._writer = open(self._pack_path(self._writer_pack), 'ab')
+        return self._writer
+
+    def put(self, data):
+        """تخزين بايتات وإرجاع بصمتها (لا يُكتب شيء إذا كان الكائن موجوداً)."""
+        digest = object_hash(data)
+        if digest not in self.known:
+            compressed = zlib.compress(data, COMPRESSION_LEVEL)
+            writer = self._open_writer()
+            offset = writer.tell()
+            writer.write(compressed)
+            self.conn.execute(
+                "INSERT INTO objects (hash, pack, offset, length) VALUES (?, ?, ?, ?)",
+                (digest, self._writer_pack, offset, len(compressed)),
+            )
+            self.known.add(digest)
+            self.written += 1
+            self.written_bytes += len(compressed)
+        return digest
+
+    def get(self, digest):
+        row = self.conn.execute("SELECT pack, offset, length FROM objects WHERE hash = ?", (digest,)).fetchone()
+        if row is None:
+            raise KeyError(f"الكائن غير موجود في المخزن: {digest}")
+        pack, offset, length = row
+        if self._writer is not None:
+            self._writer.flush()
+        reader = self._readers.get(pack)
+        if reader is None:
+            reader = self._readers[pack] = open(self._pack_path(pack), 'rb')
+        reader.seek(offset)
+        return zlib.decompress(reader.read(length))
+
+    def put_json(self, value):
+        return self.put(json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+
+    def get_json(self, digest):
+        return json.loads(self.get(digest))
+
+    # --- اللقطات ---
+
+    def _load_stat_index(self):
+        try:
+            with open(self.root / STAT_INDEX_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save_stat_index(self, index):
+        tmp_path = self.root / (STAT_INDEX_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, self.root / STAT_INDEX_FILE)
+
+    def _store_file(self, file_path, rel_path, old_index, new_index):
+        """تخزين ملف وإرجاع [الاسم، بصمة الرأس، بصمة الجسم]؛ الملفات غير المتغيرة لا تُقرأ."""
+        stat = os.stat(file_path)
+        cached = old_index.get(rel_path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            header_hash, body_hash = cached[2], cached[3]
+        else:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            header, body = split_header(data) if file_path.suffix == '.md' else (b'', data)
+            header_hash = self.put(header) if header else None
+            body_hash = self.put(body)
+        new_index[rel_path] = [stat.st_mtime_ns, stat.st_size, header_hash, body_hash]
+        return [file_path.name, header_hash, body_hash]
+
+    def _store_document(self, doc_slug, old_index, new_index):
+        """شجرة الوثيقة: كل ملفات مجلدها (المواد، الملف الأم، البيان، السجلات) ومجلداتها الفرعية."""
+        doc_folder = self.base_folder / doc_slug
+        # تحديث وقت القفل حتى لا تعدّه لقطة أخرى متروكاً أثناء لقطة طويلة
+        os.utime(self._lock_path)
+        entries = []
+        for folder, subfolders, files in os.walk(doc_folder):
+            subfolders.sort()
+            prefix = os.path.relpath(folder, doc_folder).replace(os.sep, '/')
+            for name in sorted(files):
+                name_in_tree = name if prefix == '.' else f"{prefix}/{name}"
+                entry = self._store_file(Path(folder) / name, f"{doc_slug}/{name_in_tree}", old_index, new_index)
+                entry[0] = name_in_tree
+                entries.append(entry)
+        return self.put_json({'files': entries})
+
+    def snapshot(self, label=None):
+        """
+        أخذ لقطة لكل وثائق بيان المدونة. الملفات التي لم يتغير (وقت تعديلها، حجمها) لا تُقرأ،
+        والكائنات الموجودة لا تُكتب، فاللقطة المتكررة لا تكلف إلا مساحة ما تغير.
+        اللقطة كلها تحت قفل حصري: لقطتان متزامنتان تُلحقان بالحزمة نفسها فتتداخل مواضع كائناتهما.
+        """
+        with _file_lock(str(self._lock_path)):
+            # كائنات أضافتها لقطة أخرى منذ فتح المخزن
+            self.known = {row[0] for row in self.conn.execute("SELECT hash FROM objects")}
+            try:
+                return self._snapshot(label)
+            finally:
+                # موضع الكتابة لا يصح بعد تحرير القفل (قد تُلحق لقطة أخرى بالحزمة نفسها)
+                if self._writer is not None:
+                    self._writer.close()
+                    self._writer = None
+
+    def _snapshot(self, label):
+        old_index = self._load_stat_index()
+        new_index = {}
+        corpus_manifest = CorpusManifest.load(self.base_folder)
+        documents = {}
+        for doc_slug in corpus_manifest.doc_slugs:
+            if (self.base_folder / doc_slug).is_dir():
+                documents[doc_slug] = self._store_document(doc_slug, old_index, new_index)
+        corpus_file = self.base_folder / CORPUS_MANIFEST_FILE
+        manifest_hash = self._store_file(corpus_file, CORPUS_MANIFEST_FILE, old_index, new_index)[2] if corpus_file.exists() else None
+        # الحزمة والفهرس يُثبَّتان قبل فهرس الملفات واللقطة التي تشير إلى الكائنات
+        if self._writer is not None:
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+        self.conn.commit()
+        self._save_stat_index(new_index)
+
+        snapshot_id = time.strftime('%Y%m%d-%H%M%S')
+        while (self.snapshots / f"{snapshot_id}.json").exists():
+            snapshot_id += "-1"
+        snapshot = {
+            'id': snapshot_id,
+            'label': label,
+            'created_at': time.time(),
+            'corpus_manifest': manifest_hash,
+            'documents': documents,
+        }
+        with open(self.snapshots / f"{snapshot_id}.json", 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=1)
+        return snapshot
+
+    def list_snapshots(self):
+        snapshots = []
+        for path in self.snapshots.glob("*.json"):
+            with open(path, 'r', encoding='utf-8') as f:
+                snapshots.append(json.load(f))
+        return sorted(snapshots, key=lambda snapshot: snapshot['created_at'])
+
+    def load_snapshot(self, snapshot_id):
+        """تحميل لقطة بمعرفها أو بوسمها، أو آخر لقطة مع 'latest'."""
+        if snapshot_id == 'latest':
+            snapshots = self.list_snapshots()
+            if not snapshots:
+                raise FileNotFoundError("لا توجد لقطات بعد.")
+            return snapshots[-1]
+        path = self.snapshots / f"{snapshot_id}.json"
+        if path.exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        for snapshot in reversed(self.list_snapshots()):
+            if snapshot.get('label') == snapshot_id:
+                return snapshot
+        raise FileNotFoundError(f"لم يتم العثور على اللقطة: {snapshot_id}")
+
+    # --- الاسترجاع والمقارنة ---
+
+    def restore(self, snapshot, target_folder, only_docs=None):
+        """كتابة ملفات اللقطة في مجلد الهدف كما كانت حرفياً. يعيد عدد الملفات المكتوبة."""
+        target = Path(target_folder)
+        written = 0
+        for doc_slug, tree_hash in snapshot['documents'].items():
+            if only_docs and doc_slug not in only_docs:
+                continue
+            for name, header_hash, body_hash in self.get_json(tree_hash)['files']:
+                file_path = target / doc_slug / name
+                file_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(file_path, 'wb') as f:
+                    if header_hash:
+                        f.write(self.get(header_hash))
+                    f.write(self.get(body_hash))
+                written += 1
+        if snapshot.get('corpus_manifest') and not only_docs:
+            target.mkdir(parents=True, exist_ok=True)
+            with open(target / CORPUS_MANIFEST_FILE, 'wb') as f:
+                f.write(self.get(snapshot['corpus_manifest']))
+            written += 1
+        return written
+
+    def diff(self, old_snapshot, new_snapshot):
+        """
+        الفروق بين لقطتين. الوثائق ذات الشجرة نفسها تُتخطى بمقارنة بصمة واحدة،
+        ولا تُقرأ إلا أشجار الوثائق المتغيرة. تغير الرأس وحده (إثراء) يُميَّز عن تغير النص.
+        """
+        old_docs, new_docs = old_snapshot['documents'], new_snapshot['documents']
+        changes = {'added_documents': [], 'removed_documents': [], 'files': []}
+        for doc_slug in sorted(set(old_docs) | set(new_docs)):
+            old_tree, new_tree = old_docs.get(doc_slug), new_docs.get(doc_slug)
+            if old_tree == new_tree:
+                continue
+            if old_tree is None:
+                changes['added_documents'].append(doc_slug)
+            elif new_tree is None:
+                changes['removed_documents'].append(doc_slug)
+            old_files = {e[0]: e for e in self.get_json(old_tree)['files']} if old_tree else {}
+            new_files = {e[0]: e for e in self.get_json(new_tree)['files']} if new_tree else {}
+            for name in sorted(set(old_files) | set(new_files)):
+                old_entry, new_entry = old_files.get(name), new_files.get(name)
+                if old_entry == new_entry:
+                    continue
+                if old_entry is None:
+                    change = 'added'
+                elif new_entry is None:
+                    change = 'removed'
+                elif old_entry[2] == new_entry[2]:
+                    change = 'header_changed'
+                else:
+                    change = 'body_changed'
+                changes['files'].append({'doc': doc_slug, 'file': name, 'change': change})
+        return changes
+
+    def size_on_disk(self):
+        return sum(f.stat().st_size for f in self.packs.glob('*.pack'))
+
+# --- 2. التشغيل ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="مخزن كائنات بالمحتوى: لقطات للمدونة واسترجاعها ومقارنتها.")
+    parser.add_argument("--input", default="processed_systems_output", help="مجلد المخرجات")
+    commands = parser.add_subparsers(dest="command", required=True)
+    snapshot_parser = commands.add_parser("snapshot", help="أخذ لقطة للمدونة الحالية")
+    snapshot_parser.add_argument("--label", default=None, help="وسم اختياري للقطة (مثل نسخة التسليم)")
+    commands.add_parser("list", help="عرض اللقطات")
+    diff_parser = commands.add_parser("diff", help="مقارنة لقطتين")
+    diff_parser.add_argument("old")
+    diff_parser.add_argument("new", nargs="?", default="latest")
+    restore_parser = commands.add_parser("restore", help="استرجاع لقطة إلى مجلد")
+    restore_parser.add_argument("snapshot")
+    restore_parser.add_argument("--target", required=True, help="مجلد الاسترجاع")
+    restore_parser.add_argument("--doc", action="append", default=None, help="استرجاع وثيقة بعينها (يمكن تكرارها)")
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        print(f"❌ لم يتم العثور على مجلد المخرجات: {args.input}")
+        exit()
+
+    store = BlobStore(args.input)
+    if args.command == "snapshot":
+        started = time.time()
+        snapshot = store.snapshot(args.label)
+        print(f"✅ اللقطة {snapshot['id']}: {len(snapshot['documents'])} وثيقة في {time.time() - started:.2f} ث.")
+        print(f"  > كائنات جديدة: {store.written} ({store.written_bytes / 1024:.1f} KB) | حجم المخزن: {store.size_on_disk() / 1024:.1f} KB")
+
+    elif args.command == "list":
+        for snapshot in store.list_snapshots():
+            created = time.strftime('%Y-%m-%d %H:%M', time.localtime(snapshot['created_at']))
+            label = f" [{snapshot['label']}]" if snapshot.get('label') else ""
+            print(f"  - {snapshot['id']}{label}: {len(snapshot['documents'])} وثيقة ({created})")
+
+    elif args.command == "diff":
+        changes = store.diff(store.load_snapshot(args.old), store.load_snapshot(args.new))
+        print(f"✅ الفروق: {len(changes['files'])} ملف، وثائق مضافة {len(changes['added_documents'])}، محذوفة {len(changes['removed_documents'])}.")
+        for item in changes['files']:
+            print(f"  - {item['change']}: {item['doc']}/{item['file']}")
+
+    elif args.command == "restore":
+        snapshot = store.load_snapshot(args.snapshot)
+        count = store.restore(snapshot, args.target, args.doc)
+        print(f"✅ تم استرجاع {count} ملف من اللقطة {snapshot['id']} إلى {args.target}.")
+
+    store.close()
@@ -0,0 +1,263 @@
+import json
+import time
+import sqlite3
+import hashlib
+from pathlib import Path
+
+# --- ثوابت وإعدادات ---
+BUILD_STATE_FILE = "build_state.sqlite"   # قاعدة حالة البناء داخل مجلد المخرجات
+UNKNOWN_SOURCE_PREFIX = "doc:"            # مفتاح سجل وثيقة لا يُعرف ملفها المصدر (مخرجات أقدم من بيان المدونة)
+
+STAGE_SPLIT = 'split'
+STAGE_ENRICH = 'enrich'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    source_path       TEXT PRIMARY KEY,
+    doc_slug          TEXT,
+    source_mtime_ns   INTEGER,
+    source_size       INTEGER,
+    source_hash       TEXT,
+    splitter_version  TEXT,
+    split_at          REAL,
+    alu_hashes        TEXT,     -- JSON: {alu_id: hash} كما أنتجها المقسِّم
+    prompt_version    TEXT,
+    model             TEXT,
+    enriched_at       REAL,
+    enriched_hashes   TEXT      -- JSON: {alu_id: hash} التي تم إثراؤها فعلاً
+);
+CREATE INDEX IF NOT EXISTS idx_documents_slug ON documents (doc_slug);
+"""
+COLUMNS = [
+    'source_path', 'doc_slug', 'source_mtime_ns', 'source_size', 'source_hash', 'splitter_version',
+    'split_at', 'alu_hashes', 'prompt_version', 'model', 'enriched_at', 'enriched_hashes',
+]
+
+def file_hash(path):
+    """تجزئة SHA-1 لمحتوى ملف."""
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def text_hash(text):
+    """تجزئة SHA-1 لنص (تُستخدم لأجسام ملفات ALU)."""
+    return hashlib.sha1(text.strip().encode('utf-8')).hexdigest()
+
+class BuildState:
+    """
+    قاعدة حالة البناء: تسجل لكل وثيقة بصمة المصدر ونسخة المقسِّم وبصمات ALU
+    ونسخة الطلب والموديل، لتحديد أزواج (الوثيقة، المرحلة) المتقادمة فقط.
+    """
+
+    def __init__(self, output_folder="processed_systems_output"):
+        Path(output_folder).mkdir(parents=True, exist_ok=True)
+        self.output_folder = Path(output_folder)
+        # مهلة انتظار أطول للقفل: عدة عمال إثراء قد يكتبون في القاعدة نفسها (انظر lease_queue.py)
+        self.conn = sqlite3.connect(str(self.output_folder / BUILD_STATE_FILE), timeout=30.0)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        # تحميل كل الصفوف مرة واحدة: التشغيل الخالي من التغييرات لا يحتاج إلا مقارنات في الذاكرة
+        self.rows = {row['source_path']: dict(row) for row in self.conn.execute("SELECT * FROM documents")}
+        self.by_slug = {row['doc_slug']: row for row in self.rows.values() if row['doc_slug']}
+
+    def close(self):
+        self.conn.close()
+
+    # --- مرحلة التقسيم ---
+
+    def is_split_stale(self, source_path, splitter_version):
+        """
+        هل تحتاج الوثيقة إلى إعادة التقسيم؟
+        الفحص بالترتيب الأرخص أولاً: السجل، النسخة، المجلد، (وقت التعديل، الحجم)، ثم بصمة المحتوى.
+        """
+        row = self.rows.get(str(source_path))
+        if row is None or row['splitter_version'] != splitter_version:
+            return True
+        if not (self.output_folder / row['doc_slug']).is_dir():
+            return True
+
+        stat = Path(source_path).stat()
+        if (stat.st_mtime_ns, stat.st_size) == (row['source_mtime_ns'], row['source_size']):
+            return False
+
+        # تغير وقت التعديل فقط (نسخ/touch): نتحقق من المحتوى ونحدّث البصمة السريعة
+        if file_hash(source_path) == row['source_hash']:
+            row['source_mtime_ns'], row['source_size'] = stat.st_mtime_ns, stat.st_size
+            self._save(row)
+            return False
+        return True
+
+    def record_split(self, source_path, doc_slug, splitter_version, alu_hashes,
+                     preserved_enrichment=False, carried_over=None):
+        """
+        تسجيل نتيجة التقسيم. إذا حافظ المقسِّم على رؤوس YAML المُثراة (preserved_enrichment)
+        يبقى الإثراء صالحاً للمواد التي لم تتغير بصمتها فقط، وإلا تفقد كل المواد حالة الإثراء.
+        carried_over: {alu_id: البصمة السابقة} للمواد المعاد ترقيمها التي نُقل إثراؤها.
+        """
+        carried_over = carried_over or {}
+        stat = Path(source_path).stat()
+        row = self.rows.get(str(source_path)) or self.by_slug.get(doc_slug) or dict.fromkeys(COLUMNS)
+        if row['source_path'] not in (None, str(source_path)):
+            # سجل أنشأه الإثراء قبل أول تقسيم مسجل (انظر record_enrichment) يُنقل إلى مسار المصدر
+            self.conn.execute("DELETE FROM documents WHERE source_path = ?", (row['source_path'],))
+            self.rows.pop(row['source_path'], None)
+        enriched = json.loads(row.get('enriched_hashes') or '{}') if preserved_enrichment else {}
+        # المطابقة بالبصمة لا بالمعرف: المادة المعاد ترقيمها بنفس النص تحتفظ بإثرائها
+        enriched_set = set(enriched.values())
+        enriched = {
+            alu_id: h for alu_id, h in alu_hashes.items()
+            if h in enriched_set or carried_over.get(alu_id) in enriched_set
+        }
+
+        row.update({
+            'source_path': str(source_path),
+            'doc_slug': doc_slug,
+            'source_mtime_ns': stat.st_mtime_ns,
+            'source_size': stat.st_size,
+            'source_hash': file_hash(source_path),
+            'splitter_version': splitter_version,
+            'split_at': time.time(),
+            'alu_hashes': json.dumps(alu_hashes, ensure_ascii=False),
+            'enriched_hashes': json.dumps(enriched, ensure_ascii=False),
+        })
+        self._save(row)
+
+    def update_alu_hashes(self, doc_slug, changed):
+        """
+        تسجيل بصمات جديدة لمواد عُدّل نصها بعد التقسيم (تصحيحات OCR): changed = {alu_id: (البصمة السابقة، الجديدة)}.
+        إثراء المادة يبقى صالحاً إذا كان مسجلاً للنص السابق، فالتصحيح لا يغير معناها.
+        """
+        row = self.by_slug.get(doc_slug)
+        if row is None or not row['alu_hashes']:
+            return
+        alu_hashes = json.loads(row['alu_hashes'])
+        enriched = json.loads(row['enriched_hashes'] or '{}')
+        for alu_id, (previous_hash, new_hash) in changed.items():
+            if alu_id in alu_hashes:
+                alu_hashes[alu_id] = new_hash
+            if enriched.get(alu_id) == previous_hash:
+                enriched[alu_id] = new_hash
+        row['alu_hashes'] = json.dumps(alu_hashes, ensure_ascii=False)
+        row['enriched_hashes'] = json.dumps(enriched, ensure_ascii=False)
+        self._save(row)
+
+    def remove_document(self, doc_slug):
+        """حذف سجل وثيقة حُذف ملفها المصدر."""
+        self.conn.execute("DELETE FROM documents WHERE doc_slug = ?", (doc_slug,))
+        self.conn.commit()
+        row = self.by_slug.pop(doc_slug, None)
+        if row is not None:
+            self.rows.pop(row['source_path'], None)
+
+    def refresh(self, doc_slug):
+        """إعادة قراءة سجل وثيقة من القاعدة (قد يكون عامل آخر قد حدّثه بعد تحميل الصفوف)."""
+        row = self.conn.execute("SELECT * FROM documents WHERE doc_slug = ?", (doc_slug,)).fetchone()
+        if row is not None:
+            row = dict(row)
+            self.rows[row['source_path']] = row
+            self.by_slug[doc_slug] = row
+
+    # --- مرحلة الإثراء ---
+
+    def _document_row(self, doc_slug, alu_hashes, source_path=None):
+        """سجل الوثيقة، أو سجل جديد لوثيقة لم يسجل المقسِّم تقسيمها (بصمات موادها من المستدعي)."""
+        row = self.by_slug.get(doc_slug)
+        if row is None:
+            row = dict.fromkeys(COLUMNS)
+            row['source_path'] = str(source_path) if source_path else f"{UNKNOWN_SOURCE_PREFIX}{doc_slug}"
+            row['doc_slug'] = doc_slug
+        if not row['alu_hashes'] and alu_hashes:
+            row['alu_hashes'] = json.dumps(alu_hashes, ensure_ascii=False)
+        return row
+
+    def needs_seeding(self, doc_slug):
+        """وثيقة لم يُسجل لها إثراء قط (لا سجل أو لا نسخة طلب): قد تكون موادها مُثراة قبل وجود حالة البناء."""
+        row = self.by_slug.get(doc_slug)
+        return row is None or row['prompt_version'] is None
+
+    def seed_enrichment(self, doc_slug, prompt_version, model, alu_hashes, enriched_hashes, source_path=None):
+        """
+        تسجيل الإثراء الموجود فعلاً في رؤوس المواد لوثيقة لم يُسجل لها إثراء (needs_seeding):
+        enriched_hashes = {alu_id: البصمة} للمواد التي تحمل ملخص LLM (غير مؤقت)، فلا يُعاد إثراؤها.
+        """
+        if not self.needs_seeding(doc_slug):
+            return
+        row = self._document_row(doc_slug, alu_hashes, source_path)
+        row.update({
+            'prompt_version': prompt_version,
+            'model': model,
+            'enriched_at': time.time(),
+            'enriched_hashes': json.dumps(enriched_hashes, ensure_ascii=False),
+        })
+        self._save(row)
+
+    def stale_alus(self, doc_slug, prompt_version, model):
+        """
+        إرجاع مجموعة معرفات ALU التي تحتاج إلى إثراء في الوثيقة،
+        أو None إذا لم تكن للوثيقة حالة مسجلة (يُعامل كل شيء كمتقادم حتى يُنشئ record_enrichment سجلها).
+        """
+        row = self.by_slug.get(doc_slug)
+        if row is None or not row['alu_hashes']:
+            return None
+        alu_hashes = json.loads(row['alu_hashes'])
+        if row['prompt_version'] != prompt_version or row['model'] != model:
+            return set(alu_hashes)
+        enriched = json.loads(row['enriched_hashes'] or '{}')
+        return {alu_id for alu_id, h in alu_hashes.items() if enriched.get(alu_id) != h}
+
+    def is_enrich_stale(self, doc_slug, prompt_version, model):
+        stale = self.stale_alus(doc_slug, prompt_version, model)
+        return stale is None or bool(stale)
+
+    def record_enrichment(self, doc_slug, prompt_version, model, enriched_hashes, alu_hashes=None, source_path=None):
+        """
+        تسجيل المواد التي تم إثراؤها بنجاح (تُدمج مع ما سبق إثراؤه).
+        الوثيقة التي لا سجل لها يُنشأ سجلها ببصمات موادها (alu_hashes)، وإلا بقيت متقادمة كلها في كل تشغيل.
+        """
+        row = self._document_row(doc_slug, alu_hashes, source_path)
+        if row['prompt_version'] != prompt_version or row['model'] != model:
+            merged = {}
+        else:
+            merged = json.loads(row['enriched_hashes'] or '{}')
+        merged.update(enriched_hashes)
+        row.update({
+            'prompt_version': prompt_version,
+            'model': model,
+            'enriched_at': time.time(),
+            'enriched_hashes': json.dumps(merged, ensure_ascii=False),
+        })
+        self._save(row)
+
+    def _save(self, row):
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO documents ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+            [row.get(c) for c in COLUMNS],
+        )
+        self.conn.commit()
+        self.rows[row['source_path']] = row
+        self.by_slug[row['doc_slug']] = row
+
+def read_manifest_alus(doc_folder, doc_slug):
+    """قراءة مدخلات ALU (المعرف، الملف، البصمة، الحالة) من ملف البيان الذي يكتبه المقسِّم."""
+    manifest_path = Path(doc_folder) / f"{doc_slug}.manifest.json"
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    return [alu for entry in manifest for alu in entry.get('alus', [])]
+
+# --- التشغيل المستقل (عرض الأزواج المتقادمة) ---
+if __name__ == "__main__":
+    from splitter import SPLITTER_VERSION
+    from enricher import PROMPT_VERSION, MODEL_NAME
+
+    state = BuildState()
+    stale = []
+    for source_path in sorted(Path("source_files").glob("*.md")):
+        if state.is_split_stale(source_path, SPLITTER_VERSION):
+            stale.append((source_path.name, STAGE_SPLIT))
+    for doc_slug in sorted(state.by_slug):
+        if state.is_enrich_stale(doc_slug, PROMPT_VERSION, MODEL_NAME):
+            stale.append((doc_slug, STAGE_ENRICH))
+    state.close()
+
+    print(f"✅ عدد الأزواج المتقادمة (الوثيقة، المرحلة): {len(stale)}")
+    for name, stage in stale:
+        print(f"  - {stage}: {name}")
@@ -0,0 +1,225 @@
+import os
+import re
+import json
+import time
+import argparse
+from pathlib import Path
+
+from arabic_text import ALU_ANCHOR_PATTERN
+from corpus_manifest import CorpusManifest
+from integrity_check import parse_front_matter
+from corpus import summary_text
+
+# --- ثوابت وإعدادات ---
+CHUNKS_FILE = "corpus_chunks.jsonl"      # الملف الافتراضي للتصدير (بجوار مجلد المخرجات)
+MAX_CHUNK_TOKENS = 512                   # نافذة نموذج التضمين: المواد الأطول تُقسم
+MIN_CHUNK_TOKENS = 64                    # المواد الأقصر تُدمج مع ما يليها من مواد قصيرة في الوثيقة نفسها
+OVERLAP_TOKENS = 64                      # تداخل بين أجزاء المادة المقسمة حتى لا ينقطع السياق عند الحد
+
+# تقدير التوكنات محلياً دون استدعاء count_tokens: الكلمة العربية ≈ توكن لكل CHARS_PER_TOKEN حرفاً،
+# وكل علامة ترقيم توكن مستقل (تقدير محافظ قليلاً لمقسمات BPE الشائعة على النص العربي)
+CHARS_PER_TOKEN = 4
+WORD_OR_MARK_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+# حدود التقسيم بالأولوية: الجمل أولاً، ثم أشباه الجمل، ثم الكلمات كحل أخير
+SENTENCE_PATTERN = re.compile(r'[^.!؟?\n]+[.!؟?\n]*')
+CLAUSE_PATTERN = re.compile(r'[^،,؛;:]+[،,؛;:]*')
+TITLE_PATTERN = re.compile(r'^#\s+(.+)$', re.MULTILINE)
+
+# --- 1. تقدير التوكنات والتقسيم ---
+
+def estimate_tokens(text):
+    return sum(1 + (len(part) - 1) // CHARS_PER_TOKEN for part in WORD_OR_MARK_PATTERN.findall(text))
+
+def _pieces(text, pattern):
+    return [piece for piece in pattern.findall(text) if piece.strip()]
+
+def split_segments(text, max_tokens):
+    """
+    تقسيم نص طويل إلى مقاطع لا يتجاوز أي منها max_tokens:
+    بحدود الجمل، ثم الجملة الطويلة بحدود أشباه الجمل (الفواصل)، ثم بالكلمات.
+    """
+    segments = []
+    for sentence in _pieces(text, SENTENCE_PATTERN):
+        if estimate_tokens(sentence) <= max_tokens:
+            segments.append(sentence)
+            continue
+        for clause in _pieces(sentence, CLAUSE_PATTERN):
+            if estimate_tokens(clause) <= max_tokens:
+                segments.append(clause)
+                continue
+            words, current = clause.split(), []
+            for word in words:
+                if current and estimate_tokens(' '.join(current + [word])) > max_tokens:
+                    segments.append(' '.join(current) + ' ')
+                    current = []
+                current.append(word)
+            if current:
+                segments.append(' '.join(current) + ' ')
+    return segments
+
+def pack_segments(segments, max_tokens, overlap_tokens):
+    """
+    تجميع المقاطع في أجزاء حتى max_tokens، ويبدأ كل جزء بآخر مقاطع الجزء السابق
+    في حدود overlap_tokens.
+    """
+    chunks, current, current_tokens = [], [], 0
+    for segment in segments:
+        tokens = estimate_tokens(segment)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(''.join(current).strip())
+            overlap, overlap_total = [], 0
+            for previous in reversed(current):
+                previous_tokens = estimate_tokens(previous)
+                if overlap_total + previous_tokens > overlap_tokens or overlap_total + previous_tokens + tokens > max_tokens:
+                    break
+                overlap.insert(0, previous)
+                overlap_total += previous_tokens
+            current, current_tokens = overlap, overlap_total
+        current.append(segment)
+        current_tokens += tokens
+    if current:
+        chunks.append(''.join(current).strip())
+    return chunks
+
+# --- 2. قراءة الوثيقة ---
+
+def document_metadata(corpus_manifest, doc_slug):
+    """بيانات الوثيقة المرفقة بكل جزء: العنوان والنوع والرقم والحالة من رأس الملف الأم."""
+    parent_path = corpus_manifest.parent_path(doc_slug)
+    metadata, body = {}, ''
+    if parent_path.exists():
+        metadata, body, _ = parse_front_matter(parent_path.read_text(encoding='utf-8'))
+        metadata = metadata or {}
+    title = TITLE_PATTERN.search(body)
+    return {
+        'doc': doc_slug,
+        'title': title.group(1).strip() if title else None,
+        'doc_type': metadata.get('النوع'),
+        'doc_number': metadata.get('الرقم'),
+        'doc_status': metadata.get('الحالة'),
+    }
+
+def iter_document_alus(corpus_manifest, doc_slug):
+    """(المعرف، الرأس، النص) لمواد الوثيقة بالترتيب، ملفاً ملفاً."""
+    for alu in corpus_manifest.alus(doc_slug):
+        file_path = corpus_manifest.base_folder / alu['file']
+        if not file_path.exists():
+            print(f"  ⚠️ ملف مادة مفقود لن يُصدَّر: {alu['file']} (شغّل integrity_check.py)")
+            continue
+        metadata, text_content, _ = parse_front_matter(file_path.read_text(encoding='utf-8'))
+        text = ALU_ANCHOR_PATTERN.sub('', text_content).strip()
+        yield alu['id'], metadata or {}, text
+
+# --- 3. بناء الأجزاء ---
+
+def _chunk(chunk_id, doc_info, alus, text, part=None, parts=None):
+    record = {
+        'id': chunk_id,
+        **doc_info,
+        'alu_ids': [alu_id for alu_id, metadata in alus],
+        'articles': [str(metadata.get('articles')) for alu_id, metadata in alus if metadata.get('articles') is not None],
+        'domain': alus[0][1].get('domain'),
+        'aspect': alus[0][1].get('aspect') if len(alus) == 1 else None,
+        'summary': '\n'.join(filter(None, (summary_text(metadata) for alu_id, metadata in alus))) or None,
+        'keywords': sorted({str(k) for alu_id, metadata in alus for k in metadata.get('keywords') or []}),
+        'tokens': estimate_tokens(text),
+        'text': text,
+    }
+    if part is not None:
+        record['part'], record['parts'] = part, parts
+    return record
+
+def iter_document_chunks(corpus_manifest, doc_slug, max_tokens=MAX_CHUNK_TOKENS,
+                         min_tokens=MIN_CHUNK_TOKENS, overlap_tokens=OVERLAP_TOKENS):
+    """
+    أجزاء وثيقة واحدة بترتيب موادها. المادة العادية جزء واحد بمعرفها، والطويلة أجزاء
+    بمعرفات '{id}#{n}' مع تداخل، والمواد القصيرة المتتالية تُدمج في جزء معرفه '{أول مادة}+{عدد الباقي}'.
+    لا يُحتفظ في الذاكرة إلا بالمواد القصيرة المعلقة.
+    """
+    doc_info = document_metadata(corpus_manifest, doc_slug)
+    pending, pending_texts, pending_tokens = [], [], 0
+
+    def flush():
+        nonlocal pending, pending_texts, pending_tokens
+        if pending:
+            chunk_id = pending[0][0] if len(pending) == 1 else f"{pending[0][0]}+{len(pending) - 1}"
+            yield _chunk(chunk_id, doc_info, pending, '\n\n'.join(pending_texts))
+        pending, pending_texts, pending_tokens = [], [], 0
+
+    for alu_id, metadata, text in iter_document_alus(corpus_manifest, doc_slug):
+        tokens = estimate_tokens(text)
+        if tokens < min_tokens:
+            if pending and pending_tokens + tokens > max_tokens:
+                yield from flush()
+            pending.append((alu_id, metadata))
+            pending_texts.append(text)
+            pending_tokens += tokens
+            continue
+
+        yield from flush()
+        if tokens <= max_tokens:
+            yield _chunk(alu_id, doc_info, [(alu_id, metadata)], text)
+            continue
+        parts = pack_segments(split_segments(text, max_tokens), max_tokens, overlap_tokens)
+        for part, part_text in enumerate(parts, 1):
+            yield _chunk(f"{alu_id}#{part}", doc_info, [(alu_id, metadata)], part_text, part, len(parts))
+    yield from flush()
+
+# --- 4. التصدير ---
+
+def export_chunks(base_folder, output_path, doc_slugs=None, max_tokens=MAX_CHUNK_TOKENS,
+                  min_tokens=MIN_CHUNK_TOKENS, overlap_tokens=OVERLAP_TOKENS):
+    """
+    كتابة الأجزاء سطراً سطراً (JSONL) إلى ملف مؤقت ثم استبداله: الذاكرة ثابتة مهما كبرت المدونة.
+    يعيد إحصاءات التصدير.
+    """
+    corpus_manifest = CorpusManifest.load(base_folder)
+    output_path = Path(output_path)
+    tmp_path = output_path.with_name(output_path.name + '.tmp')
+    stats = {'documents': 0, 'chunks': 0, 'split': 0, 'merged': 0, 'tokens': 0, 'max_tokens': 0}
+
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as out:
+            for doc_slug in doc_slugs or corpus_manifest.doc_slugs:
+                if doc_slug not in corpus_manifest:
+                    print(f"  ⚠️ وثيقة غير موجودة في بيان المدونة: {doc_slug}")
+                    continue
+                stats['documents'] += 1
+                for chunk in iter_document_chunks(corpus_manifest, doc_slug, max_tokens, min_tokens, overlap_tokens):
+                    out.write(json.dumps(chunk, ensure_ascii=False) + '\n')
+                    stats['chunks'] += 1
+                    stats['split'] += 'part' in chunk
+                    stats['merged'] += len(chunk['alu_ids']) > 1
+                    stats['tokens'] += chunk['tokens']
+                    stats['max_tokens'] = max(stats['max_tokens'], chunk['tokens'])
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_path, output_path)
+    return stats
+
+# --- 5. التشغيل ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="تقسيم المواد إلى أجزاء بحجم نافذة التضمين وتصديرها JSONL للاسترجاع (RAG).")
+    parser.add_argument("--input", default="processed_systems_output", help="مجلد المخرجات")
+    parser.add_argument("--output", default=CHUNKS_FILE, help="مسار ملف JSONL")
+    parser.add_argument("--doc", action="append", default=None, help="تصدير وثيقة محددة فقط (يمكن تكراره)")
+    parser.add_argument("--max-tokens", type=int, default=MAX_CHUNK_TOKENS, help="أقصى توكنات للجزء")
+    parser.add_argument("--min-tokens", type=int, default=MIN_CHUNK_TOKENS, help="المواد الأقصر من هذا تُدمج")
+    parser.add_argument("--overlap", type=int, default=OVERLAP_TOKENS, help="توكنات التداخل بين أجزاء المادة المقسمة")
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        print(f"❌ لم يتم العثور على مجلد المخرجات: {args.input}")
+        exit()
+    if args.overlap >= args.max_tokens:
+        print("❌ يجب أن يكون التداخل أصغر من أقصى توكنات للجزء.")
+        exit()
+
+    started = time.time()
+    stats = export_chunks(args.input, args.output, args.doc, args.max_tokens, args.min_tokens, args.overlap)
+    average = stats['tokens'] / stats['chunks'] if stats['chunks'] else 0
+    print(f"✅ تم تصدير {stats['chunks']} جزء من {stats['documents']} وثيقة إلى {args.output} في {time.time() - started:.1f} ث.")
+    print(f"  > أجزاء من مواد مقسمة: {stats['split']} | أجزاء مدمجة: {stats['merged']}")
+    print(f"  > متوسط التوكنات (تقديري): {average:.0f} | الأقصى: {stats['max_tokens']}")
@@ -0,0 +1,288 @@
+import os
+import sys
+import json
+from pathlib import Path
+
+import yaml
+
+from splitter import load_yaml_and_content
+from corpus_manifest import CorpusManifest
+
+# --- ثوابت وإعدادات ---
+# المحلل المكتوب بلغة C أسرع بكثير عند قراءة مئات آلاف الرؤوس (إن كان متوفراً في libyaml)
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+HEADER_DELIMITER = '---'
+HEADER_CACHE_FILE = "corpus_headers.json"    # رؤوس محللة مخزنة بين التشغيلات (داخل مجلد المخرجات)
+# قيم متكررة في آلاف الرؤوس تُخزن نسخة واحدة منها فقط (sys.intern) لتقليل الذاكرة
+INTERNED_FIELDS = ('doc', 'type', 'domain', 'status', 'aspect', 'prev', 'next')
+# العبارة التي كانت update_alu_file تكتبها عند غياب الملخص؛ ما زالت في رؤوس مواد قديمة ولا تُعد ملخصاً
+LEGACY_SUMMARY_PLACEHOLDER = 'تم تحديث الملخص بواسطة LLM.'
+
+# --- 1. قراءة الرؤوس فقط ---
+
+def read_header(file_path):
+    """قراءة رأس YAML لملف ALU دون قراءة الجسم (يتوقف عند سطر الإغلاق '---')."""
+    lines = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        if f.readline().rstrip('\n') != HEADER_DELIMITER:
+            return {}
+        for line in f:
+            if line.rstrip('\n') == HEADER_DELIMITER:
+                break
+            lines.append(line)
+        else:
+            return {}
+    try:
+        metadata = yaml.load(''.join(lines), Loader=YAML_LOADER) or {}
+    except yaml.YAMLError:
+        return {}
+    return _intern_fields(metadata)
+
+def summary_text(metadata):
+    """ملخص المادة من رأسها بمسافات مطبَّعة، أو None إذا غاب أو كان العبارة المؤقتة القديمة."""
+    summary = ' '.join(str((metadata or {}).get('summary') or '').split())
+    return summary if summary and summary != LEGACY_SUMMARY_PLACEHOLDER else None
+
+def _intern_fields(metadata):
+    for field in INTERNED_FIELDS:
+        if isinstance(metadata.get(field), str):
+            metadata[field] = sys.intern(metadata[field])
+    return metadata
+
+# --- 2. السجلات ---
+
+class ALURecord:
+    """سجل مادة خفيف: الموقع من البيان، والرأس يُحلل عند أول طلب ويُعاد استخدامه."""
+    __slots__ = ('corpus', 'id', 'doc', 'file_path', 'position', 'hash', '_metadata')
+
+    def __init__(self, corpus, alu_id, doc, file_path, position, content_hash):
+        self.corpus = corpus
+        self.id = alu_id
+        self.doc = doc
+        self.file_path = file_path
+        self.position = position
+        self.hash = content_hash
+        self._metadata = None
+
+    def __repr__(self):
+        return f"ALURecord({self.id!r})"
+
+    @property
+    def metadata(self):
+        """رأس YAML (يُقرأ مرة واحدة ثم يُحفظ في السجل، ومن ذاكرة الرؤوس المحفوظة إن لم يتغير الملف)."""
+        if self._metadata is None:
+            self._metadata = self.corpus._cached_header(self.file_path)
+        return self._metadata
+
+    @property
+    def text(self):
+        """نص المادة (يُقرأ من القرص في كل مرة، ولا يُخزن حتى تبقى الذاكرة محدودة)."""
+        metadata, text_content = load_yaml_and_content(self.file_path)
+        if self._metadata is None:
+            self._metadata = metadata
+        return text_content.strip()
+
+    def reload(self):
+        """إسقاط الرأس المحفوظ بعد تعديل الملف."""
+        self._metadata = None
+
+    @property
+    def document(self):
+        return self.corpus.document(self.doc)
+
+    @property
+    def prev(self):
+        return self.document.alu_at(self.position - 1)
+
+    @property
+    def next(self):
+        return self.document.alu_at(self.position + 1)
+
+class DocumentRecord:
+    """سجل وثيقة: مجلدها وترتيب موادها كما في البيان."""
+    __slots__ = ('corpus', 'slug', 'folder', 'parent_file', 'alu_ids', 'manifest_path')
+
+    def __init__(self, corpus, slug, folder, parent_file, manifest_path):
+        self.corpus = corpus
+        self.slug = slug
+        self.folder = folder
+        self.parent_file = parent_file
+        self.manifest_path = manifest_path
+        self.alu_ids = []
+
+    def __repr__(self):
+        return f"DocumentRecord({self.slug!r}, alus={len(self.alu_ids)})"
+
+    def __len__(self):
+        return len(self.alu_ids)
+
+    def alu_at(self, position):
+        if 0 <= position < len(self.alu_ids):
+            return self.corpus.get(self.alu_ids[position])
+        return None
+
+    def alus(self):
+        """مولّد لمواد الوثيقة بالترتيب."""
+        for alu_id in self.alu_ids:
+            yield self.corpus.get(alu_id)
+
+    @property
+    def metadata(self):
+        return read_header(self.folder / self.parent_file)
+
+def _json_safe(value):
+    try:
+        json.dumps(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+# --- 3. المدونة ---
+
+class Corpus:
+    """
+    واجهة قراءة كسولة لمجلد المخرجات.
+    الفهرس يُبنى من بيان المدونة فقط؛ الرؤوس تُقرأ عند الحاجة والأجسام لا تُقرأ إلا عند طلب النص.
+
+    مثال:
+        corpus = Corpus("processed_systems_output")
+        for alu in corpus.filter(status='قيد التطبيق', aspect='إجرائي'):
+            print(alu.id, alu.metadata.get('summary'))
+    """
+
+    def __init__(self, base_folder="processed_systems_output", header_cache=True):
+        self.base_folder = Path(base_folder)
+        self._documents = {}
+        self._alus = {}
+        self._header_cache_enabled = header_cache
+        self._header_cache = None
+        self._header_cache_dirty = False
+        self._load_corpus_manifest(CorpusManifest.load(self.base_folder))
+        self.doc_slugs = sorted(self._documents)
+
+    def _load_corpus_manifest(self, corpus_manifest):
+        """بناء الفهرس من بيان المدونة الموحد بقراءة واحدة."""
+        base_str = str(self.base_folder)
+        for doc_slug, entry in corpus_manifest.documents.items():
+            slug = sys.intern(doc_slug)
+            folder = self.base_folder / slug
+            parent_file = Path(entry.get('parent_file') or f"{slug}.md").name
+            document = DocumentRecord(self, slug, folder, parent_file, folder / f"{slug}.manifest.json")
+            self._documents[slug] = document
+            for alu in entry.get('alus', []):
+                # المسار كنص لا ككائن Path: الفرق كبير في الذاكرة مع مئات آلاف السجلات
+                file_path = os.path.join(base_str, alu['file'])
+                record = ALURecord(self, alu['id'], slug, file_path, len(document.alu_ids), alu.get('hash'))
+                self._alus[record.id] = record
+                document.alu_ids.append(record.id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """حفظ ذاكرة الرؤوس إذا أضيفت إليها رؤوس جديدة."""
+        if self._header_cache_enabled and self._header_cache_dirty:
+            cache_path = self.base_folder / HEADER_CACHE_FILE
+            tmp_path = cache_path.with_suffix('.tmp')
+            # JSON لا pickle: الملف في مجلد مشترك، وتحميل pickle منه يعني تنفيذ ما يكتبه أي شخص فيه
+            entries = {path: [mtime_ns, size, metadata] for path, ((mtime_ns, size), metadata) in self._header_cache.items()}
+            try:
+                data = json.dumps(entries, ensure_ascii=False)
+            except (TypeError, ValueError):
+                # رؤوس بقيم لا تُمثَّل في JSON (مثل تواريخ YAML) لا تُخزن وتُحلل في كل تشغيل
+                data = json.dumps({path: entry for path, entry in entries.items() if _json_safe(entry[2])}, ensure_ascii=False)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, cache_path)
+            self._header_cache_dirty = False
+
+    def _cached_header(self, file_path):
+        """
+        تحليل YAML هو الكلفة الأكبر عند المرور على كل المواد، لذلك تُحفظ الرؤوس المحللة
+        مع (وقت التعديل، الحجم) ولا يُعاد تحليل إلا الملفات التي تغيرت.
+        """
+        if not self._header_cache_enabled:
+            return read_header(file_path)
+        if self._header_cache is None:
+            self._header_cache = {}
+            try:
+                with open(self.base_folder / HEADER_CACHE_FILE, 'r', encoding='utf-8') as f:
+                    self._header_cache = {
+                        path: ((mtime_ns, size), _intern_fields(metadata))
+                        for path, (mtime_ns, size, metadata) in json.load(f).items()
+                    }
+            except (OSError, ValueError, TypeError):
+                self._header_cache = {}
+
+        stat = os.stat(file_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self._header_cache.get(file_path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        metadata = read_header(file_path)
+        self._header_cache[file_path] = (signature, metadata)
+        self._header_cache_dirty = True
+        return metadata
+
+    def __len__(self):
+        return len(self._alus)
+
+    def __contains__(self, alu_id):
+        return alu_id in self._alus
+
+    def get(self, alu_id):
+        """سجل المادة بالمعرف (أو None)."""
+        return self._alus.get(alu_id)
+
+    def document(self, slug):
+        """سجل الوثيقة بالـ Slug (أو None)."""
+        return self._documents.get(slug)
+
+    def documents(self):
+        """مولّد للوثائق بترتيب الـ Slug."""
+        for slug in self.doc_slugs:
+            yield self._documents[slug]
+
+    def alus(self, doc=None):
+        """مولّد للمواد (كلها أو مواد وثيقة واحدة) بترتيب الوثائق ثم البيان."""
+        documents = [self._documents[doc]] if doc is not None else self.documents()
+        for document in documents:
+            yield from document.alus()
+
+    def filter(self, predicate=None, doc=None, **criteria):
+        """
+        مولّد للمواد المطابقة لشروط على حقول الرأس فقط (دون قراءة الأجسام).
+        قيمة الشرط إما قيمة للمقارنة المباشرة أو دالة تُستدعى على قيمة الحقل.
+        """
+        for record in self.alus(doc):
+            metadata = record.metadata
+            if predicate is not None and not predicate(metadata):
+                continue
+            if all(
+                value(metadata.get(field)) if callable(value) else metadata.get(field) == value
+                for field, value in criteria.items()
+            ):
+                yield record
+
+# --- 4. التشغيل المستقل (ملخص المدونة) ---
+if __name__ == "__main__":
+    import time
+    from collections import Counter
+
+    base_folder = sys.argv[1] if len(sys.argv) > 1 else "processed_systems_output"
+    if not Path(base_folder).exists():
+        print(f"❌ لم يتم العثور على مجلد المخرجات: {base_folder}")
+        exit()
+
+    started = time.time()
+    with Corpus(base_folder) as corpus:
+        print(f"✅ الفهرس: {len(corpus.doc_slugs)} وثيقة، {len(corpus)} مادة ({time.time() - started:.2f} ث).")
+
+        started = time.time()
+        aspects = Counter(alu.metadata.get('aspect', 'غير مُثرى') for alu in corpus.alus())
+        print(f"  > قراءة كل الرؤوس: {time.time() - started:.2f} ث")
+    for aspect, count in aspects.most_common():
+        print(f"  - {aspect}: {count}")
@@ -0,0 +1,244 @@
+import os
+import json
+import time
+from pathlib import Path
+from contextlib import contextmanager
+
+# --- ثوابت وإعدادات ---
+CORPUS_MANIFEST_FILE = "corpus_manifest.json"   # بيان المدونة الموحد (داخل مجلد المخرجات)
+CORPUS_MANIFEST_VERSION = 1
+LOCK_SUFFIX = ".lock"
+LOCK_TIMEOUT = 30.0       # القفل الأقدم من هذا يُعتبر متروكاً (عملية متوقفة) ويُستعاد
+
+STAGE_SPLIT = 'split'
+STAGE_ENRICH = 'enrich'
+STAGE_SUMMARY = 'summary'
+
+# --- 1. قفل الكتابة ---
+
+@contextmanager
+def _file_lock(lock_path, timeout=LOCK_TIMEOUT):
+    """
+    قفل بسيط بملف يُنشأ حصرياً (يعمل على كل الأنظمة وعلى الأقراص المشتركة):
+    المقسِّم وعمال الإثراء قد يحدّثون البيان في الوقت نفسه.
+    """
+    deadline = time.time() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > timeout:
+                    os.remove(lock_path)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.time() > deadline:
+                raise TimeoutError(f"تعذر الحصول على قفل بيان المدونة: {lock_path}")
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+
+# --- 2. مدخلات البيان ---
+
+def document_entry(manifest_data, source_path=None, splitter_version=None):
+    """
+    تحويل بيان وثيقة واحدة (كما يكتبه المقسِّم) إلى مدخل في بيان المدونة.
+    مسارات الملفات نسبية إلى مجلد المخرجات.
+    """
+    doc_slug = manifest_data['doc']
+    return {
+        'source': str(source_path) if source_path else None,
+        'parent_file': f"{doc_slug}/{manifest_data.get('parent_file', f'{doc_slug}.md')}",
+        'alus': [
+            {'id': alu['id'], 'file': f"{doc_slug}/{alu['file']}", 'hash': alu.get('hash')}
+            for alu in manifest_data.get('alus', [])
+        ],
+        'stages': {STAGE_SPLIT: {'at': time.time(), 'version': splitter_version}},
+    }
+
+# --- 3. بيان المدونة ---
+
+class CorpusManifest:
+    """
+    بيان واحد لكل المدونة: الوثائق، معرفات موادها بالترتيب، مواقع الملفات، البصمات، وحالة كل مرحلة.
+    يحدّثه المقسِّم تدريجياً (وثيقة بوثيقة)، وتكتشف منه كل الأدوات عملها بقراءة واحدة
+    بدلاً من سرد المجلدات وتحليل كل ملف (وهو بطيء على أنظمة الملفات الشبكية).
+
+    التعديلات تُجمع في الذاكرة ثم تُدمج عند الحفظ مع النسخة الموجودة على القرص تحت قفل،
+    فلا تضيع تحديثات عملية أخرى حفظت البيان في الأثناء.
+    """
+
+    def __init__(self, base_folder="processed_systems_output", documents=None):
+        self.base_folder = Path(base_folder)
+        self.path = self.base_folder / CORPUS_MANIFEST_FILE
+        self.documents = documents or {}
+        self._dirty = {}            # {slug: {'entry': مدخل كامل أو None, 'stages': {...}}}
+        self._disk_signature = None
+
+    @classmethod
+    def load(cls, base_folder="processed_systems_output"):
+        """تحميل البيان، أو بناؤه مرة واحدة من بيانات الوثائق إذا لم يكن موجوداً (مخرجات أقدم)."""
+        manifest = cls(base_folder)
+        if manifest.path.exists():
+            manifest._read()
+        elif manifest.base_folder.is_dir():
+            manifest.rebuild()
+            manifest.save()
+        return manifest
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _read(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.documents = data.get('documents', {})
+        self._disk_signature = self._signature()
+
+    def rebuild(self):
+        """إعادة البناء من ملفات {slug}.manifest.json في مجلدات الوثائق (مسار الترحيل الوحيد الذي يسرد المجلدات)."""
+        self.documents = {}
+        for manifest_path in sorted(self.base_folder.glob("*/*.manifest.json")):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            for manifest_data in entries:
+                manifest_data.setdefault('doc', manifest_path.parent.name)
+                self.set_document(manifest_data['doc'], document_entry(manifest_data))
+
+    # --- التعديل ---
+
+    def set_document(self, doc_slug, entry):
+        """إضافة وثيقة أو استبدال مدخلها (بعد تقسيمها) مع الحفاظ على حالة المراحل الأخرى."""
+        previous = self.documents.get(doc_slug) or {}
+        new_stages = entry.get('stages') or {}
+        entry = dict(entry, stages={**(previous.get('stages') or {}), **new_stages})
+        if entry.get('source') is None:
+            entry['source'] = previous.get('source')
+        self.documents[doc_slug] = entry
+        change = self._dirty.setdefault(doc_slug, {'entry': None, 'stages': {}})
+        change['entry'] = entry
+        change.pop('removed', None)
+        change['stages'].update(new_stages)
+
+    def remove_document(self, doc_slug):
+        """حذف وثيقة من البيان (حُذف ملفها المصدر)؛ يُطبق الحذف فوق نسخة القرص عند الحفظ كبقية التعديلات."""
+        if self.documents.pop(doc_slug, None) is None:
+            return False
+        self._dirty[doc_slug] = {'entry': None, 'stages': {}, 'removed': True}
+        return True
+
+    def update_alu_hashes(self, doc_slug, hashes):
+        """تحديث بصمات مواد وثيقة بعد تعديل نصوصها خارج المقسِّم (مثل تطبيق تصحيحات OCR): {alu_id: البصمة}."""
+        entry = self.documents.get(doc_slug)
+        if entry is None:
+            return
+        entry['alus'] = [dict(alu, hash=hashes[alu['id']]) if alu['id'] in hashes else alu for alu in entry.get('alus', [])]
+        self._dirty.setdefault(doc_slug, {'entry': None, 'stages': {}})['entry'] = entry
+
+    def set_stage(self, doc_slug, stage, **status):
+        """تسجيل حالة مرحلة لوثيقة (مثل الإثراء: الوقت، عدد المواد المُثراة)."""
+        entry = self.documents.get(doc_slug)
+        if entry is None:
+            return
+        status['at'] = time.time()
+        entry.setdefault('stages', {})[stage] = status
+        self._dirty.setdefault(doc_slug, {'entry': None, 'stages': {}})['stages'][stage] = status
+
+    def save(self):
+        """حفظ ذري مع دمج التعديلات المعلقة فوق أحدث نسخة على القرص."""
+        self.base_folder.mkdir(parents=True, exist_ok=True)
+        with _file_lock(str(self.path) + LOCK_SUFFIX):
+            if self._signature() not in (None, self._disk_signature):
+                # عملية أخرى حفظت البيان بعد قراءتنا له: نعيد القراءة ونطبق تعديلاتنا فوقه
+                self._read()
+                for doc_slug, change in self._dirty.items():
+                    if change.get('removed'):
+                        self.documents.pop(doc_slug, None)
+                        continue
+                    if change['entry'] is not None:
+                        disk_stages = (self.documents.get(doc_slug) or {}).get('stages') or {}
+                        self.documents[doc_slug] = dict(change['entry'], stages=dict(disk_stages))
+                    entry = self.documents.get(doc_slug)
+                    if entry is not None:
+                        entry.setdefault('stages', {}).update(change['stages'])
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': CORPUS_MANIFEST_VERSION, 'documents': self.documents}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._disk_signature = self._signature()
+            self._dirty = {}
+
+    # --- القراءة ---
+
+    @property
+    def doc_slugs(self):
+        return sorted(self.documents)
+
+    def __contains__(self, doc_slug):
+        return doc_slug in self.documents
+
+    def alus(self, doc_slug):
+        """مدخلات مواد الوثيقة بترتيب المصدر: [{'id', 'file', 'hash'}]."""
+        return (self.documents.get(doc_slug) or {}).get('alus', [])
+
+    def alu_ids(self, doc_slug):
+        return [alu['id'] for alu in self.alus(doc_slug)]
+
+    def alu_paths(self, doc_slug):
+        return [self.base_folder / alu['file'] for alu in self.alus(doc_slug)]
+
+    def iter_alu_paths(self):
+        """كل ملفات ALU في المدونة بترتيب ثابت (الوثائق أبجدياً، والمواد بترتيب المصدر)."""
+        for doc_slug in self.doc_slugs:
+            yield from self.alu_paths(doc_slug)
+
+    def parent_path(self, doc_slug):
+        entry = self.documents[doc_slug]
+        return self.base_folder / entry.get('parent_file', f"{doc_slug}/{doc_slug}.md")
+
+    def source_path(self, doc_slug):
+        """مسار الملف المصدر للوثيقة كما سجله المقسِّم (أو None للمخرجات الأقدم)."""
+        source = (self.documents.get(doc_slug) or {}).get('source')
+        return Path(source) if source else None
+
+    def document_file(self, doc_slug, suffix):
+        """مسار ملف مساعد للوثيقة في مجلدها، مثل document_file(slug, '.ocr_review.json')."""
+        return self.base_folder / doc_slug / f"{doc_slug}{suffix}"
+
+    def stage(self, doc_slug, stage):
+        return ((self.documents.get(doc_slug) or {}).get('stages') or {}).get(stage)
+
+# --- 4. التشغيل المستقل (إعادة البناء وعرض الملخص) ---
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="بناء بيان المدونة الموحد أو عرض ملخصه.")
+    parser.add_argument("--input", default="processed_systems_output", help="مجلد المخرجات")
+    parser.add_argument("--rebuild", action="store_true", help="إعادة البناء من بيانات الوثائق")
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        print(f"❌ لم يتم العثور على مجلد المخرجات: {args.input}")
+        exit()
+
+    manifest = CorpusManifest.load(args.input)
+    if args.rebuild:
+        manifest.rebuild()
+        manifest.save()
+
+    total_alus = sum(len(manifest.alus(slug)) for slug in manifest.doc_slugs)
+    enriched = sum(1 for slug in manifest.doc_slugs if manifest.stage(slug, STAGE_ENRICH))
+    print(f"✅ بيان المدونة: {len(manifest.doc_slugs)} وثيقة، {total_alus} مادة ({manifest.path}).")
+    print(f"  > وثائق لها حالة إثراء مسجلة: {enriched}")
@@ -0,0 +1,287 @@
+import re
+import json
+from array import array
+from pathlib import Path
+from collections import defaultdict
+
+from arabic_text import normalize_arabic, strip_alu_markup
+from splitter import load_yaml_and_content, create_yaml_header
+from corpus_manifest import CorpusManifest
+
+# --- ثوابت وإعدادات ---
+CITATION_INDEX_FILE = "citation_index.json"   # فهرس الاستشهادات على مستوى المدونة (داخل مجلد المخرجات)
+MAX_LAW_NAME_WORDS = 6                        # أقصى عدد كلمات يُقرأ بعد "نظام/قانون" لمطابقة العنوان
+# المعدودات بعد التطبيع: "المادة 4 و 30 يوماً" إحالة إلى المادة 4 وحدها، فالعدد المتبوع بمعدود ليس رقم مادة
+COUNTED_NOUNS = (
+    'يوم', 'يوما', 'ايام', 'اسبوع', 'اسبوعا', 'اسابيع', 'شهر', 'شهرا', 'اشهر', 'شهور',
+    'سنه', 'سنوات', 'سنين', 'عام', 'عاما', 'اعوام', 'ساعه', 'ساعات', 'دقيقه', 'دقايق',
+    'ريال', 'ريالا', 'ريالات', 'درهم', 'دينار', 'جنيه', 'بالمايه', 'في المايه',
+)
+
+# --- 1. الأعداد الترتيبية (بعد التطبيع: ة→ه، أ→ا، ى→ي) ---
+
+_UNITS = {
+    'الاولي': 1, 'الحاديه': 1, 'الثانيه': 2, 'الثالثه': 3, 'الرابعه': 4, 'الخامسه': 5,
+    'السادسه': 6, 'السابعه': 7, 'الثامنه': 8, 'التاسعه': 9,
+}
+_TENS = {
+    'العشرون': 20, 'العشرين': 20, 'الثلاثون': 30, 'الثلاثين': 30, 'الاربعون': 40, 'الاربعين': 40,
+    'الخمسون': 50, 'الخمسين': 50, 'الستون': 60, 'الستين': 60, 'السبعون': 70, 'السبعين': 70,
+    'الثمانون': 80, 'الثمانين': 80, 'التسعون': 90, 'التسعين': 90,
+}
+
+def _build_ordinals():
+    """توليد صيغ الأعداد الترتيبية المؤنثة من 1 إلى 99 إضافة إلى المائة."""
+    ordinals = {word: value for word, value in _UNITS.items() if word != 'الحاديه'}
+    ordinals['العاشره'] = 10
+    for word, value in _UNITS.items():
+        ordinals[f"{word} عشره"] = 10 + value
+        for tens_word, tens_value in _TENS.items():
+            ordinals[f"{word} و{tens_word}"] = tens_value + value
+    ordinals.update(_TENS)
+    ordinals['المائه'] = 100
+    ordinals['الماءه'] = 100
+    return ordinals
+
+ORDINALS = _build_ordinals()
+_ORDINAL_ALTERNATION = '|'.join(sorted((re.escape(o) for o in ORDINALS), key=len, reverse=True))
+NUMBER_TOKEN = rf'(?:\d+|{_ORDINAL_ALTERNATION})'
+_COUNTED_ALTERNATION = '|'.join(sorted((re.escape(n) for n in COUNTED_NOUNS), key=len, reverse=True))
+# عدد معطوف على رقم مادة: كلمة كاملة (لا جزء من عدد أطول) غير متبوعة بمعدود
+CONTINUATION_TOKEN = rf'{NUMBER_TOKEN}(?!\w)(?!\s*(?:{_COUNTED_ALTERNATION})(?!\w))'
+
+# --- 2. الأنماط المُجمَّعة مسبقاً (تعمل على النص المُطبَّع) ---
+
+ARTICLE_REF_PATTERN = re.compile(
+    rf'(?<!\w)[وفب]?(?:ال|لل)(?:ماده|مادتين|مادتان|مواد)\s+({NUMBER_TOKEN}(?:\s+(?:و\s*)?{CONTINUATION_TOKEN})*)'
+)
+NUMBER_TOKEN_PATTERN = re.compile(NUMBER_TOKEN)
+INTERNAL_SCOPE_PATTERN = re.compile(r'\s+من\s+(?:هذا|هذه)\s')
+EXTERNAL_SCOPE_PATTERN = re.compile(r'\s+من\s+((?:نظام|قانون|لايحه|اللايحه)\s+\w+(?:\s+\w+){0,%d})' % (MAX_LAW_NAME_WORDS - 1))
+LAW_REF_PATTERN = re.compile(
+    r'(?<!\w)(?:وفقا|طبقا|استنادا)?\s*(?:لاحكام|باحكام|بموجب)\s+((?:نظام|قانون|لايحه)\s+\w+(?:\s+\w+){0,%d})' % (MAX_LAW_NAME_WORDS - 1)
+)
+CONJUNCTION_DIGIT_PATTERN = re.compile(r'(?<!\w)و(\d)')
+
+def normalize_for_references(text):
+    """تطبيع نص المادة وفصل واو العطف عن الأرقام (مثل: و(4) → و 4)."""
+    return CONJUNCTION_DIGIT_PATTERN.sub(r'و \1', normalize_arabic(strip_alu_markup(text)))
+
+def parse_numbers(group_text):
+    """تحويل مجموعة الأرقام/الأعداد الترتيبية إلى أرقام صحيحة."""
+    numbers = []
+    for token in NUMBER_TOKEN_PATTERN.findall(group_text):
+        numbers.append(int(token) if token.isdigit() else ORDINALS[token])
+    return numbers
+
+# --- 3. الاستخراج ---
+
+def extract_references(article_text):
+    """
+    استخراج الإحالات من نص مادة.
+    يعيد قائمة من: ('article', رقم المادة، اسم النظام أو None) أو ('law', اسم النظام).
+    اسم النظام None يعني "هذا النظام" (نفس الوثيقة).
+    """
+    text = normalize_for_references(article_text)
+    references = []
+
+    for match in ARTICLE_REF_PATTERN.finditer(text):
+        tail = text[match.end():match.end() + 120]
+        law_name = None
+        if not INTERNAL_SCOPE_PATTERN.match(tail):
+            external = EXTERNAL_SCOPE_PATTERN.match(tail)
+            if external:
+                law_name = external.group(1)
+        for number in parse_numbers(match.group(1)):
+            references.append(('article', number, law_name))
+
+    for match in LAW_REF_PATTERN.finditer(text):
+        references.append(('law', match.group(1)))
+    return references
+
+# --- 4. حل الإحالات إلى معرفات ---
+
+def document_title(doc_folder, doc_slug):
+    """عنوان الوثيقة من رأس الملف الأم أو أول عنوان Markdown فيه."""
+    parent_path = doc_folder / f"{doc_slug}.md"
+    if parent_path.exists():
+        metadata, content = load_yaml_and_content(parent_path)
+        for key in ('العنوان', 'title', 'الاسم'):
+            if metadata.get(key):
+                return str(metadata[key])
+        heading = re.search(r'^#\s+(.+)$', content, re.MULTILINE)
+        if heading:
+            return heading.group(1)
+    return doc_slug.split('-', 1)[-1].replace('_', ' ')
+
+class ReferenceResolver:
+    """يحل أرقام المواد وأسماء الأنظمة إلى معرفات ALU والوثائق عبر قواميس (O(1) لكل إحالة)."""
+
+    def __init__(self):
+        self.articles = {}   # (doc_slug, رقم المادة) -> alu_id
+        self.titles = {}     # العنوان المُطبَّع -> doc_slug
+
+    def add_article(self, doc_slug, article_number, alu_id):
+        try:
+            self.articles[(doc_slug, int(str(article_number).strip()))] = alu_id
+        except ValueError:
+            pass
+
+    def add_document(self, doc_slug, title):
+        self.titles.setdefault(normalize_arabic(title), doc_slug)
+
+    def resolve_law(self, law_name):
+        """مطابقة اسم النظام بأطول بادئة معروفة من العناوين."""
+        words = law_name.split()
+        for length in range(len(words), 1, -1):
+            doc_slug = self.titles.get(' '.join(words[:length]))
+            if doc_slug:
+                return doc_slug
+        return None
+
+    def resolve(self, reference, current_doc):
+        """إرجاع المعرف الهدف للإحالة (alu_id أو doc_slug) أو None إذا تعذر الحل."""
+        if reference[0] == 'law':
+            return self.resolve_law(reference[1])
+        _, number, law_name = reference
+        doc_slug = current_doc if law_name is None else self.resolve_law(law_name)
+        if doc_slug is None:
+            return None
+        return self.articles.get((doc_slug, number))
+
+# --- 5. فهرس الاستشهادات المضغوط (CSR) ---
+
+class CitationIndex:
+    """فهرس تجاور مضغوط: مصفوفات إزاحات وأهداف للاتجاهين (يستشهد بـ / مُستشهد به من)."""
+
+    def __init__(self, nodes, out_offsets, out_targets, in_offsets, in_targets):
+        self.nodes = nodes
+        self.positions = {node: i for i, node in enumerate(nodes)}
+        self.out_offsets = array('I', out_offsets)
+        self.out_targets = array('I', out_targets)
+        self.in_offsets = array('I', in_offsets)
+        self.in_targets = array('I', in_targets)
+
+    @classmethod
+    def from_edges(cls, edges):
+        nodes = sorted({node for edge in edges for node in edge})
+        positions = {node: i for i, node in enumerate(nodes)}
+        out_offsets, out_targets = _csr(((positions[s], positions[t]) for s, t in edges), len(nodes))
+        in_offsets, in_targets = _csr(((positions[t], positions[s]) for s, t in edges), len(nodes))
+        return cls(nodes, out_offsets, out_targets, in_offsets, in_targets)
+
+    def _neighbors(self, node, offsets, targets):
+        i = self.positions.get(node)
+        if i is None:
+            return []
+        return [self.nodes[j] for j in targets[offsets[i]:offsets[i + 1]]]
+
+    def cites(self, node):
+        """المواد/الوثائق التي تحيل إليها هذه المادة."""
+        return self._neighbors(node, self.out_offsets, self.out_targets)
+
+    def cited_by(self, node):
+        """المواد التي تحيل إلى هذه المادة أو الوثيقة."""
+        return self._neighbors(node, self.in_offsets, self.in_targets)
+
+    def save(self, index_path):
+        with open(index_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'nodes': self.nodes,
+                'out_offsets': self.out_offsets.tolist(), 'out_targets': self.out_targets.tolist(),
+                'in_offsets': self.in_offsets.tolist(), 'in_targets': self.in_targets.tolist(),
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, index_path):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['nodes'], data['out_offsets'], data['out_targets'], data['in_offsets'], data['in_targets'])
+
+def _csr(pairs, node_count):
+    """تحويل أزواج (مصدر، هدف) إلى إزاحات وأهداف مرتبة بعدّ تكراري خطي."""
+    pairs = list(pairs)
+    counts = [0] * (node_count + 1)
+    for source, _ in pairs:
+        counts[source + 1] += 1
+    for i in range(node_count):
+        counts[i + 1] += counts[i]
+    offsets = list(counts)
+    targets = [0] * len(pairs)
+    cursor = offsets[:-1]
+    for source, target in pairs:
+        targets[cursor[source]] = target
+        cursor[source] += 1
+    return offsets, targets
+
+# --- 6. المرحلة الكاملة على المدونة ---
+
+def build_citation_graph(base_folder="processed_systems_output"):
+    """
+    مرحلة الاستخراج: مرور أول لبناء قواميس الحل، مرور ثانٍ للاستخراج والحل،
+    ثم كتابة الروابط في رؤوس ALU (الملفات المتغيرة فقط) وحفظ الفهرس المضغوط.
+    """
+    base_path = Path(base_folder)
+    corpus_manifest = CorpusManifest.load(base_folder)
+    resolver = ReferenceResolver()
+    alu_paths = {}
+
+    # المرور الأول: العناوين وأرقام المواد (الوثائق وملفاتها من بيان المدونة)
+    for doc_slug in corpus_manifest.doc_slugs:
+        resolver.add_document(doc_slug, document_title(base_path / doc_slug, doc_slug))
+        for file_path in corpus_manifest.alu_paths(doc_slug):
+            metadata, _ = load_yaml_and_content(file_path)
+            alu_id = metadata.get('id') or file_path.stem
+            alu_paths[alu_id] = (file_path, doc_slug)
+            resolver.add_article(doc_slug, metadata.get('articles', ''), alu_id)
+
+    # المرور الثاني: الاستخراج والحل
+    outgoing = {}
+    unresolved = 0
+    for alu_id, (file_path, doc_slug) in alu_paths.items():
+        _, text_content = load_yaml_and_content(file_path)
+        targets = []
+        for reference in extract_references(text_content):
+            target = resolver.resolve(reference, doc_slug)
+            if target is None:
+                unresolved += 1
+            elif target != alu_id and target not in targets:
+                targets.append(target)
+        outgoing[alu_id] = targets
+
+    incoming = defaultdict(list)
+    edges = []
+    for source, targets in outgoing.items():
+        for target in targets:
+            incoming[target].append(source)
+            edges.append((source, target))
+
+    # كتابة الروابط في رؤوس ALU (فقط إذا تغيرت)
+    updated = 0
+    for alu_id, (file_path, _) in alu_paths.items():
+        metadata, text_content = load_yaml_and_content(file_path)
+        references = outgoing.get(alu_id, [])
+        referenced_by = sorted(incoming.get(alu_id, []))
+        if metadata.get('references', []) == references and metadata.get('referenced_by', []) == referenced_by:
+            continue
+        metadata['references'] = references
+        metadata['referenced_by'] = referenced_by
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(create_yaml_header(metadata) + text_content.strip())
+        updated += 1
+
+    index = CitationIndex.from_edges(edges)
+    index.save(base_path / CITATION_INDEX_FILE)
+    return {'alus': len(alu_paths), 'edges': len(edges), 'unresolved': unresolved, 'updated_files': updated}
+
+# --- 7. التشغيل ---
+if __name__ == "__main__":
+    base_folder = "processed_systems_output"
+    if not Path(base_folder).exists():
+        print(f"❌ لم يتم العثور على مجلد المخرجات: {base_folder}")
+        exit()
+
+    stats = build_citation_graph(base_folder)
+    print(f"✅ تم بناء شبكة الإحالات: {stats['edges']} رابط بين {stats['alus']} مادة.")
+    print(f"  > إحالات تعذر حلها: {stats['unresolved']} | ملفات محدثة: {stats['updated_files']}")
+    print(f"  > الفهرس: {Path(base_folder) / CITATION_INDEX_FILE}")
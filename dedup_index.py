@@ -0,0 +1,311 @@
+import os
+import re
+import json
+import hashlib
+from pathlib import Path
+from collections import defaultdict
+
+import yaml
+
+from arabic_text import normalize_arabic, strip_alu_markup, tokenize
+from corpus_manifest import CorpusManifest, _file_lock, LOCK_SUFFIX
+
+# --- ثوابت وإعدادات ---
+DEDUP_INDEX_FILE = "dedup_index.json"   # يُحفظ داخل مجلد المخرجات الرئيسي
+SOURCE_SIGNATURES_FILE = "source_signatures.json"  # تواقيع الوثائق المصدرية بين التشغيلات (داخل مجلد المخرجات)
+DEDUP_SIMILARITY_THRESHOLD = 0.9        # أقل تشابه (Jaccard تقديري) لإعادة استخدام الإثراء
+DOC_SIMILARITY_THRESHOLD = 0.95         # أقل تشابه لاعتبار وثيقتين مصدريتين مكررتين
+SHINGLE_SIZE = 3                        # عدد الكلمات في كل مقطع (shingle)
+NUM_PERMUTATIONS = 64                   # طول توقيع MinHash
+LSH_BANDS = 16                          # عدد الأحزمة في LSH (يجب أن يقسم NUM_PERMUTATIONS)
+ROWS_PER_BAND = NUM_PERMUTATIONS // LSH_BANDS
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+# معاملات دوال التجزئة الشاملة (a*x + b) mod p، ثابتة حتى تبقى التواقيع المحفوظة صالحة
+_PERMUTATIONS = [
+    (
+        int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), 'big') % (MERSENNE_PRIME - 1) + 1,
+        int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), 'big') % MERSENNE_PRIME,
+    )
+    for i in range(NUM_PERMUTATIONS)
+]
+
+# --- 1. البصمات (Fingerprints) ---
+
+def normalize_article_text(text):
+    """تطبيع نص المادة للمقارنة بعد حذف عنوانها ومرساتها."""
+    return normalize_arabic(strip_alu_markup(text))
+
+def exact_fingerprint(normalized_text):
+    """البصمة الدقيقة: تجزئة SHA-1 للنص المُطبَّع."""
+    return hashlib.sha1(normalized_text.encode('utf-8')).hexdigest()
+
+def shingles(normalized_text, size=SHINGLE_SIZE):
+    """إنشاء مجموعة المقاطع المتتالية من الكلمات."""
+    words = tokenize(normalized_text)
+    if len(words) < size:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def minhash_signature(shingle_set):
+    """حساب توقيع MinHash لمجموعة مقاطع."""
+    if not shingle_set:
+        return [MAX_HASH] * NUM_PERMUTATIONS
+
+    base_hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=4).digest(), 'big')
+        for s in shingle_set
+    ]
+    return [
+        min(((a * h + b) % MERSENNE_PRIME) & MAX_HASH for h in base_hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+def estimate_similarity(sig_a, sig_b):
+    """تقدير تشابه Jaccard من توقيعين."""
+    matches = sum(1 for x, y in zip(sig_a, sig_b) if x == y)
+    return matches / NUM_PERMUTATIONS
+
+def lsh_band_keys(signature):
+    """مفاتيح الأحزمة المستخدمة في فهرس LSH."""
+    return [
+        f"{band}:" + '.'.join(str(v) for v in signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])
+        for band in range(LSH_BANDS)
+    ]
+
+# --- 2. فهرس إزالة التكرار (Dedup Index) ---
+
+class DedupIndex:
+    """فهرس للمواد المُثراة: بصمات دقيقة + MinHash/LSH للمواد شبه المتطابقة."""
+
+    def __init__(self):
+        self.entries = {}                    # alu_id -> {'hash', 'signature', 'enrichment'}
+        self.exact = {}                      # hash -> alu_id
+        self.buckets = defaultdict(set)      # band_key -> {alu_id}
+        self.added = set()                   # المواد المضافة في هذا التشغيل (تُدمج عند الحفظ)
+
+    def add(self, alu_id, article_text, enrichment):
+        """إضافة مادة مُثراة إلى الفهرس."""
+        normalized = normalize_article_text(article_text)
+        if not normalized:
+            return
+        fingerprint = exact_fingerprint(normalized)
+        signature = minhash_signature(shingles(normalized))
+        self._insert(alu_id, fingerprint, signature, enrichment)
+        self.added.add(alu_id)
+
+    def _insert(self, alu_id, fingerprint, signature, enrichment):
+        self.remove(alu_id)
+        self.entries[alu_id] = {'hash': fingerprint, 'signature': signature, 'enrichment': enrichment}
+        self.exact.setdefault(fingerprint, alu_id)
+        for key in lsh_band_keys(signature):
+            self.buckets[key].add(alu_id)
+
+    def remove(self, alu_id):
+        """حذف مادة من الفهرس (مثلاً عند إعادة إثرائها بنص مختلف)."""
+        entry = self.entries.pop(alu_id, None)
+        if entry is None:
+            return
+        if self.exact.get(entry['hash']) == alu_id:
+            del self.exact[entry['hash']]
+        for key in lsh_band_keys(entry['signature']):
+            self.buckets[key].discard(alu_id)
+
+    def lookup(self, article_text, threshold=DEDUP_SIMILARITY_THRESHOLD, exclude_id=None):
+        """
+        البحث عن مادة مُثراة مطابقة أو شبه مطابقة.
+        يعيد (alu_id, similarity, method) أو None.
+        """
+        normalized = normalize_article_text(article_text)
+        if not normalized:
+            return None
+
+        fingerprint = exact_fingerprint(normalized)
+        exact_id = self.exact.get(fingerprint)
+        if exact_id and exact_id != exclude_id:
+            return exact_id, 1.0, 'exact'
+        return self.lookup_signature(minhash_signature(shingles(normalized)), threshold, exclude_id)
+
+    def lookup_signature(self, signature, threshold=DEDUP_SIMILARITY_THRESHOLD, exclude_id=None, fingerprint=None):
+        """البحث بتوقيع محسوب مسبقاً (وبصمة دقيقة اختيارية) دون إعادة حساب MinHash."""
+        exact_id = self.exact.get(fingerprint) if fingerprint else None
+        if exact_id and exact_id != exclude_id:
+            return exact_id, 1.0, 'exact'
+        candidates = set()
+        for key in lsh_band_keys(signature):
+            candidates.update(self.buckets.get(key, ()))
+        candidates.discard(exclude_id)
+
+        best = None
+        for candidate_id in candidates:
+            similarity = estimate_similarity(signature, self.entries[candidate_id]['signature'])
+            if similarity >= threshold and (best is None or similarity > best[1]):
+                best = (candidate_id, similarity, 'minhash')
+        return best
+
+    def enrichment_for(self, alu_id):
+        """إرجاع بيانات الإثراء المحفوظة لمادة في الفهرس."""
+        return self.entries[alu_id]['enrichment']
+
+    def save(self, index_path, merge=True):
+        """
+        حفظ الفهرس كملف JSON (كتابة ذرية تحت قفل). merge: دمج المواد المضافة في هذا التشغيل فوق
+        النسخة الموجودة على القرص، فلا تضيع إضافات العمال الآخرين الذين حفظوا الفهرس في الأثناء.
+        """
+        index_path = Path(index_path)
+        with _file_lock(str(index_path) + LOCK_SUFFIX):
+            entries = self.entries
+            if merge and index_path.exists():
+                try:
+                    with open(index_path, 'r', encoding='utf-8') as f:
+                        entries = json.load(f).get('entries', {})
+                except (OSError, json.JSONDecodeError):
+                    entries = {}
+                entries.update({alu_id: self.entries[alu_id] for alu_id in self.added if alu_id in self.entries})
+            tmp_path = index_path.with_name(index_path.name + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'entries': entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, index_path)
+        self.added = set()
+
+    @classmethod
+    def load(cls, index_path):
+        """تحميل الفهرس من ملف JSON (أو إنشاء فهرس فارغ إذا لم يوجد)."""
+        index = cls()
+        index_path = Path(index_path)
+        if not index_path.exists():
+            return index
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"  ⚠️ تعذر قراءة فهرس التكرار {index_path.name}: {e}. سيتم البدء بفهرس فارغ.")
+            return index
+        for alu_id, entry in data.get('entries', {}).items():
+            index._insert(alu_id, entry['hash'], entry['signature'], entry['enrichment'])
+        return index
+
+# --- 3. بناء الفهرس من المخرجات الحالية ---
+
+def _read_alu(file_path):
+    """قراءة رأس YAML والنص من ملف Markdown (دون طباعة تحذيرات)."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    match = re.search(r'^---\n(.*?)\n---\n(.*)', content, re.DOTALL)
+    if not match:
+        return None, content
+    try:
+        return yaml.safe_load(match.group(1)), match.group(2)
+    except yaml.YAMLError:
+        return None, content
+
+def is_enriched(metadata):
+    """هل تحمل المادة إثراءً أصلياً من LLM (وليس إثراءً مُعاداً استخدامه)؟"""
+    # استيراد متأخر: corpus يستورد splitter الذي يستورد هذه الوحدة
+    from corpus import summary_text
+    return bool(metadata and summary_text(metadata) and metadata.get('keywords')) \
+        and 'enrichment_source' not in metadata
+
+def enrichment_record(metadata):
+    """استخراج حقول الإثراء القابلة لإعادة الاستخدام من رأس YAML."""
+    return {
+        'summary': metadata.get('summary'),
+        'keywords': metadata.get('keywords', []),
+        'aspect': metadata.get('aspect', 'غير مصنف'),
+        'ocr_corrections': metadata.get('ocr_corrections', {}),
+    }
+
+def build_index_from_corpus(base_folder="processed_systems_output"):
+    """بناء الفهرس من جميع ملفات ALU المُثراة في مجلد المخرجات."""
+    index = DedupIndex()
+    for file_path in CorpusManifest.load(base_folder).iter_alu_paths():
+        metadata, text_content = _read_alu(file_path)
+        if is_enriched(metadata):
+            index.add(metadata.get('id'), text_content, enrichment_record(metadata))
+    return index
+
+def load_or_build_index(base_folder="processed_systems_output"):
+    """تحميل الفهرس المحفوظ، أو بناؤه من المخرجات إذا لم يكن موجوداً."""
+    index_path = Path(base_folder) / DEDUP_INDEX_FILE
+    if index_path.exists():
+        return DedupIndex.load(index_path)
+    return build_index_from_corpus(base_folder)
+
+# --- 4. كشف الوثائق المصدرية المكررة (قبل التقسيم) ---
+
+def source_signatures(source_files, base_folder="processed_systems_output"):
+    """
+    تواقيع الوثائق المصدرية: {المسار: {'mtime_ns', 'size', 'hash', 'signature'}}.
+    تُعاد من الملف المحفوظ للوثائق التي لم يتغير (وقت تعديلها، حجمها)، ولا يُحسب MinHash إلا للباقي.
+    """
+    cache_path = Path(base_folder) / SOURCE_SIGNATURES_FILE
+    cached = {}
+    if cache_path.exists():
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            cached = {}
+
+    signatures, changed = {}, False
+    for file_path in source_files:
+        stat = Path(file_path).stat()
+        entry = cached.get(str(file_path))
+        if entry is None or (entry['mtime_ns'], entry['size']) != (stat.st_mtime_ns, stat.st_size):
+            # مقارنة نص الوثيقة فقط دون رأس YAML (الذي يختلف عادةً في الرقم والتاريخ)
+            _, content = _read_alu(file_path)
+            normalized = normalize_article_text(content)
+            entry = {
+                'mtime_ns': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'hash': exact_fingerprint(normalized) if normalized else None,
+                'signature': minhash_signature(shingles(normalized)) if normalized else None,
+            }
+            changed = True
+        signatures[str(file_path)] = entry
+
+    if changed or set(signatures) != set(cached):
+        Path(base_folder).mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(signatures, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    return signatures
+
+def find_duplicate_sources(source_files, stale_files=None, base_folder="processed_systems_output",
+                           threshold=DOC_SIMILARITY_THRESHOLD):
+    """
+    مقارنة الوثائق المصدرية المتقادمة (stale_files، الافتراضي: كلها) بكل الوثائق المصدرية
+    وإرجاع قائمة الأزواج المكررة: [(file_a, file_b, similarity, method), ...]
+    """
+    signatures = source_signatures(source_files, base_folder)
+    index = DedupIndex()
+    for path, entry in signatures.items():
+        if entry['signature'] is not None:
+            index._insert(path, entry['hash'], entry['signature'], None)
+
+    duplicates, seen = [], set()
+    for file_path in stale_files if stale_files is not None else source_files:
+        entry = signatures[str(file_path)]
+        if entry['signature'] is None:
+            continue
+        match = index.lookup_signature(entry['signature'], threshold, str(file_path), entry['hash'])
+        if match and frozenset((match[0], str(file_path))) not in seen:
+            seen.add(frozenset((match[0], str(file_path))))
+            duplicates.append((match[0], str(file_path), match[1], match[2]))
+    return duplicates
+
+# --- 5. التشغيل المستقل (إعادة بناء الفهرس) ---
+if __name__ == "__main__":
+    base_folder = "processed_systems_output"
+    if not Path(base_folder).exists():
+        print(f"❌ لم يتم العثور على مجلد المخرجات: {base_folder}")
+        exit()
+
+    index = build_index_from_corpus(base_folder)
+    index_path = Path(base_folder) / DEDUP_INDEX_FILE
+    index.save(index_path, merge=False)
+    print(f"✅ تم بناء فهرس التكرار: {len(index.entries)} مادة مُثراة ({len(index.exact)} بصمة فريدة).")
+    print(f"  > تم الحفظ في: {index_path}")
@@ -0,0 +1,283 @@
+import os
+import re
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+
+from google import genai
+from google.genai.errors import APIError
+
+from corpus import read_header, summary_text
+from corpus_manifest import CorpusManifest, STAGE_SUMMARY
+from splitter import load_yaml_and_content, create_yaml_header
+from response_schema import ResponseRepairError, extract_json_object, close_truncated_json, normalize_fields
+from chunk_export import estimate_tokens
+from enricher import MODEL_NAME, MAX_RETRIES
+
+# --- ثوابت وإعدادات ---
+SUMMARY_PROMPT_VERSION = "1"            # تُرفع عند تعديل الطلب حتى تُعاد كل الملخصات (تدخل في مفاتيح الذاكرة)
+SUMMARY_CACHE_SUFFIX = ".summary_cache.json"   # النتائج الوسيطة لكل وثيقة (داخل مجلد الوثيقة)
+GROUP_TARGET_SIZE = 12                  # متوسط عدد الملخصات في المجموعة الواحدة
+GROUP_MIN_SIZE = 4
+GROUP_MAX_SIZE = 24
+GROUP_MAX_TOKENS = 3000                 # سقف مدخل كل طلب اختزال مهما كان عدد الملخصات
+
+SUMMARY_RESPONSE_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'summary': {'type': 'STRING'},
+        'keywords': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+    },
+    'required': ['summary', 'keywords'],
+}
+
+TITLE_PATTERN = re.compile(r'^#\s+(.+)$', re.MULTILINE)
+
+# --- 1. الأوراق والتجميع ---
+
+def document_leaves(corpus_manifest, doc_slug):
+    """ملخصات مواد الوثيقة بالترتيب من رؤوسها فقط (الأوراق في شجرة الاختزال)."""
+    leaves = []
+    for alu in corpus_manifest.alus(doc_slug):
+        file_path = corpus_manifest.base_folder / alu['file']
+        metadata = read_header(file_path) if file_path.exists() else {}
+        summary = summary_text(metadata)
+        if not summary:
+            continue
+        label = f"المادة {metadata.get('articles') or alu['id'].split('--مادة-')[-1]}"
+        leaves.append({'key': alu['id'], 'label': label, 'summary': summary,
+                       'keywords': [str(k) for k in metadata.get('keywords') or []]})
+    return leaves
+
+def _is_boundary(key):
+    """حد مجموعة يحدده محتوى المعرف لا موقعه: إضافة مادة أو حذفها لا تزحزح حدود المجموعات الأخرى."""
+    return int(hashlib.sha1(key.encode('utf-8')).hexdigest()[:8], 16) % GROUP_TARGET_SIZE == 0
+
+def group_nodes(nodes):
+    """تقسيم العقد المتتالية إلى مجموعات محدودة العدد والتوكنات بحدود ثابتة بالمحتوى."""
+    groups, current, current_tokens = [], [], 0
+    for node in nodes:
+        tokens = estimate_tokens(node['summary'])
+        # مجموعة من عقدتين على الأقل حتى يقل عدد العقد في كل مستوى وتنتهي الشجرة
+        if len(current) >= 2 and (len(current) >= GROUP_MAX_SIZE or current_tokens + tokens > GROUP_MAX_TOKENS):
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(node)
+        current_tokens += tokens
+        if len(current) >= GROUP_MIN_SIZE and _is_boundary(node['key']):
+            groups.append(current)
+            current, current_tokens = [], 0
+    if current:
+        groups.append(current)
+    return groups
+
+def node_key(level, children, is_root, model):
+    """
+    مفتاح العقدة من مدخلاتها فقط (معرفات الأبناء وملخصاتها، لا مواقعها):
+    يتغير إذا تغير ملخص أي مادة تحتها، أو الطلب أو الموديل.
+    """
+    digest = hashlib.sha1(f"{SUMMARY_PROMPT_VERSION}|{model}|{level}|{is_root}".encode('utf-8'))
+    for child in children:
+        digest.update(f"\n{child['key']}\t{child['summary']}".encode('utf-8'))
+    return digest.hexdigest()
+
+# --- 2. طلب الاختزال ---
+
+def parse_summary_response(raw_text):
+    try:
+        data = json.loads(raw_text)
+    except json.JSONDecodeError:
+        try:
+            data = json.loads(close_truncated_json(extract_json_object(raw_text)))
+        except json.JSONDecodeError as e:
+            raise ResponseRepairError(f"تعذر إصلاح JSON: {e}")
+    if not isinstance(data, dict):
+        raise ResponseRepairError("الاستجابة ليست كائن JSON.")
+    data = normalize_fields(data, include_ocr=False)
+    if not isinstance(data.get('summary'), str) or not data['summary'].strip():
+        raise ResponseRepairError("الحقل summary مفقود.")
+    data.setdefault('keywords', [])
+    return data
+
+def call_reduce_api(client, title, children, is_root, model=MODEL_NAME):
+    """
+    اختزال مجموعة ملخصات إلى ملخص واحد وكلمات مفتاحية. يعيد (البيانات، توكنات المدخل، توكنات المخرج).
+    """
+    scope = "الوثيقة كاملة" if is_root else "هذا الجزء من الوثيقة"
+    length = "80 كلمة" if is_root else "50 كلمة"
+    system_prompt = (
+        "أنت محلل قانوني خبير. ستتلقى ملخصات متتالية لمواد أو أجزاء من وثيقة قانونية، "
+        "ومهمتك تكثيفها في ملخص واحد متماسك وكلمات مفتاحية بصيغة JSON فقط، دون أي مقدمات أو شرح."
+    )
+    lines = "\n".join(f"- {child['label']}: {child['summary']}" for child in children)
+    user_prompt = f"""
+    الوثيقة: {title or 'غير معروف'}
+
+    الملخصات:
+    ---
+    {lines}
+    ---
+
+    البيانات المطلوبة في JSON:
+    {{
+      "summary": "ملخص {scope} ({length} كحد أقصى) يذكر موضوعاتها الرئيسية دون سرد المواد واحدة واحدة.",
+      "keywords": ["5-10 كلمات مفتاحية تغطي {scope}"]
+    }}
+    """
+    config = {
+        "system_instruction": system_prompt,
+        "response_mime_type": "application/json",
+        "response_schema": SUMMARY_RESPONSE_SCHEMA,
+        "temperature": 0.0,
+    }
+    wasted_output_tokens = 0
+    for attempt in range(MAX_RETRIES):
+        output_tokens = 0
+        try:
+            response = client.models.generate_content(model=model, contents=[user_prompt], config=config)
+            usage = response.usage_metadata
+            output_tokens = getattr(usage, 'candidates_token_count', None) or 0
+            input_tokens = getattr(usage, 'prompt_token_count', None) or estimate_tokens(system_prompt + user_prompt)
+            return parse_summary_response(response.text.strip()), input_tokens, output_tokens + wasted_output_tokens
+        except APIError as e:
+            if attempt < MAX_RETRIES - 1:
+                print(f"  ⚠️ فشل الاتصال، سيعاد المحاولة بعد 5 ثوانٍ: {e}")
+                time.sleep(5)
+            else:
+                raise APIError(f"❌ فشل الاتصال بـ Gemini API بعد {MAX_RETRIES} محاولات: {e}")
+        except ResponseRepairError as e:
+            wasted_output_tokens += output_tokens
+            print(f"  ⚠️ تحذير: استجابة غير صالحة ({e}). سيعاد الطلب.")
+            if attempt == MAX_RETRIES - 1:
+                raise ResponseRepairError(f"فشل الحصول على استجابة صالحة بعد {MAX_RETRIES} محاولات: {e}")
+
+# --- 3. الشجرة مع الذاكرة ---
+
+def load_cache(cache_path):
+    if cache_path.exists():
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"  ⚠️ تعذر قراءة ذاكرة الملخصات {cache_path.name}: {e}. ستُعاد كل العقد.")
+    return {}
+
+def save_cache(cache_path, nodes):
+    tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(nodes, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, cache_path)
+
+def reduce_document(client, title, leaves, cache, model=MODEL_NAME, cache_path=None):
+    """
+    اختزال هرمي: ملخصات المواد ← ملخصات أجزاء (بحجم محدود) ← ... ← ملخص الوثيقة.
+    العقدة التي لم تتغير مدخلاتها تُؤخذ من الذاكرة دون طلب، فلا يُعاد حسابه إلا الفروع
+    التي تحوي مواد تغيرت. يعيد (عقدة الجذر، العقد المستخدمة، الإحصاءات).
+    cache_path: إن مُرِّر تُحفظ فيه كل عقدة فور حسابها، فلا يضيع ما دُفع ثمنه إذا فشل طلب لاحق.
+    """
+    stats = {'nodes': 0, 'cached': 0, 'input_tokens': 0, 'output_tokens': 0}
+    if len(leaves) == 1:
+        # وثيقة من مادة واحدة: ملخصها هو ملخص المادة دون طلب
+        return {'summary': leaves[0]['summary'], 'keywords': leaves[0]['keywords']}, {}, stats
+    used = {}
+    nodes, level = leaves, 1
+    while True:
+        groups = group_nodes(nodes)
+        is_root = len(groups) == 1
+        next_nodes = []
+        for index, children in enumerate(groups, 1):
+            key = node_key(level, children, is_root, model)
+            stats['nodes'] += 1
+            result = cache.get(key)
+            if result is not None:
+                stats['cached'] += 1
+            else:
+                data, input_tokens, output_tokens = call_reduce_api(client, title, children, is_root, model)
+                stats['input_tokens'] += input_tokens
+                stats['output_tokens'] += output_tokens
+                result = {'summary': data['summary'], 'keywords': data['keywords']}
+            result = dict(result, level=level, children=[child['key'] for child in children])
+            used[key] = result
+            if cache_path is not None and key not in cache:
+                cache[key] = result
+                save_cache(cache_path, cache)
+            next_nodes.append({'key': key, 'label': f"الجزء {index}", 'summary': result['summary']})
+        if is_root:
+            return used[next_nodes[0]['key']], used, stats
+        nodes, level = next_nodes, level + 1
+
+# --- 4. كتابة ملخص الوثيقة ---
+
+def update_parent_summary(parent_path, summary, keywords):
+    """تحديث حقلي summary وkeywords في رأس الملف الأم وحدهما (كتابة ذرية)."""
+    metadata, body = load_yaml_and_content(parent_path)
+    if metadata.get('summary') == summary and metadata.get('keywords') == keywords:
+        return False
+    metadata['summary'] = summary
+    metadata['keywords'] = keywords
+    tmp_path = parent_path.with_name(parent_path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(create_yaml_header(metadata) + body.strip())
+    os.replace(tmp_path, parent_path)
+    return True
+
+def summarize_document(client, corpus_manifest, doc_slug, model=MODEL_NAME):
+    """ملخص وثيقة واحدة. يعيد الإحصاءات أو None إذا لم تكن لموادها ملخصات بعد."""
+    leaves = document_leaves(corpus_manifest, doc_slug)
+    if not leaves:
+        print(f"  ⚠️ لا توجد ملخصات مواد للوثيقة {doc_slug}. شغّل enricher.py أولاً.")
+        return None
+    parent_path = corpus_manifest.parent_path(doc_slug)
+    title_match = TITLE_PATTERN.search(parent_path.read_text(encoding='utf-8')) if parent_path.exists() else None
+    title = title_match.group(1).strip() if title_match else doc_slug
+
+    cache_path = corpus_manifest.document_file(doc_slug, SUMMARY_CACHE_SUFFIX)
+    root, used, stats = reduce_document(client, title, leaves, load_cache(cache_path), model, cache_path)
+    # بعد نجاح الاختزال تُحفظ العقد المستخدمة فقط: عقد الفروع التي تغيرت لم تعد تلزم
+    save_cache(cache_path, used)
+    if parent_path.exists():
+        update_parent_summary(parent_path, root['summary'], root['keywords'])
+    stats['leaves'] = len(leaves)
+    return stats
+
+# --- 5. التشغيل ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ملخصات الوثائق باختزال هرمي لملخصات المواد (map-reduce) مع ذاكرة للنتائج الوسيطة.")
+    parser.add_argument("--input", default="processed_systems_output", help="مجلد المخرجات")
+    parser.add_argument("--doc", action="append", default=None, help="وثيقة محددة فقط (يمكن تكراره)")
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        print(f"❌ لم يتم العثور على مجلد المخرجات: {args.input}")
+        exit()
+    if not os.getenv("GEMINI_API_KEY"):
+        print("❌ يرجى تعيين متغير البيئة GEMINI_API_KEY قبل التشغيل.")
+        exit()
+
+    corpus_manifest = CorpusManifest.load(args.input)
+    client = genai.Client()
+    totals = {'nodes': 0, 'cached': 0, 'input_tokens': 0, 'output_tokens': 0}
+    for doc_slug in args.doc or corpus_manifest.doc_slugs:
+        if doc_slug not in corpus_manifest:
+            print(f"  ⚠️ وثيقة غير موجودة في بيان المدونة: {doc_slug}")
+            continue
+        try:
+            stats = summarize_document(client, corpus_manifest, doc_slug)
+        except Exception as e:
+            print(f"  ❌ فشل تلخيص الوثيقة {doc_slug}: {e}")
+            continue
+        if stats is None:
+            continue
+        for field in totals:
+            totals[field] += stats[field]
+        corpus_manifest.set_stage(doc_slug, STAGE_SUMMARY, prompt_version=SUMMARY_PROMPT_VERSION, model=MODEL_NAME,
+                                  nodes=stats['nodes'], cached=stats['cached'])
+        print(f"  ✅ {doc_slug}: {stats['leaves']} مادة، {stats['nodes']} عقدة ({stats['cached']} من الذاكرة)، "
+              f"توكنات {stats['input_tokens']} + {stats['output_tokens']}")
+    corpus_manifest.save()
+
+    print("\n" + "="*70)
+    print(f"✅ اكتمل تلخيص الوثائق: {totals['nodes']} عقدة، منها {totals['cached']} من الذاكرة دون طلب.")
+    print(f"💸 توكنات المدخل: {totals['input_tokens']} | توكنات المخرج: {totals['output_tokens']}")
@@ -1,5 +1,6 @@
 import os
 import re
+import argparse
 import yaml
 import json
 import traceback
@@ -8,8 +9,29 @@ from pathlib import Path
 from google import genai
 from google.genai.errors import APIError
 
+from dedup_index import DEDUP_INDEX_FILE, load_or_build_index, enrichment_record
+from ocr_detector import load_detector
+from response_schema import build_response_schema, parse_llm_response, ResponseRepairError
+from corpus import summary_text
+from build_state import BuildState, text_hash
+from stream_guard import stream_generate_content, StreamAborted, TIGHTENED_INSTRUCTION, TIGHTENED_MAX_OUTPUT_TOKENS
+from lease_queue import LeaseQueue, LEASE_QUEUE_FILE
+from scheduler import document_jobs, document_order, build_schedule, project_completion, print_projection
+from hedging import HedgedCaller, DeadlineExceeded
+from corpus_manifest import CorpusManifest, STAGE_ENRICH
+from parent_index import index_entry, update_document_index
+from aspect_classifier import load_classifier, LOCAL_SOURCE
+from offline_enricher import offline_enrichment, needs_offline, load_term_stats
+
 # --- ثوابت وإعدادات ---
 MAX_RETRIES = 3 # عدد المحاولات القصوى للاتصال بـ Gemini
+MODEL_NAME = 'gemini-2.5-flash'
+PROMPT_VERSION = "3" # تُرفع عند تعديل الطلب (prompt) حتى يُعاد إثراء كل المواد
+SKIP_LLM_OCR_WHEN_CLEAN = True # حذف مهمة OCR من الطلب إذا لم يجد الكاشف المحلي أي خطأ محتمل
+USE_STREAMING = False # استهلاك الاستجابة كبث مع قطعها مبكراً عند تجاوز ميزانية الحقول
+USE_HEDGING = True # مهلة لكل طلب حسب حجمه، وطلب مكرر عند تجاوز p95 (انظر hedging.py)
+USE_OFFLINE_FALLBACK = True # ملخص استخلاصي محلي مؤقت للمواد التي فشل إثراؤها بـ LLM (انظر offline_enricher.py)
+USE_LOCAL_ASPECT = True # حذف aspect من الطلب إذا صنّف المصنف المحلي المادة بثقة عالية (انظر aspect_classifier.py)
 
 # --- توابع مساعدة ---
 
@@ -40,19 +62,32 @@ def save_ocr_review_file(doc_slug, all_corrections, output_path):
     with open(output_file_path, 'w', encoding='utf-8') as f:
         json.dump(review_data, f, ensure_ascii=False, indent=2)
     
-    print(f"  ✅ تم إنشاء ملف المراجعة: {output_file_path.name}")
+    print(f"  ✅ تم إنشاء ملف المراجعة: {output_file_path.name}")
+
+def load_previous_ocr_records(doc_slug, output_path, exclude_files):
+    """سجلات المراجعة السابقة للمواد التي لم يُعَد إثراؤها في هذا التشغيل (للإثراء الجزئي)."""
+    review_path = Path(output_path) / f"{doc_slug}.ocr_review.json"
+    if not review_path.exists():
+        return []
+    with open(review_path, 'r', encoding='utf-8') as f:
+        previous = json.load(f).get('corrections_to_review', [])
+    return [c for c in previous if c.get('file') not in exclude_files]
 
 
 # *******************************************************************
 # دالة استخلاص السياق الأساسي
 # *******************************************************************
 
-def get_core_context(doc_slug, source_folder="source_files"):
+def get_core_context(doc_slug, source_folder="source_files", source_file=None):
     """
     استخلاص العنوان، والنص الافتتاحي، والتعريفات (المادة الأولى) من الملف الأصلي.
+    source_file: مسار المصدر المسجل في بيان المدونة؛ استنتاجه من الـ slug لا يصح للوثائق المرقمة.
     """
-    original_file_name = f"{doc_slug.replace('وثيقة-', '')}.md"
-    original_file_path = Path(source_folder) / original_file_name
+    if source_file is not None:
+        original_file_path = Path(source_file)
+    else:
+        original_file_name = f"{doc_slug.replace('وثيقة-', '')}.md"
+        original_file_path = Path(source_folder) / original_file_name
     
     if not original_file_path.exists():
         print(f"  ❌ لم يتم العثور على الملف الأصلي: {original_file_path.name}. سيتم استخدام إثراء معزول.")
@@ -93,8 +128,36 @@ def get_core_context(doc_slug, source_folder="source_files"):
 # ### [تعديل رئيسي] دالة الاتصال بـ Gemini مع حساب التوكنات
 # *******************************************************************
 
-def call_gemini_api(article_text, core_context):
-    """وظيفة الاتصال الفعلي بـ Gemini API لاستخلاص البيانات الوصفية مع آلية إعادة المحاولة وحساب التوكنات."""
+def build_ocr_prompt_parts(ocr_hints, include_ocr):
+    """بناء جزء OCR من الطلب: تلميحات الكاشف المحلي وحقل ocr_corrections في بنية JSON."""
+    if not include_ocr:
+        return "", ""
+
+    hints_section = ""
+    if ocr_hints:
+        hints_lines = "\n".join(f"    - {h['original_word']} ← {h['suggested_correction']}" for h in ocr_hints)
+        hints_section = f"""
+    **تلميحات OCR من الكاشف المحلي (تحقق منها وأضف ما فاته):**
+{hints_lines}
+"""
+
+    ocr_field = """,
+      "ocr_corrections": [
+        {
+          "original_word": "الكلمة الأصلية الخاطئة",
+          "suggested_correction": "التصحيح المقترح",
+          "context": "الجملة المحيطة لتأكيد سياق الخطأ"
+        }
+        # أضف كل أخطاء OCR المحتملة
+      ]"""
+    return hints_section, ocr_field
+
+def call_gemini_api(article_text, core_context, ocr_hints=None, include_ocr=True, hedger=None, include_aspect=True):
+    """
+    وظيفة الاتصال الفعلي بـ Gemini API لاستخلاص البيانات الوصفية مع آلية إعادة المحاولة وحساب التوكنات.
+    hedger: HedgedCaller اختياري يفرض مهلة على كل طلب ويرسل طلباً مكرراً للطلبات البطيئة.
+    include_aspect: False إذا صنّف المصنف المحلي المادة بثقة عالية (لا يُطلب الحقل من الموديل).
+    """
     
     if not os.getenv("GEMINI_API_KEY"):
         raise ValueError("يرجى تعيين متغير البيئة GEMINI_API_KEY قبل التشغيل.")
@@ -110,6 +173,11 @@ def call_gemini_api(article_text, core_context):
     )
     
     # 2. تحديث User Prompt لدمج السياق الأساسي [Contextual Enrichment]
+    ocr_hints_section, ocr_field = build_ocr_prompt_parts(ocr_hints, include_ocr)
+    aspect_field = (
+        ',\n      "aspect": "تصنيف المادة هل هي \'إجرائي\' (يشرح خطوات/إجراءات) أو \'موضوعي\' (يشرح حقوق/واجبات/تعريفات)."'
+        if include_aspect else ""
+    )
     user_prompt = f"""
     **[هام] يرجى استخدام السياق القانوني الأساسي أدناه في تحليل المادة القانونية:**
     {core_context if core_context else 'لا يوجد سياق أساسي، تعامل مع المادة كوثيقة مستقلة.'}
@@ -120,20 +188,11 @@ def call_gemini_api(article_text, core_context):
     ---
     {article_text}
     ---
-    
+    {ocr_hints_section}
     البيانات المطلوبة في JSON:
     {{
       "summary": "ملخص مكثف للمادة (30 كلمة كحد أقصى) مع مراعاة التعريفات الواردة في السياق.",
-      "keywords": ["كلمة مفتاحية 1", "كلمة مفتاحية 2", "كلمة مفتاحية 3", ...],
-      "aspect": "تصنيف المادة هل هي 'إجرائي' (يشرح خطوات/إجراءات) أو 'موضوعي' (يشرح حقوق/واجبات/تعريفات).",
-      "ocr_corrections": [
-        {{
-          "original_word": "الكلمة الأصلية الخاطئة",
-          "suggested_correction": "التصحيح المقترح",
-          "context": "الجملة المحيطة لتأكيد سياق الخطأ"
-        }}
-        # أضف كل أخطاء OCR المحتملة
-      ]
+      "keywords": ["كلمة مفتاحية 1", "كلمة مفتاحية 2", "كلمة مفتاحية 3", ...]{aspect_field}{ocr_field}
     }}
     """
     
@@ -148,7 +207,7 @@ def call_gemini_api(article_text, core_context):
     try:
         # حساب التوكنات المدخلة قبل البدء بالمكالمة الفعلية
         token_count_response = client.models.count_tokens(
-            model='gemini-2.5-flash',
+            model=MODEL_NAME,
             contents=contents_to_count
         )
         input_tokens = token_count_response.total_tokens
@@ -158,15 +217,35 @@ def call_gemini_api(article_text, core_context):
 
     # ----------------------------------------------------
     
+    # مخطط الاستجابة يُرسَل مع الطلب حتى يلتزم الموديل بالبنية بدلاً من وصفها نصياً فقط
+    response_schema = build_response_schema(include_ocr, include_aspect)
+    wasted_output_tokens = 0 # توكنات محاولات فشل إصلاحها (مدفوعة رغم ذلك)
+    tightened = False # بعد قطع بث منفلت تُعاد المحاولة بتعليمات وحدود أشد
     
     for attempt in range(MAX_RETRIES):
-        print(f"  ... جارٍ الاتصال بـ Gemini API لمعالجة البيانات (المحاولة {attempt + 1}/{MAX_RETRIES})...")
-        try:
+        print(f"  ... جارٍ الاتصال بـ Gemini API لمعالجة البيانات (المحاولة {attempt + 1}/{MAX_RETRIES})...")
+        output_tokens = 0
+        config = {
+            "system_instruction": system_prompt,
+            "response_mime_type": "application/json",
+            "response_schema": response_schema,
+            "temperature": 0.0,
+        }
+        if tightened:
+            config["max_output_tokens"] = TIGHTENED_MAX_OUTPUT_TOKENS
+        # ملاحظة: تم تعديل contents لإرسال الـ user_prompt فقط لأن الـ system_instruction تم وضعه في config
+        contents = [user_prompt + TIGHTENED_INSTRUCTION] if tightened else [user_prompt]
+        if hedger is not None:
+            # المهلة تُمرَّر للعميل أيضاً حتى يُقطع الاتصال الخاسر ولا يبقى معلقاً
+            config["http_options"] = {"timeout": int(hedger.deadline_for(input_tokens) * 1000)}
+        
+        def request():
+            if USE_STREAMING:
+                return stream_generate_content(client, MODEL_NAME, contents, config)
             response = client.models.generate_content(
-                model='gemini-2.5-flash',
-                # ملاحظة: تم تعديل contents لإرسال الـ user_prompt فقط لأن الـ system_instruction تم وضعه في config
-                contents=[user_prompt],
-                config={"system_instruction": system_prompt, "response_mime_type": "application/json", "temperature": 0.0}
+                model=MODEL_NAME,
+                contents=contents,
+                config=config
             )
             
             # ----------------------------------------------------
@@ -174,12 +253,21 @@ def call_gemini_api(article_text, core_context):
             # ----------------------------------------------------
             usage_metadata = response.usage_metadata
             # توكنات المرشحين (candidates) هي ما يمثل الرد النهائي للموديل
-            output_tokens = usage_metadata.candidates_token_count
+            return response.text, usage_metadata.candidates_token_count or 0
+        
+        try:
+            if hedger is not None:
+                response_text, output_tokens = hedger.call(request, MODEL_NAME, input_tokens)
+            else:
+                response_text, output_tokens = request()
             
-            llm_data = json.loads(response.text.strip())
+            # التحقق بالمتحقق المُجمَّع، مع إصلاح محلي للعيوب الشائعة قبل اللجوء لإعادة الطلب
+            llm_data, repaired = parse_llm_response(response_text.strip(), include_ocr, include_aspect)
+            if repaired:
+                print("  🔧 تم إصلاح استجابة الموديل محلياً دون إعادة الطلب.")
             
             # [تعديل الإرجاع] ليعيد البيانات والتوكنات
-            return llm_data, input_tokens, output_tokens
+            return llm_data, input_tokens, output_tokens + wasted_output_tokens
             
         except APIError as e:
             if 'permission denied' in str(e).lower() or '403' in str(e):
@@ -191,19 +279,30 @@ def call_gemini_api(article_text, core_context):
             else:
                 raise APIError(f"❌ فشل الاتصال بـ Gemini API بعد {MAX_RETRIES} محاولات: {e}")
                 
-        except json.JSONDecodeError:
-            print(f"  ⚠️ تحذير: فشل تحليل JSON من رد الموديل. سيعاد المحاولة.")
+        except DeadlineExceeded as e:
+            # الطلب (والطلب المكرر) لم يكتمل في مهلته: إعادة المحاولة فوراً فالانتظار استُهلك أصلاً
             if attempt < MAX_RETRIES - 1:
-                time.sleep(5)
+                print(f"  ⏱️ {e}. سيعاد الطلب.")
             else:
-                # [تعديل الإرجاع] في حالة الفشل نرجع بيانات فارغة وتوكنات 0
-                return {}, 0, 0 
+                raise DeadlineExceeded(f"❌ تجاوزت كل المحاولات ({MAX_RETRIES}) المهلة: {e}")
+                
+        except StreamAborted as e:
+            # قُطع البث قبل اكتماله: نحتسب ما استُهلك ونعيد المحاولة بتعليمات أشد
+            wasted_output_tokens += e.output_tokens
+            tightened = True
+            print(f"  ✂️ تم قطع البث مبكراً ({e.reason}). سيعاد الطلب بحدود أشد.")
+            if attempt == MAX_RETRIES - 1:
+                raise ResponseRepairError(f"استمر تجاوز الحدود بعد {MAX_RETRIES} محاولات: {e.reason}")
+                
+        except ResponseRepairError as e:
+            # خطأ في المحتوى وليس في الاتصال: إعادة الطلب فوراً دون انتظار
+            wasted_output_tokens += output_tokens
+            print(f"  ⚠️ تحذير: استجابة غير صالحة وتعذر إصلاحها محلياً ({e}). سيعاد الطلب.")
+            if attempt == MAX_RETRIES - 1:
+                raise ResponseRepairError(f"فشل الحصول على استجابة صالحة بعد {MAX_RETRIES} محاولات: {e}")
                 
         except Exception as e:
             raise Exception(f"حدث خطأ عام أثناء استدعاء API: {e}")
-    
-    # [إرجاع الفشل] إذا لم تنجح أي محاولة
-    return {}, 0, 0 
 
 
 # ... (باقي الدوال load_yaml_and_content و update_alu_file تبقى كما هي) ...
@@ -231,7 +330,8 @@ def update_alu_file(file_path, new_metadata, text_content):
     """تحديث ملف ALU بالبيانات الوصفية الجديدة"""
     
     # 1. تحديث حقول الملخص والتصحيحات
-    new_metadata['summary'] = new_metadata.get('summary', 'تم تحديث الملخص بواسطة LLM.')
+    # لا يُخترع ملخص: المادة التي لم تُثرَ بعد تبقى بلا ملخص فيملؤها الإثراء المحلي أو إثراء لاحق
+    new_metadata['summary'] = new_metadata.get('summary') or ''
     new_metadata['keywords'] = new_metadata.get('keywords', [])
     new_metadata['aspect'] = new_metadata.get('aspect', 'غير مصنف')
     new_metadata['ocr_corrections'] = new_metadata.get('ocr_corrections', {})
@@ -245,13 +345,45 @@ def update_alu_file(file_path, new_metadata, text_content):
     with open(file_path, 'w', encoding='utf-8') as f:
         f.write(final_content)
 
+def seed_build_state(build_state, corpus_manifest, doc_slugs):
+    """
+    تسجيل الإثراء الموجود في رؤوس المواد للوثائق التي لم يُسجل لها إثراء في حالة البناء
+    (مُثراة قبل وجودها، أو بلا سجل تقسيم)، حتى لا يُعاد إثراء موادها كلها.
+    المادة تُعد مُثراة إذا حملت ملخص LLM غير مؤقت. يعيد عدد المواد المسجلة.
+    """
+    seeded = 0
+    for doc_slug in doc_slugs:
+        if not build_state.needs_seeding(doc_slug):
+            continue
+        alu_hashes, enriched_hashes = {}, {}
+        for alu in corpus_manifest.alus(doc_slug):
+            file_path = corpus_manifest.base_folder / alu['file']
+            if not file_path.exists():
+                continue
+            metadata, text_content = load_yaml_and_content(file_path)
+            alu_hashes[alu['id']] = text_hash(text_content)
+            if metadata and summary_text(metadata) and not metadata.get('provisional'):
+                enriched_hashes[alu['id']] = alu_hashes[alu['id']]
+        build_state.seed_enrichment(doc_slug, PROMPT_VERSION, MODEL_NAME, alu_hashes, enriched_hashes,
+                                    corpus_manifest.source_path(doc_slug))
+        seeded += len(enriched_hashes)
+    return seeded
+
 
 # *******************************************************************
 # الوظيفة الرئيسية المُحدَّثة (مع تجميع التوكنات)
 # *******************************************************************
 
-def process_enrichment(input_folder="processed_systems_output"):
-    """الوظيفة الرئيسية لتشغيل الإثراء على جميع الوثائق داخل المجلدات الفرعية."""
+def process_enrichment(input_folder="processed_systems_output", only_docs=None, force=False, lease_queue=None, pinned=()):
+    """
+    الوظيفة الرئيسية لتشغيل الإثراء على جميع الوثائق داخل المجلدات الفرعية.
+    
+    only_docs: قائمة اختيارية بأسماء (slugs) الوثائق المراد إثراؤها فقط (يستخدمها وضع المراقبة).
+    force: إعادة إثراء كل المواد حتى لو كانت حالة البناء تشير إلى أنها محدثة.
+    lease_queue: طابور إيجارات مشترك (LeaseQueue) للعمل الموزع؛ تُحجز كل وثيقة قبل معالجتها
+                 ولا تُكتب موادها إلا ما دام الإيجار سارياً.
+    pinned: وثائق تُقدَّم على غيرها في الجدولة.
+    """
     
     base_path = Path(input_folder)
     source_path = Path("source_files")
@@ -264,47 +396,110 @@ def process_enrichment(input_folder="processed_systems_output"):
         print(f"❌ لم يتم العثور على مجلد المخرجات: {input_folder}")
         return
 
-    doc_folders = [d for d in base_path.iterdir() if d.is_dir() and 'وثيقة-' in d.name]
+    # اكتشاف العمل من بيان المدونة بقراءة واحدة (بدلاً من سرد المجلدات وتحليل كل ملف)
+    corpus_manifest = CorpusManifest.load(input_folder)
+    if only_docs is not None:
+        doc_folders = [base_path / slug for slug in only_docs if slug in corpus_manifest]
+    else:
+        doc_folders = [base_path / slug for slug in corpus_manifest.doc_slugs]
 
     if not doc_folders:
-        print(f"❌ لم يتم العثور على أي مجلدات وثائق (تبدأ بـ 'وثيقة-') في مجلد {input_folder}.")
+        print(f"❌ لم يتم العثور على أي وثائق في بيان المدونة ({corpus_manifest.path}). شغّل splitter.py أولاً.")
         return
 
+    # حالة البناء: تخطي الوثائق التي أُثريت موادها الحالية بنفس نسخة الطلب والموديل
+    build_state = BuildState(input_folder)
+    seeded = seed_build_state(build_state, corpus_manifest, [d.name for d in doc_folders])
+    if seeded:
+        print(f"  > سُجلت {seeded} مادة مُثراة سابقاً في حالة البناء (لن يُعاد إثراؤها).")
+    if not force:
+        all_docs_count = len(doc_folders)
+        doc_folders = [d for d in doc_folders if build_state.is_enrich_stale(d.name, PROMPT_VERSION, MODEL_NAME)]
+        if not doc_folders:
+            print(f"✅ جميع الوثائق ({all_docs_count}) محدثة. لا حاجة للإثراء.")
+            return
+
     print(f"✅ تم تجميع {len(doc_folders)} وثيقة جاهزة للإثراء.")
     
+    # الجدولة: الأولوية (التثبيت، الحالة، الحداثة) ثم الأقصر أولاً، والوثائق الكبيرة على شرائح
+    jobs = document_jobs(corpus_manifest, [d.name for d in doc_folders], build_state, PROMPT_VERSION, MODEL_NAME, force, pinned)
+    if lease_queue is not None:
+        # العمل الموزع: إضافة الوثائق إلى الطابور المشترك بترتيب الجدولة ثم حجزها واحدة تلو الأخرى
+        ordered = document_order(jobs)
+        lease_queue.enqueue([job['doc'] for job in ordered], {job['doc']: rank for rank, job in enumerate(ordered)})
+        print(f"  > العامل {lease_queue.worker_id} يعمل على الطابور المشترك: {lease_queue.db_path}")
+        work_items = ((base_path / slug, None) for slug in lease_queue.iter_claims())
+    else:
+        slices = build_schedule(jobs)
+        print_projection(jobs, project_completion(slices))
+        work_items = ((base_path / s['doc'], set(s['alu_ids'])) for s in slices)
+    processed_docs = set()
+    core_contexts = {}
+    index_entries = {}   # مدخلات فهرس الملف الأم من نتائج الإثراء في الذاكرة: {slug: {id: مدخل}}
+    
     total_processed = 0
+    total_reused = 0
+    
+    # فهرس التكرار: لإعادة استخدام إثراء المواد المتطابقة (مثل مواد النشر والإلغاء) بدلاً من استدعاء LLM
+    dedup_index = load_or_build_index(input_folder)
+    # أزمنة الاستجابة من التشغيلات السابقة تحدد متى يُرسل الطلب المكرر
+    hedger = HedgedCaller.load(input_folder) if USE_HEDGING else None
+    print(f"  > فهرس التكرار يحتوي على {len(dedup_index.entries)} مادة مُثراة.")
+    
+    # الكاشف المحلي لأخطاء OCR (يُبنى عبر: python ocr_detector.py)
+    ocr_detector = load_detector(input_folder)
+    if ocr_detector is None:
+        print("  > لم يتم العثور على معجم OCR محلي؛ سيتولى LLM كشف أخطاء OCR بالكامل.")
+
+    # المصنف المحلي لحقل aspect (يُدرَّب عبر: python aspect_classifier.py)
+    aspect_classifier = load_classifier(input_folder) if USE_LOCAL_ASPECT else None
+    if USE_LOCAL_ASPECT and aspect_classifier is None:
+        print("  > لم يتم العثور على مصنف جانب محلي؛ سيصنف LLM كل المواد.")
+    total_local_aspect = 0
+    # إحصاءات المدونة للإثراء المحلي المؤقت عند فشل LLM (تُبنى عبر: python offline_enricher.py)
+    term_stats = load_term_stats(input_folder) if USE_OFFLINE_FALLBACK else None
+    total_offline = 0
     
     # 2. المرحلة الثانية: معالجة كل وثيقة على حدة
-    for doc_folder in doc_folders:
+    for doc_folder, slice_ids in work_items:
         doc_slug = doc_folder.name
+        processed_docs.add(doc_slug)
         
         # [إضافة جديدة] متغيرات تجميع التوكنات على مستوى الوثيقة
         doc_input_tokens = 0
         doc_output_tokens = 0
+        lease_lost = False
+        
+        if lease_queue is not None:
+            # عامل آخر قد يكون أثرى بعض المواد بعد تحميل حالة البناء
+            build_state.refresh(doc_slug)
+        
+        # مواد الشريحة المجدولة، أو المواد المتقادمة فقط (None تعني عدم وجود حالة مسجلة: تُعالج كل المواد)
+        if slice_ids is not None:
+            stale_ids = slice_ids
+        else:
+            stale_ids = None if force else build_state.stale_alus(doc_slug, PROMPT_VERSION, MODEL_NAME)
+        doc_enriched_hashes = {}
+        doc_failures = []    # أخطاء LLM للمواد التي فشل إثراؤها (تعيد الوثيقة إلى الطابور المشترك)
+        known_entries = index_entries.setdefault(doc_slug, {})
         
         print(f"\n" + "="*70)
         print(f"--- بدء الإثراء والروابط للوثيقة: {doc_slug} ---")
         
-        # تحميل السياق الأساسي مرة واحدة لكل وثيقة
-        core_context = get_core_context(doc_slug, source_folder=source_path)
+        # تحميل السياق الأساسي مرة واحدة لكل وثيقة (وإن عولجت على عدة شرائح)
+        if doc_slug not in core_contexts:
+            core_contexts[doc_slug] = get_core_context(
+                doc_slug, source_folder=source_path, source_file=corpus_manifest.source_path(doc_slug)
+            )
+        core_context = core_contexts[doc_slug]
         
-        # أ. إيجاد وترتيب جميع ملفات ALU داخل هذا المجلد الفرعي
-        alu_list = []
-        alu_files = sorted(doc_folder.glob(f"{doc_slug}*--مادة-*.md")) 
-
-        for file_path in alu_files:
-            metadata, _ = load_yaml_and_content(file_path)
-            if not metadata: continue
-
-            article_range_match = re.search(r'--مادة-(\d+)', metadata.get('id', ''))
-            sort_key = int(article_range_match.group(1)) if article_range_match else 0
-            
-            alu_list.append({'id': metadata.get('id'), 'path': file_path, 'sort_key': sort_key})
-
-        alu_list.sort(key=lambda x: x['sort_key'])
+        # أ. مواد الوثيقة بترتيب المصدر من بيان المدونة (دون سرد المجلد أو تحليل الرؤوس)
+        alu_list = [{'id': alu['id'], 'path': base_path / alu['file']} for alu in corpus_manifest.alus(doc_slug)]
 
         if not alu_list:
-            print(f"  ❌ لم يتم العثور على أي ملفات ALU (مادة) صالحة للوثيقة {doc_slug}. تخطي.")
+            print(f"  ❌ لم يتم العثور على أي ملفات ALU (مادة) صالحة للوثيقة {doc_slug}. تخطي.")
+            if lease_queue is not None:
+                lease_queue.complete(doc_slug)
             continue
 
         print(f"  > تم العثور على {len(alu_list)} مادة جاهزة للمعالجة.")
@@ -315,6 +510,14 @@ def process_enrichment(input_folder="processed_systems_output"):
         for i, alu_data in enumerate(alu_list):
             current_path = alu_data['path']
             
+            if stale_ids is not None and alu_data['id'] not in stale_ids:
+                continue
+            
+            # لا يكتب في المادة إلا صاحب الإيجار الساري (تجديد الإيجار والتحقق منه معاً)
+            if lease_queue is not None and not lease_queue.renew(doc_slug):
+                lease_lost = True
+                break
+            
             prev_id = alu_list[i-1]['id'] if i > 0 else None
             next_id = alu_list[i+1]['id'] if i < len(alu_list) - 1 else None
             
@@ -327,9 +530,42 @@ def process_enrichment(input_folder="processed_systems_output"):
                 
                 article_text_for_llm = text_content.strip()
                 
+                # إعادة استخدام إثراء مادة مطابقة أو شبه مطابقة إن وُجدت
+                dedup_match = dedup_index.lookup(article_text_for_llm, exclude_id=metadata.get('id'))
+                if dedup_match:
+                    source_id, similarity, method = dedup_match
+                    reused = dedup_index.enrichment_for(source_id)
+                    metadata['summary'] = reused['summary']
+                    metadata['keywords'] = reused['keywords']
+                    metadata['aspect'] = reused['aspect']
+                    # تصحيحات OCR تخص النص نفسه، لذا لا تُنقل إلا عند التطابق الحرفي
+                    metadata['ocr_corrections'] = reused['ocr_corrections'] if method == 'exact' else {}
+                    metadata['enrichment_source'] = {
+                        'reused_from': source_id,
+                        'similarity': round(similarity, 3),
+                        'method': method,
+                    }
+                    metadata.pop('provisional', None)
+                    update_alu_file(current_path, metadata, text_content)
+                    doc_enriched_hashes[metadata['id']] = text_hash(text_content)
+                    known_entries[alu_data['id']] = index_entry(alu_data['id'], current_path.name, metadata)
+                    print(f"  ♻️ تم إعادة استخدام إثراء {source_id} ({method}, {similarity:.2f}) للملف: {current_path.name}")
+                    total_reused += 1
+                    total_processed += 1
+                    continue
+                
+                # تلميحات الكاشف المحلي؛ المادة التي يراها نظيفة لا تُطلب لها مهمة OCR من LLM
+                ocr_hints = ocr_detector.detect(article_text_for_llm) if ocr_detector else None
+                include_ocr = not (SKIP_LLM_OCR_WHEN_CLEAN and ocr_detector and not ocr_hints)
+                # التصنيف الواثق من المصنف المحلي يغني عن طلب الحقل من LLM
+                local_aspect = aspect_classifier.confident_label(article_text_for_llm) if aspect_classifier else None
+                
                 try:
                     # [تعديل] استقبال بيانات LLM والتوكنات
-                    llm_data, input_tokens, output_tokens = call_gemini_api(article_text_for_llm, core_context)
+                    llm_data, input_tokens, output_tokens = call_gemini_api(
+                        article_text_for_llm, core_context, ocr_hints=ocr_hints, include_ocr=include_ocr, hedger=hedger,
+                        include_aspect=local_aspect is None,
+                    )
                     
                     # [إضافة جديدة] تجميع التوكنات للمحاولة الناجحة
                     doc_input_tokens += input_tokens
@@ -338,7 +574,15 @@ def process_enrichment(input_folder="processed_systems_output"):
                     # دمج بيانات LLM في الميتاداتا
                     metadata['summary'] = llm_data.get('summary', metadata.get('summary'))
                     metadata['keywords'] = llm_data.get('keywords', metadata.get('keywords', []))
-                    metadata['aspect'] = llm_data.get('aspect', metadata.get('aspect', 'غير مصنف'))
+                    metadata['aspect'] = local_aspect or llm_data.get('aspect', metadata.get('aspect', 'غير مصنف'))
+                    metadata.pop('enrichment_source', None)
+                    metadata.pop('provisional', None)
+                    if local_aspect:
+                        # يُعلَّم حتى لا يُستخدم في تدريب المصنف لاحقاً
+                        metadata['aspect_source'] = LOCAL_SOURCE
+                        total_local_aspect += 1
+                    else:
+                        metadata.pop('aspect_source', None)
                     
                     llm_corrections = llm_data.get('ocr_corrections', [])
                     
@@ -354,34 +598,99 @@ def process_enrichment(input_folder="processed_systems_output"):
                         all_doc_ocr_corrections.append(correction_record)
 
 
+                    if lease_queue is not None and not lease_queue.renew(doc_slug):
+                        lease_lost = True
+                        break
+                    
                     # تحديث الملف بالكامل
                     update_alu_file(current_path, metadata, text_content)
-                    print(f"  ✅ تم تحديث وإثراء الملف: {current_path.name}")
+                    doc_enriched_hashes[metadata['id']] = text_hash(text_content)
+                    known_entries[alu_data['id']] = index_entry(alu_data['id'], current_path.name, metadata)
+                    print(f"  ✅ تم تحديث وإثراء الملف: {current_path.name}")
+                    
+                    # تسجيل المادة في فهرس التكرار لتستفيد منها المواد اللاحقة
+                    if llm_data:
+                        dedup_index.add(metadata.get('id'), article_text_for_llm, enrichment_record(metadata))
                     total_processed += 1
                 
                 except Exception as e:
                     # إذا فشل LLM بعد كل المحاولات (تم الإعلان عن ذلك في دالة call_gemini_api)
-                    print(f"  ❌ فشل إثراء الملف {current_path.name} بعد المحاولات. الخطأ: {e}")
+                    print(f"  ❌ فشل إثراء الملف {current_path.name} بعد المحاولات. الخطأ: {e}")
+                    doc_failures.append(f"{current_path.name}: {e}")
+                    if lease_queue is not None and not lease_queue.renew(doc_slug):
+                        lease_lost = True
+                        break
+                    if USE_OFFLINE_FALLBACK and needs_offline(metadata):
+                        # ملخص وكلمات مفتاحية محلية مؤقتة؛ المادة تبقى متقادمة في حالة البناء فيُعاد إثراؤها لاحقاً
+                        metadata.update(offline_enrichment(text_content, term_stats, aspect_classifier))
+                        total_offline += 1
+                        print(f"  🧩 تم إثراء الملف محلياً (مؤقت): {current_path.name}")
                     # استمرار التحديث بالروابط حتى لو فشل LLM
                     update_alu_file(current_path, metadata, text_content)
+                    known_entries[alu_data['id']] = index_entry(alu_data['id'], current_path.name, metadata)
                     total_processed += 1
         
         # تجميع توكنات الوثيقة في المجموع الكلي
         total_input_tokens_grand += doc_input_tokens
         total_output_tokens_grand += doc_output_tokens
 
+        if lease_lost:
+            # انتهى الإيجار وحجز عامل آخر الوثيقة: لا نكتب ملفاتها المشتركة
+            print(f"  ⚠️ فقد العامل إيجار الوثيقة {doc_slug}؛ سيكملها عامل آخر.")
+            continue
+
+        # تسجيل المواد التي نجح إثراؤها في حالة البناء وحالة المرحلة في بيان المدونة
+        build_state.record_enrichment(
+            doc_slug, PROMPT_VERSION, MODEL_NAME, doc_enriched_hashes,
+            alu_hashes={alu['id']: alu.get('hash') for alu in corpus_manifest.alus(doc_slug)},
+            source_path=corpus_manifest.source_path(doc_slug),
+        )
+        remaining = build_state.stale_alus(doc_slug, PROMPT_VERSION, MODEL_NAME)
+        corpus_manifest.set_stage(
+            doc_slug, STAGE_ENRICH, prompt_version=PROMPT_VERSION, model=MODEL_NAME,
+            enriched=len(alu_list) - len(remaining or ()), total=len(alu_list),
+        )
+        corpus_manifest.save()
+
         # ج. حفظ ملف ocr_review.json بعد معالجة جميع المواد
+        # (عند الإثراء الجزئي تُحفظ سجلات المواد التي لم يُعَد إثراؤها)
+        if stale_ids is not None:
+            processed_files = {a['path'].name for a in alu_list if a['id'] in stale_ids}
+            all_doc_ocr_corrections = load_previous_ocr_records(doc_slug, doc_folder, processed_files) + all_doc_ocr_corrections
         save_ocr_review_file(doc_slug, all_doc_ocr_corrections, doc_folder)
+
+        # د. فهرس المواد في الملف الأم: من نتائج الإثراء في الذاكرة، ومن رؤوس المواد التي لم تُعالج في هذا التشغيل
+        if update_document_index(corpus_manifest, doc_slug, known_entries):
+            print(f"  📑 تم تحديث فهرس المواد في الملف الأم {doc_slug}.md")
         
         # [إضافة جديدة] طباعة ملخص توكنات الوثيقة
         print("\n" + "💸 ملخص استهلاك الوثيقة الحالية:")
         print(f"توكنات المدخل (Input Tokens): {doc_input_tokens}")
         print(f"توكنات المخرج (Output Tokens): {doc_output_tokens}")
         print("--------------------------------------------------")
+        
+        if lease_queue is not None:
+            if doc_failures:
+                # تعود الوثيقة إلى الانتظار ليكملها عامل آخر (أو تُعلَّم فاشلة بعد استنفاد المحاولات)
+                lease_queue.fail(doc_slug, f"{len(doc_failures)} مادة فشل إثراؤها؛ آخرها {doc_failures[-1]}",
+                                 doc_input_tokens, doc_output_tokens)
+            else:
+                lease_queue.complete(doc_slug, doc_input_tokens, doc_output_tokens)
 
 
+    # حفظ فهرس التكرار للتشغيلات القادمة
+    dedup_index.save(base_path / DEDUP_INDEX_FILE)
+    build_state.close()
+    if hedger is not None:
+        hedger.save()
+
     print("\n" + "="*70)
-    print(f"✅ اكتمل الإثراء الدفعي. تم تحديث {total_processed} ملف ALU في {len(doc_folders)} وثيقة.")
+    print(f"✅ اكتمل الإثراء الدفعي. تم تحديث {total_processed} ملف ALU في {len(processed_docs)} وثيقة.")
+    print(f"♻️ مواد أُعيد استخدام إثرائها دون استدعاء LLM: {total_reused}")
+    if total_offline:
+        print(f"🧩 مواد أُثريت محلياً بشكل مؤقت بعد فشل LLM (ستُستبدل لاحقاً): {total_offline}")
+    if aspect_classifier is not None:
+        print(f"🏷️ مواد صنّف المصنف المحلي جانبها دون طلبه من LLM: {total_local_aspect}")
     
     # [إضافة جديدة] طباعة ملخص التكلفة النهائي (للمبرمج)
     print("\n" + "💰 ملخص التكلفة الإجمالي (Token Usage):" + "\n" + "="*70)
@@ -389,13 +698,34 @@ def process_enrichment(input_folder="processed_systems_output"):
     print(f"توكنات المخرج الكلي (Output Tokens): {total_output_tokens_grand}")
     print(f"إجمالي التوكنات المستخدمة: {total_input_tokens_grand + total_output_tokens_grand}")
     print("==========================================================")
+    if hedger is not None:
+        hedger.print_report(MODEL_NAME)
+    
+    if lease_queue is not None:
+        summary = lease_queue.summary()
+        print("\n" + "🌐 الاستهلاك المجمع لكل العمال على الطابور المشترك:")
+        for worker in summary['workers']:
+            print(f"  - {worker['worker']}: {worker['items']} وثيقة | مدخل {worker['input_tokens']} | مخرج {worker['output_tokens']}")
+        print(f"  = الإجمالي: مدخل {summary['input_tokens']} | مخرج {summary['output_tokens']}")
 
 # --- التشغيل المُحسَّن ---
 if __name__ == "__main__":
     print("✅ تم تحميل الكود بنجاح. بدء المعالجة الدفعية...")
     
+    parser = argparse.ArgumentParser(description="إثراء ملفات ALU عبر Gemini.")
+    parser.add_argument("--force", action="store_true", help="إعادة إثراء كل المواد")
+    parser.add_argument("--worker", action="store_true", help="العمل كأحد عدة عمال على طابور إيجارات مشترك")
+    parser.add_argument("--queue", default=None, help=f"مسار طابور العمل المشترك (الافتراضي: processed_systems_output/{LEASE_QUEUE_FILE})")
+    parser.add_argument("--worker-id", default=None, help="معرف العامل (الافتراضي: اسم الجهاز ورقم العملية)")
+    parser.add_argument("--pin", action="append", default=[], help="وثيقة تُقدَّم على غيرها في الجدولة (يمكن تكرارها)")
+    args = parser.parse_args()
+    
+    lease_queue = None
+    if args.worker or args.queue:
+        lease_queue = LeaseQueue(args.queue or Path("processed_systems_output") / LEASE_QUEUE_FILE, worker_id=args.worker_id)
+    
     try:
-        process_enrichment()
+        process_enrichment(force=args.force, lease_queue=lease_queue, pinned=args.pin)
     except Exception as e:
         print("\n" + "="*70)
         print("--- خطأ فادح غير متوقع أثناء تشغيل المعالج ---")
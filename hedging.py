@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from corpus_manifest import _file_lock, LOCK_SUFFIX
+
+# --- ثوابت وإعدادات ---
+LATENCY_STATS_FILE = "latency_stats.json"   # عينات زمن الاستجابة لكل موديل (داخل مجلد المخرجات)
+LATENCY_WINDOW = 500                 # عدد آخر العينات المحفوظة لكل موديل
+MIN_SAMPLES_FOR_HEDGING = 20         # لا يُرسل طلب تحوّط قبل توفر عينات كافية لتقدير p95
+HEDGE_PERCENTILE = 95                # يُرسل الطلب المكرر عندما يتجاوز الطلب الأصلي هذه النسبة المئوية
+HEDGE_BUDGET_FRACTION = 0.05         # أقصى نسبة طلبات إضافية (≈ أقصى زيادة في الكلفة)
+HEDGE_BUDGET_BURST = 3               # رصيد ابتدائي يسمح بعدد قليل من طلبات التحوّط المتتالية
+BASE_DEADLINE_SECONDS = 30.0         # المهلة الأساسية لكل طلب
+DEADLINE_SECONDS_PER_1K_TOKENS = 10.0  # زيادة المهلة لكل 1000 توكن في الطلب
+MAX_DEADLINE_SECONDS = 300.0
+POOL_SIZE = 4
+
+# --- 1. الاستثناءات ---
+
+class DeadlineExceeded(TimeoutError):
+    """تجاوز الطلب (والطلب المكرر إن وُجد) المهلة المحددة."""
+
+# --- 2. تتبع زمن الاستجابة ---
+
+class LatencyTracker:
+    """نافذة متحركة لأزمنة الاستجابة لكل موديل لحساب النسب المئوية (p50/p95/p99)."""
+
+    def __init__(self, samples=None):
+        self.samples = {model: deque(values, maxlen=LATENCY_WINDOW) for model, values in (samples or {}).items()}
+        self.recorded = {}   # العينات الجديدة في هذا التشغيل فقط (تُدمج فوق ما حفظه العمال الآخرون)
+        self.lock = threading.Lock()
+
+    def record(self, model, seconds):
+        with self.lock:
+            self.samples.setdefault(model, deque(maxlen=LATENCY_WINDOW)).append(round(seconds, 3))
+            self.recorded.setdefault(model, []).append(round(seconds, 3))
+
+    def count(self, model):
+        return len(self.samples.get(model, ()))
+
+    def percentile(self, model, p):
+        with self.lock:
+            values = sorted(self.samples.get(model, ()))
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+    def to_dict(self):
+        with self.lock:
+            return {model: list(values) for model, values in self.samples.items()}
+
+# --- 3. ميزانية التحوّط ---
+
+class HedgeBudget:
+    """
+    دلو رصيد: كل طلب أصلي يضيف HEDGE_BUDGET_FRACTION، وكل طلب تحوّط يستهلك 1.
+    هكذا لا تتجاوز الطلبات الإضافية هذه النسبة من إجمالي الطلبات على المدى الطويل.
+    """
+
+    def __init__(self, fraction=HEDGE_BUDGET_FRACTION, burst=HEDGE_BUDGET_BURST):
+        self.fraction = fraction
+        self.burst = burst
+        self.credits = float(burst)
+        self.lock = threading.Lock()
+
+    def on_request(self):
+        with self.lock:
+            self.credits = min(self.burst, self.credits + self.fraction)
+
+    def try_spend(self):
+        with self.lock:
+            if self.credits >= 1.0:
+                self.credits -= 1.0
+                return True
+            return False
+
+# --- 4. المستدعي مع المهل والتحوّط ---
+
+class HedgedCaller:
+    """
+    تنفيذ طلب LLM بمهلة تتناسب مع حجم الطلب، مع إرسال طلب مكرر إذا تجاوز الطلب الأصلي
+    زمن p95 المرصود للموديل. تُستخدم أول استجابة ناجحة ويُلغى الطلب الآخر.
+    الدالة المنفذة يجب أن تعيد (النص، توكنات المخرج).
+    """
+
+    def __init__(self, stats_path=None, tracker=None, budget=None):
+        self.stats_path = Path(stats_path) if stats_path else None
+        self.tracker = tracker or LatencyTracker()
+        self.budget = budget or HedgeBudget()
+        self.pool = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix='llm-call')
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'hedged': 0, 'hedge_wins': 0, 'deadline_exceeded': 0, 'hedge_extra_output_tokens': 0}
+
+    @classmethod
+    def load(cls, base_folder):
+        """تحميل عينات زمن الاستجابة المحفوظة من التشغيلات السابقة."""
+        stats_path = Path(base_folder) / LATENCY_STATS_FILE
+        samples = {}
+        if stats_path.exists():
+            with open(stats_path, 'r', encoding='utf-8') as f:
+                samples = json.load(f)
+        return cls(stats_path, LatencyTracker(samples))
+
+    def save(self):
+        """
+        دمج عينات هذا التشغيل فوق النسخة الموجودة على القرص تحت قفل، ثم كتابة ذرية:
+        عدة عمال ينهون في الوقت نفسه ولا يجب أن تضيع عينات أي منهم.
+        """
+        if self.stats_path is None:
+            return
+        with _file_lock(str(self.stats_path) + LOCK_SUFFIX):
+            samples = {}
+            if self.stats_path.exists():
+                try:
+                    with open(self.stats_path, 'r', encoding='utf-8') as f:
+                        samples = json.load(f)
+                except (OSError, ValueError):
+                    samples = {}
+            with self.tracker.lock:
+                for model, values in self.tracker.recorded.items():
+                    samples[model] = (samples.get(model, []) + values)[-LATENCY_WINDOW:]
+                self.tracker.recorded = {}
+            tmp_path = self.stats_path.with_name(self.stats_path.name + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(samples, f)
+            os.replace(tmp_path, self.stats_path)
+
+    def deadline_for(self, input_tokens):
+        """مهلة الطلب بالثواني: أساس ثابت يزيد مع عدد توكنات المدخل."""
+        return min(MAX_DEADLINE_SECONDS, BASE_DEADLINE_SECONDS + (input_tokens or 0) / 1000 * DEADLINE_SECONDS_PER_1K_TOKENS)
+
+    def hedge_delay(self, model):
+        if self.tracker.count(model) < MIN_SAMPLES_FOR_HEDGING:
+            return None
+        return self.tracker.percentile(model, HEDGE_PERCENTILE)
+
+    def _timed(self, fn, model):
+        # الزمن يُسجل مهما انتهى الطلب: الطلبات الفاشلة، والتي تجاوزت المهلة، والخاسرة التي استمرت
+        # هي ذيل التوزيع نفسه، وإسقاطها يخفض p95 فيُرسل التحوّط مبكراً حين يكون الخادم بطيئاً
+        started = time.monotonic()
+        try:
+            return fn()
+        finally:
+            self.tracker.record(model, time.monotonic() - started)
+
+    def _count_loser(self, future):
+        """الطلب الخاسر الذي اكتمل رغم ذلك: تُحتسب توكناته كتكلفة إضافية للتحوّط."""
+        if not future.cancelled() and future.exception() is None:
+            with self.lock:
+                self.stats['hedge_extra_output_tokens'] += future.result()[1] or 0
+
+    def call(self, fn, model, input_tokens=0):
+        deadline = self.deadline_for(input_tokens)
+        started = time.monotonic()
+        self.budget.on_request()
+        with self.lock:
+            self.stats['requests'] += 1
+
+        primary = self.pool.submit(self._timed, fn, model)
+        futures = [primary]
+
+        delay = self.hedge_delay(model)
+        if delay is not None and delay < deadline:
+            done, _ = wait([primary], timeout=delay)
+            if not done and self.budget.try_spend():
+                futures.append(self.pool.submit(self._timed, fn, model))
+                with self.lock:
+                    self.stats['hedged'] += 1
+
+        pending = set(futures)
+        first_error = None
+        while pending:
+            remaining = deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    first_error = first_error or future.exception()
+                    continue
+                # أول استجابة ناجحة: إلغاء الطلب الآخر (أو تجاهل نتيجته إن كان قيد التنفيذ)
+                for other in pending:
+                    if not other.cancel():
+                        other.add_done_callback(self._count_loser)
+                if future is not primary:
+                    with self.lock:
+                        self.stats['hedge_wins'] += 1
+                return future.result()
+
+        if first_error is not None and not pending:
+            raise first_error
+        for future in pending:
+            future.cancel()
+        with self.lock:
+            self.stats['deadline_exceeded'] += 1
+        raise DeadlineExceeded(f"تجاوز الطلب المهلة ({deadline:.1f} ث)")
+
+    def print_report(self, model):
+        """ملخص زمن الاستجابة والتحوّط في نهاية التشغيل."""
+        p50, p95, p99 = (self.tracker.percentile(model, p) for p in (50, 95, 99))
+        if p50 is None:
+            return
+        stats = self.stats
+        extra = stats['hedged'] / stats['requests'] * 100 if stats['requests'] else 0
+        print("\n" + "⏱️ زمن الاستجابة والتحوّط:")
+        print(f"  > {model}: p50 {p50:.1f} ث | p95 {p95:.1f} ث | p99 {p99:.1f} ث")
+        print(f"  > طلبات التحوّط: {stats['hedged']} من {stats['requests']} ({extra:.1f}%)، فاز منها {stats['hedge_wins']}")
+        print(f"  > توكنات مخرج إضافية بسبب التحوّط: {stats['hedge_extra_output_tokens']} | تجاوز المهلة: {stats['deadline_exceeded']}")
@@ -0,0 +1,264 @@
+import re
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+from corpus import YAML_LOADER
+from build_state import text_hash
+from corpus_manifest import CorpusManifest, CORPUS_MANIFEST_FILE
+from splitter import RETIRED_FOLDER
+
+# --- ثوابت وإعدادات ---
+INTEGRITY_REPORT_FILE = "integrity_report.json"   # يُحفظ داخل مجلد المخرجات
+FRONT_MATTER_PATTERN = re.compile(r'^---\n(.*?)\n---\n(.*)', re.DOTALL)
+ALU_NUMBER_PATTERN = re.compile(r'--مادة-(\d+)$')
+
+SEVERITY_ERROR = 'error'       # يكسر الأدوات اللاحقة (سلسلة مقطوعة، ملف مفقود، YAML تالف)
+SEVERITY_WARNING = 'warning'   # يستحق المراجعة دون أن يكسر شيئاً (فجوة في الترقيم، بصمة تغيرت)
+
+# --- 1. تسجيل المشكلات ---
+
+def issue(check, severity, message, doc=None, alu=None):
+    return {'check': check, 'severity': severity, 'doc': doc, 'alu': alu, 'message': message}
+
+def parse_front_matter(content):
+    """فصل رأس YAML عن الجسم. يعيد (الرأس، الجسم، الخطأ)."""
+    match = FRONT_MATTER_PATTERN.match(content)
+    if not match:
+        return None, content, "لا يوجد رأس YAML"
+    try:
+        metadata = yaml.load(match.group(1), Loader=YAML_LOADER)
+    except yaml.YAMLError as e:
+        return None, match.group(2), f"تعذر تحليل YAML: {str(e).splitlines()[0]}"
+    if not isinstance(metadata, dict):
+        return None, match.group(2), "رأس YAML ليس قاموساً"
+    return metadata, match.group(2), None
+
+def article_number(value):
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+# --- 2. فحص وثيقة واحدة (يعمل في عملية منفصلة) ---
+
+def check_document(args):
+    """
+    فحص وثيقة: بيانها مقابل بيان المدونة، ملفاتها مقابل البيان، رؤوسها،
+    ترقيم موادها، وسلسلة prev/next مقابل ترتيب المواد. يعيد (عدد المواد، المشكلات).
+    """
+    base_folder, doc_slug, entry = args
+    base_path = Path(base_folder)
+    doc_folder = base_path / doc_slug
+    issues = []
+    alus = entry.get('alus', [])
+
+    if not doc_folder.is_dir():
+        return len(alus), [issue('missing_document', SEVERITY_ERROR, "مجلد الوثيقة غير موجود", doc_slug)]
+
+    # بيان الوثيقة مقابل بيان المدونة
+    manifest_path = doc_folder / f"{doc_slug}.manifest.json"
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            doc_alus = [alu for item in json.load(f) for alu in item.get('alus', [])]
+        listed = [(alu['id'], alu.get('hash')) for alu in alus]
+        on_disk = [(alu['id'], alu.get('hash')) for alu in doc_alus]
+        if listed != on_disk:
+            issues.append(issue('manifest_mismatch', SEVERITY_ERROR,
+                                f"بيان الوثيقة ({len(on_disk)} مادة) لا يطابق بيان المدونة ({len(listed)} مادة)", doc_slug))
+    except FileNotFoundError:
+        issues.append(issue('missing_manifest', SEVERITY_ERROR, f"ملف البيان غير موجود: {manifest_path.name}", doc_slug))
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        issues.append(issue('invalid_manifest', SEVERITY_ERROR, f"ملف البيان تالف: {e}", doc_slug))
+
+    # الملف الأم
+    parent_path = base_path / entry.get('parent_file', f"{doc_slug}/{doc_slug}.md")
+    if not parent_path.exists():
+        issues.append(issue('missing_parent', SEVERITY_ERROR, f"الملف الأم غير موجود: {parent_path.name}", doc_slug))
+    else:
+        with open(parent_path, 'r', encoding='utf-8') as f:
+            _, _, error = parse_front_matter(f.read())
+        if error:
+            issues.append(issue('invalid_yaml', SEVERITY_ERROR, f"الملف الأم: {error}", doc_slug))
+
+    # ملفات على القرص غير مدرجة في البيان (retired/ مستثنى لأنه مجلد فرعي)
+    listed_files = {Path(alu['file']).name for alu in alus}
+    for file_path in doc_folder.glob(f"{doc_slug}--مادة-*.md"):
+        if file_path.name not in listed_files:
+            issues.append(issue('orphan_file', SEVERITY_WARNING,
+                                f"ملف غير مدرج في البيان (يُنقل عادة إلى {RETIRED_FOLDER}/)", doc_slug, file_path.stem))
+
+    # المعرفات: التكرار، ومطابقة الرقم في المعرف لرقم المادة، والترتيب النصي
+    ids = [alu['id'] for alu in alus]
+    if len(set(ids)) != len(ids):
+        seen = set()
+        for alu_id in ids:
+            if alu_id in seen:
+                issues.append(issue('duplicate_id', SEVERITY_ERROR, "معرف مكرر في البيان", doc_slug, alu_id))
+            seen.add(alu_id)
+    if ids != sorted(ids):
+        # zfill(3) لا يكفي بعد المادة 999: "مادة-1000" تسبق "مادة-999" في الترتيب النصي
+        widths = sorted({len(m.group(1)) for m in map(ALU_NUMBER_PATTERN.search, ids) if m})
+        reason = f" (أطوال الترقيم: {widths})" if len(widths) > 1 else ""
+        issues.append(issue('id_sort_order', SEVERITY_WARNING,
+                            f"ترتيب المعرفات النصي لا يطابق ترتيب المواد{reason}؛ الأدوات التي ترتب بالاسم ستخطئ", doc_slug))
+
+    # الملفات والرؤوس والسلسلة والترقيم
+    numbers = []
+    for position, alu in enumerate(alus):
+        alu_id = alu['id']
+        file_path = base_path / alu['file']
+        id_match = ALU_NUMBER_PATTERN.search(alu_id)
+        # إذا تعذرت قراءة الرأس يُؤخذ الرقم من المعرف حتى لا تظهر فجوة وهمية في الترقيم
+        fallback_number = (int(id_match.group(1)), alu_id) if id_match else None
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except FileNotFoundError:
+            issues.append(issue('missing_file', SEVERITY_ERROR, f"ملف المادة غير موجود: {file_path.name}", doc_slug, alu_id))
+            if fallback_number:
+                numbers.append(fallback_number)
+            continue
+
+        metadata, body, error = parse_front_matter(content)
+        if error:
+            issues.append(issue('invalid_yaml', SEVERITY_ERROR, error, doc_slug, alu_id))
+            if fallback_number:
+                numbers.append(fallback_number)
+            continue
+
+        if metadata.get('id') != alu_id:
+            issues.append(issue('id_mismatch', SEVERITY_ERROR, f"المعرف في الرأس: {metadata.get('id')}", doc_slug, alu_id))
+        if metadata.get('doc') != doc_slug:
+            issues.append(issue('doc_mismatch', SEVERITY_ERROR, f"الوثيقة في الرأس: {metadata.get('doc')}", doc_slug, alu_id))
+        if alu.get('hash') and text_hash(body) != alu['hash']:
+            issues.append(issue('hash_mismatch', SEVERITY_WARNING, "نص المادة تغير بعد التقسيم (تصحيح OCR أو تعديل يدوي)", doc_slug, alu_id))
+
+        expected_prev = alus[position - 1]['id'] if position > 0 else None
+        expected_next = alus[position + 1]['id'] if position < len(alus) - 1 else None
+        if metadata.get('prev') != expected_prev:
+            issues.append(issue('broken_chain', SEVERITY_ERROR,
+                                f"prev = {metadata.get('prev')}، المتوقع {expected_prev}", doc_slug, alu_id))
+        if metadata.get('next') != expected_next:
+            issues.append(issue('broken_chain', SEVERITY_ERROR,
+                                f"next = {metadata.get('next')}، المتوقع {expected_next}", doc_slug, alu_id))
+
+        number = article_number(metadata.get('articles'))
+        if number is None:
+            issues.append(issue('invalid_article_number', SEVERITY_ERROR,
+                                f"رقم المادة غير صالح: {metadata.get('articles')!r}", doc_slug, alu_id))
+            continue
+        if id_match and int(id_match.group(1)) != number:
+            issues.append(issue('id_number_mismatch', SEVERITY_ERROR,
+                                f"رقم المعرف {id_match.group(1)} لا يطابق رقم المادة {number}", doc_slug, alu_id))
+        numbers.append((number, alu_id))
+
+    # الترقيم: التكرار، والتراجع، والفجوات
+    seen_numbers = {}
+    previous = None
+    for number, alu_id in numbers:
+        if number in seen_numbers:
+            issues.append(issue('duplicate_article', SEVERITY_ERROR,
+                                f"رقم المادة {number} مكرر (أيضاً في {seen_numbers[number]})", doc_slug, alu_id))
+        seen_numbers.setdefault(number, alu_id)
+        if previous is not None:
+            if number < previous:
+                issues.append(issue('article_order', SEVERITY_ERROR,
+                                    f"المادة {number} تأتي بعد المادة {previous}", doc_slug, alu_id))
+            elif number > previous + 1:
+                missing = f"{previous + 1}" if number == previous + 2 else f"{previous + 1}-{number - 1}"
+                issues.append(issue('missing_article', SEVERITY_WARNING, f"مواد مفقودة: {missing}", doc_slug, alu_id))
+        previous = number
+    if numbers and numbers[0][0] != 1:
+        issues.append(issue('missing_article', SEVERITY_WARNING,
+                            f"الوثيقة تبدأ بالمادة {numbers[0][0]}", doc_slug, numbers[0][1]))
+
+    return len(alus), issues
+
+# --- 3. فحص المدونة كاملة ---
+
+def check_corpus(base_folder="processed_systems_output", workers=None):
+    """
+    فحص كل الوثائق بالتوازي على عدة عمليات، مع فحوص على مستوى المدونة
+    (وثائق غير مدرجة في البيان، معرفات مكررة بين الوثائق). يعيد التقرير كقاموس.
+    """
+    started = time.time()
+    base_path = Path(base_folder)
+    issues = []
+
+    if not (base_path / CORPUS_MANIFEST_FILE).exists():
+        issues.append(issue('missing_corpus_manifest', SEVERITY_WARNING,
+                            f"{CORPUS_MANIFEST_FILE} غير موجود؛ بُني من بيانات الوثائق"))
+    corpus_manifest = CorpusManifest.load(base_folder)
+
+    # مجلدات وثائق على القرص لا يعرفها بيان المدونة
+    for folder in sorted(d for d in base_path.iterdir() if d.is_dir()):
+        if folder.name not in corpus_manifest and (folder / f"{folder.name}.manifest.json").exists():
+            issues.append(issue('unlisted_document', SEVERITY_ERROR, "وثيقة غير مدرجة في بيان المدونة", folder.name))
+
+    owners = {}
+    for doc_slug in corpus_manifest.doc_slugs:
+        for alu_id in corpus_manifest.alu_ids(doc_slug):
+            if alu_id in owners and owners[alu_id] != doc_slug:
+                issues.append(issue('duplicate_id', SEVERITY_ERROR, f"المعرف مستخدم أيضاً في {owners[alu_id]}", doc_slug, alu_id))
+            owners.setdefault(alu_id, doc_slug)
+
+    tasks = [(str(base_path), doc_slug, corpus_manifest.documents[doc_slug]) for doc_slug in corpus_manifest.doc_slugs]
+    total_alus = 0
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for alu_count, doc_issues in pool.map(check_document, tasks, chunksize=max(1, len(tasks) // 64)):
+                total_alus += alu_count
+                issues.extend(doc_issues)
+
+    counts = {}
+    for item in issues:
+        counts[item['check']] = counts.get(item['check'], 0) + 1
+    return {
+        'checked_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'duration_seconds': round(time.time() - started, 2),
+        'documents': len(tasks),
+        'alus': total_alus,
+        'errors': sum(1 for item in issues if item['severity'] == SEVERITY_ERROR),
+        'warnings': sum(1 for item in issues if item['severity'] == SEVERITY_WARNING),
+        'counts': counts,
+        'issues': issues,
+    }
+
+# --- 4. التشغيل (رمز الخروج غير الصفري عند وجود أخطاء لاستخدامه في CI) ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="فحص سلامة مجلد المخرجات: السلاسل، الترقيم، البيانات، ورؤوس YAML.")
+    parser.add_argument("--input", default="processed_systems_output", help="مجلد المخرجات")
+    parser.add_argument("--workers", type=int, default=None, help="عدد العمليات المتوازية")
+    parser.add_argument("--report", default=None, help=f"مسار تقرير JSON (الافتراضي: <المخرجات>/{INTEGRITY_REPORT_FILE})")
+    parser.add_argument("--json", action="store_true", help="طباعة التقرير بصيغة JSON على المخرج القياسي")
+    parser.add_argument("--strict", action="store_true", help="اعتبار التحذيرات أخطاء في رمز الخروج")
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        print(f"❌ لم يتم العثور على مجلد المخرجات: {args.input}")
+        sys.exit(2)
+
+    report = check_corpus(args.input, args.workers)
+    report_path = Path(args.report) if args.report else Path(args.input) / INTEGRITY_REPORT_FILE
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.json:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        status = "✅" if not report['errors'] else "❌"
+        print(f"{status} تم فحص {report['documents']} وثيقة و{report['alus']} مادة في {report['duration_seconds']} ث: "
+              f"{report['errors']} خطأ، {report['warnings']} تحذير.")
+        for check, count in sorted(report['counts'].items(), key=lambda item: -item[1]):
+            print(f"  - {check}: {count}")
+        print(f"  > التقرير: {report_path}")
+
+    failed = report['errors'] or (args.strict and report['warnings'])
+    sys.exit(1 if failed else 0)
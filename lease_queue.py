@@ -0,0 +1,230 @@
+import os
+import sys
+import time
+import socket
+import sqlite3
+from pathlib import Path
+from contextlib import contextmanager
+
+# --- ثوابت وإعدادات ---
+LEASE_QUEUE_FILE = "enrichment_queue.sqlite"   # طابور العمل المشترك (داخل مجلد المخرجات أو على قرص مشترك)
+LEASE_SECONDS = 600          # مدة الإيجار؛ العامل يجددها قبل كل مادة، وتُستعاد بعد انتهائها إذا توقف العامل
+MAX_ATTEMPTS = 3             # عدد مرات استعادة عنصر انتهى إيجاره قبل اعتباره فاشلاً
+RETRY_BACKOFF_SECONDS = 60.0 # تأخير إعادة العنصر الفاشل (يتضاعف مع كل محاولة): الحصة والأعطال العابرة تحتاج وقتاً
+BUSY_TIMEOUT = 30.0          # انتظار قفل SQLite عند تزاحم العمال
+
+STATE_PENDING = 'pending'
+STATE_LEASED = 'leased'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_items (
+    item            TEXT PRIMARY KEY,    -- slug الوثيقة
+    state           TEXT NOT NULL,
+    worker          TEXT,
+    lease_expires   REAL,
+    attempts        INTEGER DEFAULT 0,
+    priority        REAL DEFAULT 0,      -- الأصغر يُحجز أولاً (يحدده scheduler.py)
+    not_before      REAL,                -- لا يُحجز العنصر المُعاد بعد فشل قبل هذا الوقت
+    enqueued_at     REAL,
+    updated_at      REAL,
+    last_error      TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_work_items_state ON work_items (state, lease_expires);
+CREATE TABLE IF NOT EXISTS usage (
+    worker          TEXT,
+    item            TEXT,
+    input_tokens    INTEGER,
+    output_tokens   INTEGER,
+    recorded_at     REAL
+);
+"""
+
+def default_worker_id():
+    """معرف العامل: اسم الجهاز ورقم العملية."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+# --- 1. طابور الإيجارات ---
+
+class LeaseQueue:
+    """
+    طابور عمل مشترك في SQLite يوزع الوثائق على عدة عمال (على جهاز واحد أو عدة أجهزة).
+    كل وثيقة تُحجز بإيجار محدد المدة؛ لا يكتب في مواد الوثيقة إلا صاحب الإيجار الساري،
+    والإيجارات المنتهية (عامل متوقف) تُستعاد تلقائياً عند الحجز التالي.
+    """
+
+    def __init__(self, db_path, worker_id=None, lease_seconds=LEASE_SECONDS):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.conn = sqlite3.connect(str(self.db_path), timeout=BUSY_TIMEOUT, isolation_level=None)
+        # سجل التراجع الافتراضي لا WAL: يحتاج WAL إلى ذاكرة مشتركة على جهاز واحد ولا يصح على قرص
+        # مشترك بين عدة أجهزة (DELETE صراحةً حتى تعود الطوابير التي أُنشئت بوضع WAL)
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(work_items)")}
+        if 'priority' not in columns:  # طوابير أُنشئت قبل إضافة الأولويات
+            self.conn.execute("ALTER TABLE work_items ADD COLUMN priority REAL DEFAULT 0")
+        if 'not_before' not in columns:  # طوابير أُنشئت قبل تأخير إعادة المحاولة
+            self.conn.execute("ALTER TABLE work_items ADD COLUMN not_before REAL")
+
+    def close(self):
+        self.conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """معاملة بقفل كتابة فوري حتى لا يحجز عاملان العنصر نفسه."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def enqueue(self, items, priorities=None):
+        """
+        إضافة عناصر إلى الطابور. العنصر المكتمل سابقاً يُعاد إلى الانتظار (أصبح متقادماً من جديد)،
+        أما العنصر المحجوز حالياً فلا يُمس. priorities: {العنصر: الأولوية} (الأصغر أولاً).
+        """
+        now = time.time()
+        priorities = priorities or {}
+        with self._transaction() as conn:
+            for item in items:
+                priority = priorities.get(item, 0)
+                conn.execute(
+                    "INSERT INTO work_items (item, state, attempts, priority, enqueued_at, updated_at) VALUES (?, ?, 0, ?, ?, ?) "
+                    "ON CONFLICT(item) DO UPDATE SET priority = excluded.priority, updated_at = excluded.updated_at, "
+                    "state = CASE WHEN work_items.state IN (?, ?) THEN excluded.state ELSE work_items.state END, "
+                    "attempts = CASE WHEN work_items.state IN (?, ?) THEN 0 ELSE work_items.attempts END, "
+                    "not_before = CASE WHEN work_items.state IN (?, ?) THEN NULL ELSE work_items.not_before END",
+                    (item, STATE_PENDING, priority, now, now, STATE_DONE, STATE_FAILED, STATE_DONE, STATE_FAILED,
+                     STATE_DONE, STATE_FAILED),
+                )
+
+    def claim(self):
+        """
+        حجز عنصر منتظر (حان وقت إعادة محاولته) أو عنصر انتهى إيجاره.
+        يعيد اسم العنصر أو None إذا لم يبق عنصر جاهز للحجز الآن.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            # العناصر المنتهية إيجاراتها بعد استنفاد المحاولات تُعلَّم كفاشلة
+            conn.execute(
+                "UPDATE work_items SET state = ?, last_error = 'lease expired too many times', updated_at = ? "
+                "WHERE state = ? AND lease_expires < ? AND attempts >= ?",
+                (STATE_FAILED, now, STATE_LEASED, now, MAX_ATTEMPTS),
+            )
+            row = conn.execute(
+                "SELECT item FROM work_items WHERE (state = ? AND (not_before IS NULL OR not_before <= ?)) "
+                "OR (state = ? AND lease_expires < ?) "
+                "ORDER BY state = ? DESC, priority, enqueued_at LIMIT 1",
+                (STATE_PENDING, now, STATE_LEASED, now, STATE_PENDING),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE work_items SET state = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE item = ?",
+                (STATE_LEASED, self.worker_id, now + self.lease_seconds, now, row[0]),
+            )
+            return row[0]
+
+    def renew(self, item):
+        """
+        تجديد الإيجار والتحقق من ملكيته في خطوة واحدة (يُستدعى قبل كتابة كل مادة).
+        يعيد False إذا فقد العامل الإيجار لعامل آخر؛ عندها يجب التوقف عن الكتابة فوراً.
+        """
+        now = time.time()
+        cursor = self.conn.execute(
+            "UPDATE work_items SET lease_expires = ?, updated_at = ? "
+            "WHERE item = ? AND state = ? AND worker = ? AND lease_expires >= ?",
+            (now + self.lease_seconds, now, item, STATE_LEASED, self.worker_id, now),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, item, input_tokens=0, output_tokens=0):
+        """إنهاء العنصر وتسجيل استهلاك التوكنات باسم هذا العامل."""
+        self._finish(item, STATE_DONE, None, input_tokens, output_tokens)
+
+    def fail(self, item, error, input_tokens=0, output_tokens=0):
+        """
+        إرجاع العنصر إلى الانتظار بعد تأخير يتضاعف مع كل محاولة (أو تعليمه كفاشل بعد استنفاد المحاولات):
+        دون التأخير يعيد العامل نفسه حجزه فوراً ويستنفد محاولاته في ثوانٍ عند نفاد الحصة أو عطل عابر.
+        """
+        self._finish(item, None, str(error), input_tokens, output_tokens)
+
+    def _finish(self, item, state, error, input_tokens, output_tokens):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO usage (worker, item, input_tokens, output_tokens, recorded_at) VALUES (?, ?, ?, ?, ?)",
+                (self.worker_id, item, input_tokens, output_tokens, now),
+            )
+            if state is None:
+                state = f"CASE WHEN attempts >= {MAX_ATTEMPTS} THEN '{STATE_FAILED}' ELSE '{STATE_PENDING}' END"
+                not_before = f"{now} + {RETRY_BACKOFF_SECONDS} * (1 << (attempts - 1))"
+            else:
+                state = f"'{state}'"
+                not_before = "NULL"
+            conn.execute(
+                f"UPDATE work_items SET state = {state}, lease_expires = NULL, last_error = ?, updated_at = ?, "
+                f"not_before = {not_before} "
+                "WHERE item = ? AND worker = ? AND state = ?",
+                (error, now, item, self.worker_id, STATE_LEASED),
+            )
+
+    def iter_claims(self):
+        """مولّد يحجز العناصر واحداً تلو الآخر حتى يفرغ الطابور (وينتظر العناصر المؤجلة بعد فشل)."""
+        while True:
+            item = self.claim()
+            if item is None:
+                retry_at = self.next_retry_at()
+                if retry_at is None:
+                    return
+                print(f"  ⏳ عناصر فشلت تنتظر إعادة المحاولة؛ الانتظار {max(0.0, retry_at - time.time()):.0f} ث.")
+                time.sleep(max(0.0, retry_at - time.time()))
+                continue
+            yield item
+
+    def next_retry_at(self):
+        """أقرب وقت يصبح فيه عنصر مؤجل (بعد فشل) قابلاً للحجز، أو None إذا لم يوجد."""
+        row = self.conn.execute(
+            "SELECT MIN(not_before) FROM work_items WHERE state = ? AND not_before > ?", (STATE_PENDING, time.time()),
+        ).fetchone()
+        return row[0]
+
+    def summary(self):
+        """حالة الطابور واستهلاك التوكنات مجمعاً لكل عامل."""
+        states = dict(self.conn.execute("SELECT state, COUNT(*) FROM work_items GROUP BY state").fetchall())
+        workers = [
+            {'worker': w, 'items': n, 'input_tokens': i or 0, 'output_tokens': o or 0}
+            for w, n, i, o in self.conn.execute(
+                "SELECT worker, COUNT(DISTINCT item), SUM(input_tokens), SUM(output_tokens) FROM usage GROUP BY worker ORDER BY worker"
+            )
+        ]
+        return {
+            'states': states,
+            'workers': workers,
+            'input_tokens': sum(w['input_tokens'] for w in workers),
+            'output_tokens': sum(w['output_tokens'] for w in workers),
+        }
+
+# --- 2. التشغيل المستقل (عرض حالة الطابور) ---
+if __name__ == "__main__":
+    queue_path = Path(sys.argv[1] if len(sys.argv) > 1 else Path("processed_systems_output") / LEASE_QUEUE_FILE)
+    if not queue_path.exists():
+        print(f"❌ لم يتم العثور على طابور العمل: {queue_path}")
+        exit()
+
+    queue = LeaseQueue(queue_path, worker_id='status')
+    summary = queue.summary()
+    queue.close()
+
+    print(f"✅ حالة الطابور: " + ", ".join(f"{state}: {count}" for state, count in sorted(summary['states'].items())))
+    print("\n💰 استهلاك التوكنات لكل عامل:")
+    for worker in summary['workers']:
+        print(f"  - {worker['worker']}: {worker['items']} وثيقة | مدخل {worker['input_tokens']} | مخرج {worker['output_tokens']}")
+    print(f"  = الإجمالي: مدخل {summary['input_tokens']} | مخرج {summary['output_tokens']}")
@@ -0,0 +1,344 @@
+import os
+import re
+import json
+import argparse
+from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+from splitter import create_yaml_header
+from corpus_manifest import CorpusManifest
+from build_state import BuildState, text_hash
+
+# --- ثوابت وإعدادات ---
+CORRECTIONS_TABLE_FILE = "ocr_corrections_table.json"   # الجدول العام للتصحيحات (داخل مجلد المخرجات)
+APPLY_REPORT_FILE = "ocr_apply_report.json"             # تقرير التغييرات بعد التطبيق
+STATUS_PENDING = 'pending'
+STATUS_ACCEPTED = 'accepted'
+STATUS_REJECTED = 'rejected'
+
+WORD_CHAR_PATTERN = re.compile(r'\w')
+
+# --- 1. دمج ملفات المراجعة في جدول عام ---
+
+def correction_key(original, suggested):
+    return f"{original}→{suggested}"
+
+def load_corrections_table(base_folder):
+    """تحميل الجدول العام (مع حالات القبول/الرفض التي حددها المراجع)."""
+    table_path = Path(base_folder) / CORRECTIONS_TABLE_FILE
+    if not table_path.exists():
+        return {}
+    with open(table_path, 'r', encoding='utf-8') as f:
+        return {correction_key(c['original_word'], c['suggested_correction']): c for c in json.load(f)}
+
+def save_corrections_table(table, base_folder):
+    """حفظ الجدول مرتباً حسب التكرار (الأكثر شيوعاً أولاً) لتسهيل المراجعة."""
+    rows = sorted(table.values(), key=lambda c: (-c['frequency'], c['original_word']))
+    table_path = Path(base_folder) / CORRECTIONS_TABLE_FILE
+    with open(table_path, 'w', encoding='utf-8') as f:
+        json.dump(rows, f, ensure_ascii=False, indent=2)
+    return table_path
+
+def merge_review_files(base_folder, accept_min_frequency=None):
+    """
+    دمج جميع ملفات *.ocr_review.json في جدول عام مع التكرارات.
+    تُحفظ حالة كل تصحيح من الجدول السابق، ويمكن قبول التصحيحات الشائعة تلقائياً.
+    """
+    previous = load_corrections_table(base_folder)
+    table = {}
+
+    corpus_manifest = CorpusManifest.load(base_folder)
+    for doc_slug in corpus_manifest.doc_slugs:
+        review_path = corpus_manifest.document_file(doc_slug, '.ocr_review.json')
+        if not review_path.exists():
+            continue
+        try:
+            with open(review_path, 'r', encoding='utf-8') as f:
+                review_data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"  ⚠️ تعذر قراءة ملف المراجعة {review_path.name}: {e}")
+            continue
+
+        doc_slug = review_data.get('doc', review_path.parent.name)
+        for correction in review_data.get('corrections_to_review', []):
+            original = correction.get('original_word')
+            suggested = correction.get('suggested_correction')
+            if not original or not suggested or original == suggested:
+                continue
+            key = correction_key(original, suggested)
+            entry = table.setdefault(key, {
+                'original_word': original,
+                'suggested_correction': suggested,
+                'frequency': 0,
+                'docs': [],
+                'status': previous.get(key, {}).get('status', STATUS_PENDING),
+            })
+            entry['frequency'] += 1
+            if doc_slug not in entry['docs']:
+                entry['docs'].append(doc_slug)
+            # الحالة المسجلة في ملف المراجعة نفسه تتقدم على الحالة الافتراضية
+            if correction.get('status') in (STATUS_ACCEPTED, STATUS_REJECTED) and entry['status'] == STATUS_PENDING:
+                entry['status'] = correction['status']
+
+    if accept_min_frequency:
+        for entry in table.values():
+            if entry['status'] == STATUS_PENDING and entry['frequency'] >= accept_min_frequency:
+                entry['status'] = STATUS_ACCEPTED
+
+    return table
+
+def accepted_replacements(table):
+    """
+    استخراج قاموس الاستبدال {الكلمة الخاطئة: التصحيح} من التصحيحات المقبولة.
+    عند تعارض عدة تصحيحات مقبولة لنفس الكلمة يُعتمد الأكثر تكراراً.
+    """
+    replacements = {}
+    best_frequency = {}
+    for entry in table.values():
+        if entry['status'] != STATUS_ACCEPTED:
+            continue
+        original = entry['original_word']
+        if entry['frequency'] > best_frequency.get(original, 0):
+            replacements[original] = entry['suggested_correction']
+            best_frequency[original] = entry['frequency']
+    return replacements
+
+# --- 2. الاستبدال متعدد الأنماط (Aho-Corasick) ---
+
+class AhoCorasickReplacer:
+    """مستبدل متعدد الأنماط بمرور واحد على النص مع احترام حدود الكلمات."""
+
+    def __init__(self, replacements):
+        self.replacements = replacements
+        self.goto = [{}]         # الانتقالات لكل حالة
+        self.fail = [0]          # رابط الفشل
+        self.output = [None]     # النمط الذي ينتهي في هذه الحالة (إن وجد)
+        self.dict_suffix = [0]   # أقرب حالة عبر روابط الفشل تنتهي بنمط
+        for pattern in replacements:
+            self._add_pattern(pattern)
+        self._build_fail_links()
+
+    def _add_pattern(self, pattern):
+        state = 0
+        for char in pattern:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(None)
+                self.dict_suffix.append(0)
+            state = next_state
+        self.output[state] = pattern
+
+    def _build_fail_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                failed_to = self.fail[next_state]
+                self.dict_suffix[next_state] = failed_to if self.output[failed_to] else self.dict_suffix[failed_to]
+
+    def _iter_matches(self, text):
+        """إرجاع المطابقات (البداية، النهاية، النمط) على حدود الكلمات فقط."""
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            # فحص جميع الأنماط المنتهية عند هذا الموضع عبر سلسلة روابط القاموس
+            probe = state if self.output[state] else self.dict_suffix[state]
+            while probe:
+                pattern = self.output[probe]
+                start = i - len(pattern) + 1
+                end = i + 1
+                before_ok = start == 0 or not WORD_CHAR_PATTERN.match(text[start - 1])
+                after_ok = end == len(text) or not WORD_CHAR_PATTERN.match(text[end])
+                if before_ok and after_ok:
+                    yield start, end, pattern
+                probe = self.dict_suffix[probe]
+
+    def replace(self, text):
+        """تطبيق الاستبدالات (الأطول والأسبق أولاً دون تداخل). يعيد (النص الجديد، {النمط: العدد})."""
+        matches = sorted(self._iter_matches(text), key=lambda m: (m[0], -(m[1] - m[0])))
+        if not matches:
+            return text, {}
+
+        parts = []
+        counts = {}
+        cursor = 0
+        for start, end, pattern in matches:
+            if start < cursor:
+                continue
+            parts.append(text[cursor:start])
+            parts.append(self.replacements[pattern])
+            counts[pattern] = counts.get(pattern, 0) + 1
+            cursor = end
+        parts.append(text[cursor:])
+        return ''.join(parts), counts
+
+# --- 3. التطبيق المتوازي على ملفات ALU ---
+
+_worker_replacer = None
+
+def _init_worker(replacements):
+    global _worker_replacer
+    _worker_replacer = AhoCorasickReplacer(replacements)
+
+def apply_to_alu_file(file_path, dry_run=False):
+    """تطبيق التصحيحات على جسم ALU واحد. يعيد سجل التغيير أو None إذا لم يتغير شيء."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    match = re.search(r'^---\n(.*?)\n---\n(.*)', content, re.DOTALL)
+    if not match:
+        return None
+    new_body, counts = _worker_replacer.replace(match.group(2))
+    if not counts:
+        return None
+
+    try:
+        metadata = yaml.safe_load(match.group(1)) or {}
+    except yaml.YAMLError as e:
+        return {'file': str(file_path), 'error': f"YAML: {e}"}
+
+    # نقل التصحيحات المطبقة من ocr_corrections إلى ocr_applied
+    pending = metadata.get('ocr_corrections') or {}
+    applied = metadata.get('ocr_applied') or {}
+    for original in counts:
+        pending.pop(original, None)
+        applied[original] = _worker_replacer.replacements[original]
+    metadata['ocr_corrections'] = pending
+    metadata['ocr_applied'] = applied
+
+    if not dry_run:
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(create_yaml_header(metadata) + new_body.strip())
+        os.replace(tmp_path, file_path)
+
+    return {
+        'file': str(file_path),
+        'id': metadata.get('id'),
+        'doc': metadata.get('doc') or Path(file_path).parent.name,
+        'previous_hash': text_hash(match.group(2)),
+        'hash': text_hash(new_body),
+        'replacements': counts,
+    }
+
+def _apply_worker(args):
+    return apply_to_alu_file(*args)
+
+def apply_corrections(base_folder, replacements, workers=None, dry_run=False):
+    """تطبيق التصحيحات المقبولة على جميع ملفات ALU بمرور متوازٍ واحد."""
+    alu_files = list(CorpusManifest.load(base_folder).iter_alu_paths())
+    if not replacements or not alu_files:
+        return []
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(replacements,)) as pool:
+        results = pool.map(_apply_worker, ((path, dry_run) for path in alu_files), chunksize=64)
+        return [r for r in results if r]
+
+def record_new_hashes(base_folder, changes):
+    """
+    تسجيل بصمات المواد المصححة في بيان كل وثيقة وبيان المدونة وحالة البناء،
+    حتى لا تبدو المواد متقادمة فيُعاد إرسالها إلى LLM، ولا يراها فحص السلامة معدلة يدوياً.
+    """
+    by_doc = {}
+    for change in changes:
+        if 'error' not in change and change.get('id'):
+            by_doc.setdefault(change['doc'], {})[change['id']] = (change['previous_hash'], change['hash'])
+    if not by_doc:
+        return
+
+    corpus_manifest = CorpusManifest.load(base_folder)
+    build_state = BuildState(base_folder)
+    try:
+        for doc_slug, changed in by_doc.items():
+            new_hashes = {alu_id: new_hash for alu_id, (_, new_hash) in changed.items()}
+            corpus_manifest.update_alu_hashes(doc_slug, new_hashes)
+            build_state.update_alu_hashes(doc_slug, changed)
+
+            manifest_path = corpus_manifest.document_file(doc_slug, '.manifest.json')
+            if manifest_path.exists():
+                with open(manifest_path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+                for entry in manifest:
+                    for alu in entry.get('alus', []):
+                        if alu['id'] in new_hashes:
+                            alu['hash'] = new_hashes[alu['id']]
+                tmp_path = manifest_path.with_name(manifest_path.name + '.tmp')
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, manifest_path)
+        corpus_manifest.save()
+    finally:
+        build_state.close()
+
+def build_report(changes, replacements, dry_run):
+    """إنشاء تقرير التغييرات: الملفات المعدلة وإجمالي الاستبدالات لكل تصحيح."""
+    totals = {}
+    for change in changes:
+        for original, count in change.get('replacements', {}).items():
+            totals[original] = totals.get(original, 0) + count
+    return {
+        'dry_run': dry_run,
+        'accepted_corrections': len(replacements),
+        'files_changed': sum(1 for c in changes if 'error' not in c),
+        'errors': [c for c in changes if 'error' in c],
+        'replacements_per_correction': [
+            {'original_word': o, 'suggested_correction': replacements[o], 'replacements': n}
+            for o, n in sorted(totals.items(), key=lambda item: -item[1])
+        ],
+        'changed_files': [c for c in changes if 'error' not in c],
+    }
+
+# --- 4. التشغيل ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="دمج ملفات مراجعة OCR وتطبيق التصحيحات المقبولة على المدونة.")
+    parser.add_argument("--input", default="processed_systems_output", help="مجلد المخرجات")
+    parser.add_argument("--accept-min-frequency", type=int, default=None,
+                        help="قبول التصحيحات المعلقة تلقائياً إذا تكررت هذا العدد من المرات على الأقل")
+    parser.add_argument("--merge-only", action="store_true", help="دمج ملفات المراجعة دون التطبيق")
+    parser.add_argument("--dry-run", action="store_true", help="حساب التغييرات دون إعادة كتابة الملفات")
+    parser.add_argument("--workers", type=int, default=None, help="عدد العمليات المتوازية")
+    args = parser.parse_args()
+
+    base_folder = Path(args.input)
+    if not base_folder.exists():
+        print(f"❌ لم يتم العثور على مجلد المخرجات: {base_folder}")
+        exit()
+
+    table = merge_review_files(base_folder, args.accept_min_frequency)
+    table_path = save_corrections_table(table, base_folder)
+    accepted = sum(1 for c in table.values() if c['status'] == STATUS_ACCEPTED)
+    print(f"✅ تم دمج {len(table)} تصحيح في {table_path.name} ({accepted} مقبول).")
+
+    if args.merge_only:
+        exit()
+
+    replacements = accepted_replacements(table)
+    if not replacements:
+        print("  > لا توجد تصحيحات مقبولة للتطبيق. عدّل الحقل 'status' في الجدول إلى 'accepted'.")
+        exit()
+
+    changes = apply_corrections(base_folder, replacements, workers=args.workers, dry_run=args.dry_run)
+    if not args.dry_run:
+        record_new_hashes(base_folder, changes)
+    report = build_report(changes, replacements, args.dry_run)
+    report_path = base_folder / APPLY_REPORT_FILE
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"✅ اكتمل التطبيق: تم تعديل {report['files_changed']} ملف ALU.")
+    print(f"  > تقرير التغييرات: {report_path}")
@@ -0,0 +1,189 @@
+import re
+import json
+from pathlib import Path
+from collections import Counter
+
+from arabic_text import strip_tashkeel, strip_alu_markup
+from corpus_manifest import CorpusManifest
+from ocr_applier import load_corrections_table, accepted_replacements
+
+# --- ثوابت وإعدادات ---
+OCR_LEXICON_FILE = "ocr_lexicon.json"                # يُحفظ داخل مجلد المخرجات الرئيسي
+EXTERNAL_LEXICON_FILE = "arabic_word_frequencies.txt"  # اختياري: سطر لكل كلمة بصيغة "الكلمة التكرار"
+MIN_WORD_LENGTH = 4          # الكلمات الأقصر كثيرة التشابه ولا يُعتمد عليها في الكشف
+RARE_WORD_MAX_FREQ = 2       # الكلمة التي يتجاوز تكرارها هذا الحد تُعتبر صحيحة
+COMMON_WORD_MIN_FREQ = 20    # أقل تكرار لكلمة حتى تُقترح كتصحيح
+FREQ_RATIO = 50              # يجب أن يكون التصحيح أكثر شيوعاً من الكلمة المشبوهة بهذه النسبة
+CONTEXT_WINDOW = 3           # عدد الكلمات المحيطة في حقل context
+
+ARABIC_WORD_PATTERN = re.compile(r'[ء-ي]+')
+
+# --- 1. توابع المسافة والحذف (SymSpell) ---
+
+def deletes_1(word):
+    """جميع الكلمات الناتجة عن حذف حرف واحد."""
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+def edit_distance_within_1(a, b):
+    """هل المسافة بين كلمتين (إدراج/حذف/استبدال/تبديل متجاور) تساوي 1 على الأكثر؟"""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diffs = [i for i in range(la) if a[i] != b[i]]
+        if len(diffs) == 1:
+            return True
+        return len(diffs) == 2 and diffs[1] == diffs[0] + 1 \
+            and a[diffs[0]] == b[diffs[1]] and a[diffs[1]] == b[diffs[0]]
+    if la > lb:
+        a, b = b, a
+    # b أطول بحرف واحد
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+def extract_words(text):
+    """استخراج الكلمات العربية من نص مادة بعد حذف التشكيل."""
+    return ARABIC_WORD_PATTERN.findall(strip_tashkeel(strip_alu_markup(text)))
+
+# --- 2. الكاشف (OCR Detector) ---
+
+class OCRDetector:
+    """كاشف محلي لأخطاء OCR يعتمد على معجم تكرارات وفهرس حذف بأسلوب SymSpell."""
+
+    def __init__(self, frequencies=None, known_errors=None):
+        self.frequencies = Counter(frequencies or {})
+        self.known_errors = dict(known_errors or {})   # الكلمة الخاطئة -> التصحيح المقبول
+        self._build_delete_index()
+
+    def _build_delete_index(self):
+        """فهرسة الكلمات الشائعة فقط (المرشحة كتصحيحات) بحذف حرف واحد."""
+        self.delete_index = {}
+        for word, freq in self.frequencies.items():
+            if freq < COMMON_WORD_MIN_FREQ or len(word) < MIN_WORD_LENGTH - 1:
+                continue
+            for key in deletes_1(word) | {word}:
+                self.delete_index.setdefault(key, []).append(word)
+
+    def suggest(self, word):
+        """إرجاع أفضل تصحيح مقترح لكلمة، أو None إذا بدت صحيحة."""
+        if word in self.known_errors:
+            return self.known_errors[word]
+        if len(word) < MIN_WORD_LENGTH:
+            return None
+        freq = self.frequencies.get(word, 0)
+        if freq > RARE_WORD_MAX_FREQ:
+            return None
+
+        best, best_freq = None, 0
+        for key in deletes_1(word) | {word}:
+            for candidate in self.delete_index.get(key, ()):
+                if candidate == word:
+                    continue
+                candidate_freq = self.frequencies[candidate]
+                if candidate_freq > best_freq and edit_distance_within_1(word, candidate):
+                    best, best_freq = candidate, candidate_freq
+
+        if best and best_freq >= max(COMMON_WORD_MIN_FREQ, FREQ_RATIO * max(freq, 1)):
+            return best
+        return None
+
+    def detect(self, article_text):
+        """
+        كشف أخطاء OCR المحتملة في نص مادة.
+        يعيد قائمة بنفس بنية ocr_corrections التي يعيدها LLM.
+        """
+        words = extract_words(article_text)
+        candidates = []
+        seen = set()
+        for i, word in enumerate(words):
+            if word in seen:
+                continue
+            correction = self.suggest(word)
+            if correction:
+                seen.add(word)
+                context = ' '.join(words[max(0, i - CONTEXT_WINDOW):i + CONTEXT_WINDOW + 1])
+                candidates.append({
+                    'original_word': word,
+                    'suggested_correction': correction,
+                    'context': context,
+                    'source': 'known' if word in self.known_errors else 'lexicon',
+                })
+        return candidates
+
+    def save(self, lexicon_path):
+        """حفظ المعجم والتصحيحات المعروفة (يُعاد بناء فهرس الحذف عند التحميل)."""
+        with open(lexicon_path, 'w', encoding='utf-8') as f:
+            json.dump({'frequencies': self.frequencies, 'known_errors': self.known_errors}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, lexicon_path):
+        """تحميل الكاشف من ملف المعجم، أو None إذا لم يوجد."""
+        lexicon_path = Path(lexicon_path)
+        if not lexicon_path.exists():
+            return None
+        with open(lexicon_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data.get('frequencies'), data.get('known_errors'))
+
+# --- 3. بناء المعجم ---
+
+def load_external_lexicon(lexicon_file=EXTERNAL_LEXICON_FILE):
+    """تحميل معجم تكرارات خارجي (سطر لكل كلمة: "الكلمة التكرار")."""
+    frequencies = Counter()
+    lexicon_file = Path(lexicon_file)
+    if not lexicon_file.exists():
+        return frequencies
+    with open(lexicon_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                frequencies[strip_tashkeel(parts[0])] += int(parts[1])
+            elif len(parts) == 1:
+                frequencies[strip_tashkeel(parts[0])] += COMMON_WORD_MIN_FREQ
+    return frequencies
+
+def load_known_errors(base_folder="processed_systems_output"):
+    """
+    التصحيحات المقبولة فقط من الجدول العام (ocr_corrections_table.json، انظر ocr_applier.py).
+    اقتراحات LLM المعلقة في ملفات المراجعة ليست أخطاء معروفة حتى يقبلها المراجع.
+    """
+    return {
+        strip_tashkeel(original): strip_tashkeel(suggested)
+        for original, suggested in accepted_replacements(load_corrections_table(base_folder)).items()
+    }
+
+def build_detector(base_folder="processed_systems_output", lexicon_file=EXTERNAL_LEXICON_FILE):
+    """بناء الكاشف من المعجم الخارجي + تكرارات كلمات المدونة + التصحيحات المعروفة."""
+    frequencies = load_external_lexicon(lexicon_file)
+    for file_path in CorpusManifest.load(base_folder).iter_alu_paths():
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        match = re.search(r'^---\n.*?\n---\n(.*)', content, re.DOTALL)
+        frequencies.update(extract_words(match.group(1) if match else content))
+
+    known_errors = load_known_errors(base_folder)
+    # الكلمات الخاطئة المعروفة لا يجب أن تُقترح كتصحيحات لغيرها
+    for wrong_word in known_errors:
+        frequencies.pop(wrong_word, None)
+    return OCRDetector(frequencies, known_errors)
+
+def load_detector(base_folder="processed_systems_output"):
+    """تحميل الكاشف المحفوظ في مجلد المخرجات (أو None إذا لم يُبنَ بعد)."""
+    return OCRDetector.load(Path(base_folder) / OCR_LEXICON_FILE)
+
+# --- 4. التشغيل المستقل (بناء المعجم) ---
+if __name__ == "__main__":
+    base_folder = "processed_systems_output"
+    if not Path(base_folder).exists():
+        print(f"❌ لم يتم العثور على مجلد المخرجات: {base_folder}")
+        exit()
+
+    detector = build_detector(base_folder)
+    lexicon_path = Path(base_folder) / OCR_LEXICON_FILE
+    detector.save(lexicon_path)
+    print(f"✅ تم بناء معجم OCR: {len(detector.frequencies)} كلمة، {len(detector.known_errors)} تصحيح معروف.")
+    print(f"  > تم الحفظ في: {lexicon_path}")
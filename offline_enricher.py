@@ -0,0 +1,202 @@
+import re
+import json
+import math
+import time
+import argparse
+from pathlib import Path
+from collections import Counter
+
+from arabic_text import ARABIC_STOPWORDS, ALU_ANCHOR_PATTERN, ALU_HEADING_PATTERN, normalize_arabic, strip_tashkeel, tokenize
+from corpus_manifest import CorpusManifest
+from integrity_check import parse_front_matter
+from splitter import create_yaml_header
+from aspect_classifier import load_classifier
+from corpus import summary_text
+
+# --- ثوابت وإعدادات ---
+OFFLINE_TERMS_FILE = "offline_terms.json"   # تكرار الكلمات في المواد (DF) لحساب IDF (داخل مجلد المخرجات)
+OFFLINE_METHOD = 'offline'                 # قيمة enrichment_source.method للإثراء المحلي المؤقت
+SUMMARY_MAX_WORDS = 30                     # الحد نفسه المطلوب من LLM
+MAX_KEYWORDS = 6
+MIN_TERM_LENGTH = 3
+MIN_DF = 2                                 # الكلمات الأندر لا تُحفظ (تُعامل كأندر كلمة عند الحساب)
+LEAD_SENTENCE_BONUS = 1.2                  # الجملة الأولى في المادة القانونية غالباً تحمل حكمها الرئيسي
+UNCLASSIFIED = 'غير مصنف'
+
+SENTENCE_PATTERN = re.compile(r'[^.!؟?؛;\n]+[.!؟?؛;]*')
+WORD_PATTERN = re.compile(r'\w+')
+# السوابق التي تُحذف عند مقارنة الكلمات (والعامل/بالعامل/العامل → عامل)
+PREFIXES = ('وال', 'بال', 'كال', 'فال', 'لل', 'ال')
+
+# --- 1. الكلمات ---
+
+def term(word):
+    """صيغة الكلمة للمقارنة: مُطبَّعة ودون أداة التعريف والعطف (أو None إذا كانت شائعة أو قصيرة)."""
+    word = normalize_arabic(word)
+    if word in ARABIC_STOPWORDS or word.isdigit():
+        return None
+    for prefix in PREFIXES:
+        if word.startswith(prefix) and len(word) - len(prefix) >= MIN_TERM_LENGTH:
+            word = word[len(prefix):]
+            break
+    if len(word) < MIN_TERM_LENGTH or word in ARABIC_STOPWORDS:
+        return None
+    return word
+
+def clean_body(text_content):
+    return ALU_ANCHOR_PATTERN.sub(' ', ALU_HEADING_PATTERN.sub(' ', text_content)).strip()
+
+def body_terms(text):
+    return [t for t in (term(word) for word in tokenize(normalize_arabic(text))) if t]
+
+# --- 2. إحصاءات المدونة ---
+
+class TermStats:
+    """عدد المواد التي تظهر فيها كل كلمة (DF) لحساب IDF. تُبنى بمرور واحد على المدونة."""
+
+    def __init__(self, documents=0, df=None):
+        self.documents = documents
+        self.df = df or {}
+
+    def add(self, terms):
+        self.documents += 1
+        for t in set(terms):
+            self.df[t] = self.df.get(t, 0) + 1
+
+    def idf(self, t):
+        # الكلمات غير المحفوظة (نادرة) تأخذ أعلى وزن؛ ودون إحصاءات يصبح الترتيب بالتكرار وحده
+        return math.log((1 + self.documents) / (1 + self.df.get(t, 1))) + 1
+
+    def pruned(self):
+        return TermStats(self.documents, {t: n for t, n in self.df.items() if n >= MIN_DF})
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'documents': self.documents, 'df': self.df}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        path = Path(path)
+        if not path.exists():
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data.get('documents', 0), data.get('df', {}))
+
+def build_term_stats(corpus_manifest):
+    stats = TermStats()
+    for file_path in corpus_manifest.iter_alu_paths():
+        if file_path.exists():
+            _, body, _ = parse_front_matter(file_path.read_text(encoding='utf-8'))
+            stats.add(body_terms(clean_body(body)))
+    return stats.pruned()
+
+def load_term_stats(base_folder="processed_systems_output"):
+    """إحصاءات المدونة المحفوظة، أو إحصاءات فارغة (يعمل الإثراء المحلي بالتكرار وحده)."""
+    return TermStats.load(Path(base_folder) / OFFLINE_TERMS_FILE) or TermStats()
+
+# --- 3. الملخص والكلمات المفتاحية ---
+
+def _truncate(words, limit):
+    return ' '.join(words[:limit]) + ('…' if len(words) > limit else '')
+
+def extractive_summary(text, term_stats, max_words=SUMMARY_MAX_WORDS):
+    """
+    أعلى الجمل وزناً (مجموع TF-IDF لكلماتها مقسوماً على جذر طولها) بترتيبها في النص،
+    حتى max_words كلمة. الجملة الأطول من الحد تُقتطع.
+    """
+    sentences = [s.strip() for s in SENTENCE_PATTERN.findall(strip_tashkeel(text)) if WORD_PATTERN.search(s)]
+    if not sentences:
+        return None
+    scored, seen = [], set()
+    for position, sentence in enumerate(sentences):
+        # الجمل المكررة حرفياً (شائعة في نصوص OCR والصيغ المتكررة) تُحتسب مرة واحدة
+        key = normalize_arabic(sentence)
+        if key in seen:
+            continue
+        seen.add(key)
+        terms = body_terms(sentence)
+        score = sum(term_stats.idf(t) for t in terms) / math.sqrt(len(terms)) if terms else 0.0
+        scored.append((score * (LEAD_SENTENCE_BONUS if position == 0 else 1.0), position))
+
+    chosen, used = [], 0
+    for score, position in sorted(scored, key=lambda item: (-item[0], item[1])):
+        length = len(sentences[position].split())
+        if chosen and used + length > max_words:
+            continue
+        chosen.append(position)
+        used += length
+        if used >= max_words:
+            break
+    words = ' '.join(sentences[position] for position in sorted(chosen)).split()
+    return _truncate(words, max_words)
+
+def extract_keywords(text, term_stats, limit=MAX_KEYWORDS):
+    """أعلى الكلمات TF-IDF، بأكثر صيغها ظهوراً في النص (دون حرف العطف)."""
+    counts, surfaces = Counter(), {}
+    for word in WORD_PATTERN.findall(strip_tashkeel(text)):
+        t = term(word)
+        if not t:
+            continue
+        counts[t] += 1
+        surface = word[1:] if word.startswith('و') and term(word[1:]) == t else word
+        surfaces.setdefault(t, Counter())[surface] += 1
+    ranked = sorted(counts, key=lambda t: (-(1 + math.log(counts[t])) * term_stats.idf(t), t))
+    return [surfaces[t].most_common(1)[0][0] for t in ranked[:limit]]
+
+def offline_enrichment(text_content, term_stats, aspect_classifier=None):
+    """
+    حقول الإثراء من النص محلياً دون API. النتيجة مؤقتة (provisional) ويستبدلها
+    أول إثراء ناجح بـ LLM.
+    """
+    text = clean_body(text_content)
+    aspect = aspect_classifier.classify([text])[0][0] if aspect_classifier else UNCLASSIFIED
+    return {
+        'summary': extractive_summary(text, term_stats) or text[:200],
+        'keywords': extract_keywords(text, term_stats),
+        'aspect': aspect,
+        'provisional': True,
+        'enrichment_source': {'method': OFFLINE_METHOD},
+    }
+
+def needs_offline(metadata):
+    """المواد التي ليس لها ملخص (أو لها العبارة المؤقتة القديمة)، أو لها إثراء محلي سابق (يُحدَّث). إثراء LLM لا يُمس."""
+    return summary_text(metadata) is None or bool(metadata.get('provisional'))
+
+# --- 4. التشغيل (إثراء كل المدونة محلياً) ---
+
+def enrich_corpus(base_folder="processed_systems_output"):
+    """بناء إحصاءات المدونة ثم ملء المواد غير المُثراة. يعيد (عدد المواد المحدثة، عدد المواد)."""
+    corpus_manifest = CorpusManifest.load(base_folder)
+    term_stats = build_term_stats(corpus_manifest)
+    term_stats.save(Path(base_folder) / OFFLINE_TERMS_FILE)
+    aspect_classifier = load_classifier(base_folder)
+
+    updated = total = 0
+    for file_path in corpus_manifest.iter_alu_paths():
+        if not file_path.exists():
+            continue
+        total += 1
+        metadata, body, error = parse_front_matter(file_path.read_text(encoding='utf-8'))
+        if error or not needs_offline(metadata):
+            continue
+        metadata.update(offline_enrichment(body, term_stats, aspect_classifier))
+        metadata.setdefault('ocr_corrections', {})
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(create_yaml_header(metadata) + body.strip())
+        updated += 1
+    return updated, total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="إثراء محلي مؤقت (ملخص استخلاصي وكلمات مفتاحية) للمواد غير المُثراة دون API.")
+    parser.add_argument("--input", default="processed_systems_output", help="مجلد المخرجات")
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        print(f"❌ لم يتم العثور على مجلد المخرجات: {args.input}")
+        exit()
+
+    started = time.time()
+    updated, total = enrich_corpus(args.input)
+    print(f"✅ اكتمل الإثراء المحلي في {time.time() - started:.1f} ث: تم تحديث {updated} من {total} مادة.")
+    print("  > النتائج مؤقتة (provisional: true) وسيستبدلها enricher.py عند توفر API.")
@@ -0,0 +1,103 @@
+import os
+import re
+import argparse
+from pathlib import Path
+
+from corpus import read_header, summary_text
+from corpus_manifest import CorpusManifest
+from splitter import PARENT_INDEX_HEADING
+
+# --- ثوابت وإعدادات ---
+NOT_ENRICHED = "(لم تُثرَ بعد)"
+UNCLASSIFIED = 'غير مصنف'
+# قسم الفهرس: من عنوانه حتى العنوان التالي من المستوى نفسه أو نهاية الملف
+INDEX_SECTION_PATTERN = re.compile(rf'^{re.escape(PARENT_INDEX_HEADING)}[ \t]*\n.*?(?=^##\s|\Z)', re.MULTILINE | re.DOTALL)
+
+# --- 1. مدخلات الفهرس ---
+
+def index_entry(alu_id, file_name, metadata):
+    """مدخل مادة في فهرس الملف الأم من رأسها (أو من نتيجة الإثراء في الذاكرة)."""
+    metadata = metadata or {}
+    article = metadata.get('articles') or alu_id.split('--مادة-')[-1].lstrip('0')
+    return {
+        'id': alu_id,
+        'file': file_name,
+        'article': str(article),
+        'summary': summary_text(metadata),
+        'aspect': metadata.get('aspect') or UNCLASSIFIED,
+    }
+
+def document_index_entries(corpus_manifest, doc_slug, known=None):
+    """
+    مدخلات فهرس الوثيقة بترتيب موادها. المواد الموجودة في known (نتائج الإثراء في الذاكرة)
+    لا يُقرأ لها شيء، والباقي يُقرأ رأسه فقط دون الجسم.
+    """
+    known = known or {}
+    entries = []
+    for alu in corpus_manifest.alus(doc_slug):
+        entry = known.get(alu['id'])
+        if entry is None:
+            file_path = corpus_manifest.base_folder / alu['file']
+            metadata = read_header(file_path) if file_path.exists() else {}
+            entry = index_entry(alu['id'], file_path.name, metadata)
+        entries.append(entry)
+    return entries
+
+# --- 2. كتابة القسم ---
+
+def render_index(entries):
+    """قسم الفهرس بصيغة Markdown: رقم المادة برابط لملفها، ثم الجانب والملخص."""
+    lines = [PARENT_INDEX_HEADING, ""]
+    for entry in entries:
+        lines.append(f"- [المادة {entry['article']}]({entry['file']}) — *{entry['aspect']}*: {entry['summary'] or NOT_ENRICHED}")
+    return '\n'.join(lines) + '\n'
+
+def replace_index_section(content, index_text):
+    """استبدال قسم الفهرس وحده (أو إضافته في آخر الملف إن لم يوجد) مع إبقاء الرأس وباقي الأقسام كما هي."""
+    if INDEX_SECTION_PATTERN.search(content):
+        return INDEX_SECTION_PATTERN.sub(lambda match: index_text + ('\n' if match.end() < len(content) else ''), content, count=1)
+    return content.rstrip() + '\n\n' + index_text
+
+def write_parent_index(parent_path, entries):
+    """كتابة ذرية (ملف مؤقت ثم استبدال). يعيد False إذا لم يتغير الفهرس."""
+    parent_path = Path(parent_path)
+    with open(parent_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    updated = replace_index_section(content, render_index(entries))
+    if updated == content:
+        return False
+    tmp_path = parent_path.with_name(parent_path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(updated)
+    os.replace(tmp_path, parent_path)
+    return True
+
+def update_document_index(corpus_manifest, doc_slug, known=None):
+    """تحديث فهرس الملف الأم لوثيقة واحدة. يعيد True إذا كُتب الملف."""
+    parent_path = corpus_manifest.parent_path(doc_slug)
+    if not parent_path.exists():
+        print(f"  ⚠️ الملف الأم غير موجود: {parent_path}")
+        return False
+    return write_parent_index(parent_path, document_index_entries(corpus_manifest, doc_slug, known))
+
+# --- 3. التشغيل المستقل (إعادة توليد الفهارس من البيان والرؤوس) ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="توليد فهرس المواد في الملفات الأم من بيان المدونة ورؤوس المواد.")
+    parser.add_argument("--input", default="processed_systems_output", help="مجلد المخرجات")
+    parser.add_argument("--doc", action="append", default=None, help="وثيقة محددة فقط (يمكن تكراره)")
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        print(f"❌ لم يتم العثور على مجلد المخرجات: {args.input}")
+        exit()
+
+    corpus_manifest = CorpusManifest.load(args.input)
+    updated = 0
+    for doc_slug in args.doc or corpus_manifest.doc_slugs:
+        if doc_slug not in corpus_manifest:
+            print(f"  ⚠️ وثيقة غير موجودة في بيان المدونة: {doc_slug}")
+            continue
+        if update_document_index(corpus_manifest, doc_slug):
+            updated += 1
+            print(f"  ✅ تم تحديث فهرس: {doc_slug}")
+    print(f"✅ اكتمل توليد الفهارس. تم تحديث {updated} ملف أم.")
@@ -0,0 +1,162 @@
+import os
+import time
+import argparse
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from corpus_manifest import CorpusManifest
+from integrity_check import article_number, parse_front_matter
+from corpus import summary_text
+
+# --- ثوابت وإعدادات ---
+PARQUET_FILE = "corpus_alus.parquet"     # الملف الافتراضي للتصدير (بجوار مجلد المخرجات)
+ROW_GROUP_BYTES = 32 * 1024 * 1024       # حجم مجموعة الصفوف في الذاكرة قبل كتابتها (يحدد ذروة الذاكرة)
+ROW_GROUP_MAX_ROWS = 10000               # حد أعلى لعدد الصفوف في المجموعة (مجموعات أصغر = تخطٍّ أدق عند الفلترة)
+COMPRESSION = 'zstd'
+UNCLASSIFIED = 'غير مصنف'
+
+# أعمدة بقيم قليلة متكررة في كل الصفوف: ترميز قاموسي (وتُقرأ كـ category في pandas)
+DICTIONARY_TYPE = pa.dictionary(pa.int32(), pa.string())
+DICTIONARY_COLUMNS = ('doc', 'type', 'domain', 'status', 'aspect')
+
+SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('doc', DICTIONARY_TYPE),
+    ('position', pa.int32()),             # ترتيب المادة في وثيقتها
+    ('article', pa.int32()),              # رقم المادة (فارغ إذا لم يكن رقماً صحيحاً)
+    ('type', DICTIONARY_TYPE),
+    ('domain', DICTIONARY_TYPE),
+    ('status', DICTIONARY_TYPE),
+    ('aspect', DICTIONARY_TYPE),
+    ('summary', pa.string()),
+    ('keywords', pa.list_(pa.string())),
+    ('ocr_corrections', pa.int32()),      # عدد تصحيحات OCR المطبقة/المقترحة في رأس المادة
+    ('enriched', pa.bool_()),
+    ('hash', pa.string()),
+    ('text', pa.string()),
+])
+
+# --- 1. تحويل مادة إلى صف ---
+
+def alu_row(alu, doc_slug, position, file_path):
+    """صف واحد من رأس المادة وجسمها (الحقول الناقصة تبقى فارغة بدلاً من إيقاف التصدير)."""
+    # محلل YAML المكتوب بـ C (كما في فاحص السلامة): التحليل هو الكلفة الغالبة في التصدير
+    metadata, text_content, _ = parse_front_matter(file_path.read_text(encoding='utf-8'))
+    metadata = metadata or {}
+    keywords = metadata.get('keywords')
+    corrections = metadata.get('ocr_corrections')
+    return {
+        'id': metadata.get('id') or alu['id'],
+        'doc': metadata.get('doc') or doc_slug,
+        'position': position,
+        'article': article_number(metadata.get('articles')),
+        'type': metadata.get('type'),
+        'domain': metadata.get('domain') or UNCLASSIFIED,
+        'status': metadata.get('status'),
+        'aspect': metadata.get('aspect'),
+        'summary': summary_text(metadata),
+        'keywords': [str(k) for k in keywords] if isinstance(keywords, list) else None,
+        'ocr_corrections': len(corrections) if isinstance(corrections, (dict, list)) else 0,
+        'enriched': bool(summary_text(metadata) and metadata.get('keywords')),
+        'hash': alu.get('hash'),
+        'text': text_content.strip(),
+    }
+
+def row_size(row):
+    """تقدير حجم الصف في الذاكرة (النصوص هي الغالبة)."""
+    return 64 + len(row['text'].encode('utf-8')) + len((row['summary'] or '').encode('utf-8')) \
+        + sum(len(k) for k in row['keywords'] or ())
+
+def iter_rows(corpus_manifest):
+    """صفوف المدونة بترتيبها (الوثائق أبجدياً)، فتتجمع مواد الوثيقة الواحدة في مجموعات صفوف متجاورة."""
+    for doc_slug in corpus_manifest.doc_slugs:
+        for position, alu in enumerate(corpus_manifest.alus(doc_slug), 1):
+            file_path = corpus_manifest.base_folder / alu['file']
+            if not file_path.exists():
+                print(f"  ⚠️ ملف مادة مفقود لن يُصدَّر: {alu['file']} (شغّل integrity_check.py)")
+                continue
+            yield alu_row(alu, doc_slug, position, file_path)
+
+# --- 2. الكتابة ---
+
+def _to_table(rows):
+    columns = {name: [row[name] for row in rows] for name in SCHEMA.names}
+    return pa.Table.from_pydict(columns, schema=SCHEMA)
+
+def export_parquet(base_folder, output_path, row_group_bytes=ROW_GROUP_BYTES, max_rows=ROW_GROUP_MAX_ROWS):
+    """
+    تصدير متدفق: تُجمع الصفوف حتى حجم مجموعة واحدة ثم تُكتب وتُحرر، فتبقى الذاكرة محدودة
+    بحجم مجموعة الصفوف مهما كبرت المدونة. الكتابة إلى ملف مؤقت ثم استبداله.
+    يعيد إحصاءات التصدير.
+    """
+    corpus_manifest = CorpusManifest.load(base_folder)
+    output_path = Path(output_path)
+    tmp_path = output_path.with_name(output_path.name + '.tmp')
+    stats = {'rows': 0, 'row_groups': 0, 'raw_bytes': 0}
+
+    writer = pq.ParquetWriter(tmp_path, SCHEMA, compression=COMPRESSION,
+                              use_dictionary=list(DICTIONARY_COLUMNS), write_statistics=True)
+    try:
+        buffer, buffer_bytes = [], 0
+        for row in iter_rows(corpus_manifest):
+            buffer.append(row)
+            buffer_bytes += row_size(row)
+            if buffer_bytes >= row_group_bytes or len(buffer) >= max_rows:
+                writer.write_table(_to_table(buffer), row_group_size=len(buffer))
+                stats['row_groups'] += 1
+                stats['rows'] += len(buffer)
+                stats['raw_bytes'] += buffer_bytes
+                buffer, buffer_bytes = [], 0
+        if buffer:
+            writer.write_table(_to_table(buffer), row_group_size=len(buffer))
+            stats['row_groups'] += 1
+            stats['rows'] += len(buffer)
+            stats['raw_bytes'] += buffer_bytes
+    except BaseException:
+        writer.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+    writer.close()
+    os.replace(tmp_path, output_path)
+    stats['file_bytes'] = output_path.stat().st_size
+    return stats
+
+# --- 3. القراءة ---
+
+def read_alus(parquet_path, columns=None, filters=None):
+    """
+    قراءة الجدول (أو أعمدة/صفوف منه). الفلاتر تُطبق على إحصاءات مجموعات الصفوف أولاً،
+    فلا تُقرأ المجموعات التي لا تحوي الوثيقة أو المجال المطلوب.
+
+    مثال:
+        df = read_alus("corpus_alus.parquet", columns=['id', 'summary'],
+                       filters=[('doc', '=', 'وثيقة-...')]).to_pandas()
+    """
+    return pq.read_table(parquet_path, columns=columns, filters=filters)
+
+# --- 4. التشغيل ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="تصدير بيانات المواد ونصوصها إلى Parquet للتحليل.")
+    parser.add_argument("--input", default="processed_systems_output", help="مجلد المخرجات")
+    parser.add_argument("--output", default=PARQUET_FILE, help="مسار ملف Parquet")
+    parser.add_argument("--row-group-mb", type=int, default=ROW_GROUP_BYTES // (1024 * 1024),
+                        help="حجم مجموعة الصفوف في الذاكرة بالميغابايت")
+    parser.add_argument("--check", action="store_true", help="قراءة الملف بعد التصدير وقياس زمن التحميل")
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        print(f"❌ لم يتم العثور على مجلد المخرجات: {args.input}")
+        exit()
+
+    started = time.time()
+    stats = export_parquet(args.input, args.output, args.row_group_mb * 1024 * 1024)
+    print(f"✅ تم تصدير {stats['rows']} مادة في {stats['row_groups']} مجموعة صفوف إلى {args.output} "
+          f"في {time.time() - started:.1f} ث.")
+    print(f"  > الحجم: {stats['raw_bytes'] / 1024:.1f} KB -> {stats['file_bytes'] / 1024:.1f} KB")
+
+    if args.check:
+        started = time.time()
+        table = read_alus(args.output)
+        print(f"  > تحميل الجدول كاملاً: {table.num_rows} صف في {time.time() - started:.2f} ث")
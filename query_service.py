@@ -0,0 +1,245 @@
+import os
+import json
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from urllib.parse import urlsplit, unquote, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from corpus import Corpus
+from splitter import load_yaml_and_content
+
+# --- ثوابت وإعدادات ---
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+CACHE_SIZE = 20000          # عدد سجلات ALU المحللة في الذاكرة المؤقتة (LRU)
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# --- 1. الذاكرة المؤقتة (LRU) ---
+
+class LRUCache:
+    """ذاكرة مؤقتة LRU آمنة للخيوط تحفظ الاستجابات الجاهزة (JSON مُرمَّز + ETag)."""
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+# --- 2. منطق الاستعلام ---
+
+class QueryService:
+    """خدمة القراءة فقط: جلب ALU بالمعرف، التنقل السابق/التالي، وسرد مواد الوثيقة."""
+
+    def __init__(self, base_folder="processed_systems_output", cache_size=CACHE_SIZE):
+        # الفهرس (المعرف → الموقع) يُبنى من ملفات البيان فقط دون فتح ملفات ALU
+        self.corpus = Corpus(base_folder)
+        self.cache = LRUCache(cache_size)
+        self.manifest_etags = {}
+
+    def alu_response(self, alu_id):
+        """
+        إرجاع (جسم JSON، ETag) لمادة، أو None إذا لم توجد.
+        السجل المخزن يُتحقق من صلاحيته بـ stat فقط (وقت التعديل والحجم)، ويُعاد تحليله إذا تغير الملف.
+        """
+        record = self.corpus.get(alu_id)
+        if record is None:
+            return None
+        try:
+            stat = os.stat(record.file_path)
+        except FileNotFoundError:
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        cached = self.cache.get(alu_id)
+        if cached is not None and cached[0] == signature:
+            return cached[1], cached[2]
+
+        with open(record.file_path, 'rb') as f:
+            raw = f.read()
+        metadata, text_content = load_yaml_and_content(record.file_path)
+        body = json.dumps(
+            {'id': alu_id, 'doc': record.doc, 'metadata': metadata, 'text': text_content.strip()},
+            ensure_ascii=False, default=str,
+        ).encode('utf-8')
+        etag = f'"{hashlib.sha1(raw).hexdigest()}"'
+        self.cache.put(alu_id, (signature, body, etag))
+        return body, etag
+
+    def neighbor_id(self, alu_id, direction):
+        """معرف المادة السابقة/التالية داخل الوثيقة بحسب ترتيب البيان."""
+        record = self.corpus.get(alu_id)
+        neighbor = record and (record.next if direction == 'next' else record.prev)
+        return neighbor.id if neighbor else None
+
+    def list_documents(self, offset, limit):
+        slugs = self.corpus.doc_slugs
+        return {
+            'total': len(slugs), 'offset': offset, 'limit': limit,
+            'items': [{'doc': s, 'alus': len(self.corpus.document(s))} for s in slugs[offset:offset + limit]],
+        }
+
+    def list_document_alus(self, doc_slug, offset, limit):
+        document = self.corpus.document(doc_slug)
+        if document is None:
+            return None
+        alu_ids = document.alu_ids
+        return {
+            'doc': doc_slug, 'total': len(alu_ids), 'offset': offset, 'limit': limit,
+            'items': alu_ids[offset:offset + limit],
+        }
+
+    def manifest_etag(self, doc_slug):
+        """بصمة ملف بيان الوثيقة (تُحسب مرة واحدة) لاستخدامها في ETag القوائم."""
+        etag = self.manifest_etags.get(doc_slug)
+        if etag is None:
+            with open(self.corpus.document(doc_slug).manifest_path, 'rb') as f:
+                etag = self.manifest_etags[doc_slug] = hashlib.sha1(f.read()).hexdigest()
+        return etag
+
+# --- 3. خادم HTTP ---
+
+def _page_params(query):
+    """قراءة offset/limit من سلسلة الاستعلام مع حدود آمنة."""
+    try:
+        offset = max(0, int(query.get('offset', ['0'])[0]))
+        limit = min(MAX_PAGE_SIZE, max(1, int(query.get('limit', [str(DEFAULT_PAGE_SIZE)])[0])))
+    except ValueError:
+        return None
+    return offset, limit
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    المسارات:
+      GET /alus/<id>                   المادة كاملة (رأس YAML + النص)
+      GET /alus/<id>/prev | /next      المادة المجاورة
+      GET /docs?offset=&limit=         قائمة الوثائق
+      GET /docs/<slug>/alus?offset=&limit=  معرفات مواد الوثيقة بالترتيب
+      GET /stats                       إحصاءات الفهرس والذاكرة المؤقتة
+    """
+    protocol_version = "HTTP/1.1"   # إبقاء الاتصال مفتوحاً لتقليل كلفة كل طلب
+    # الرؤوس والجسم تُرسل بكتابة واحدة (تفادي تأخير Nagle/ACK المؤجل مع الاتصالات المفتوحة)
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+    service = None
+
+    def log_message(self, format, *args):
+        pass    # تسجيل كل طلب يبطئ الخدمة؛ الأخطاء تُعاد للعميل في الاستجابة
+
+    def _send(self, status, body=b'', etag=None, content_type='application/json; charset=utf-8'):
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+        if body:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _send_json(self, status, data, etag=None):
+        self._send(status, json.dumps(data, ensure_ascii=False).encode('utf-8'), etag)
+
+    def _send_error(self, status, message):
+        self._send_json(status, {'error': message})
+
+    def _send_alu(self, alu_id):
+        result = self.service.alu_response(alu_id)
+        if result is None:
+            return self._send_error(404, f"المادة غير موجودة: {alu_id}")
+        body, etag = result
+        if self.headers.get('If-None-Match') == etag:
+            return self._send(304, etag=etag)
+        self._send(200, body, etag)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [unquote(p) for p in url.path.strip('/').split('/') if p]
+        query = parse_qs(url.query)
+
+        if len(parts) == 2 and parts[0] == 'alus':
+            return self._send_alu(parts[1])
+
+        if len(parts) == 3 and parts[0] == 'alus' and parts[2] in ('prev', 'next'):
+            if parts[1] not in self.service.corpus:
+                return self._send_error(404, f"المادة غير موجودة: {parts[1]}")
+            neighbor = self.service.neighbor_id(parts[1], parts[2])
+            if neighbor is None:
+                return self._send_error(404, "لا توجد مادة مجاورة في هذا الاتجاه.")
+            return self._send_alu(neighbor)
+
+        if parts and parts[0] == 'docs' and len(parts) in (1, 3):
+            page = _page_params(query)
+            if page is None:
+                return self._send_error(400, "قيم offset/limit غير صالحة.")
+            if len(parts) == 1:
+                return self._send_json(200, self.service.list_documents(*page))
+            if parts[2] != 'alus':
+                return self._send_error(404, "مسار غير معروف.")
+            listing = self.service.list_document_alus(parts[1], *page)
+            if listing is None:
+                return self._send_error(404, f"الوثيقة غير موجودة: {parts[1]}")
+            # ETag القائمة مشتق من بصمة البيان ومعاملات الصفحة
+            etag = f'"{self.service.manifest_etag(parts[1])}-{page[0]}-{page[1]}"'
+            if self.headers.get('If-None-Match') == etag:
+                return self._send(304, etag=etag)
+            return self._send_json(200, listing, etag)
+
+        if parts == ['stats']:
+            cache = self.service.cache
+            return self._send_json(200, {
+                'documents': len(self.service.corpus.doc_slugs),
+                'alus': len(self.service.corpus),
+                'cache_size': len(cache.items), 'cache_hits': cache.hits, 'cache_misses': cache.misses,
+            })
+
+        self._send_error(404, "مسار غير معروف.")
+
+def serve(base_folder="processed_systems_output", host=DEFAULT_HOST, port=DEFAULT_PORT, cache_size=CACHE_SIZE):
+    """تشغيل الخدمة حتى الإيقاف بـ Ctrl+C."""
+    service = QueryService(base_folder, cache_size)
+    handler = type('BoundQueryHandler', (QueryHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"✅ تم تحميل الفهرس: {len(service.corpus.doc_slugs)} وثيقة، {len(service.corpus)} مادة.")
+    print(f"🌐 الخدمة تعمل على http://{host}:{port} (للقراءة فقط). اضغط Ctrl+C للإيقاف.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 تم إيقاف الخدمة.")
+    finally:
+        server.server_close()
+
+# --- 4. التشغيل ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="خدمة استعلام محلية (HTTP/JSON) للقراءة فقط على المدونة المعالجة.")
+    parser.add_argument("--input", default="processed_systems_output", help="مجلد المخرجات")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE, help="عدد سجلات ALU في الذاكرة المؤقتة")
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        print(f"❌ لم يتم العثور على مجلد المخرجات: {args.input}")
+        exit()
+    serve(args.input, args.host, args.port, args.cache_size)
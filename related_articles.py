@@ -0,0 +1,168 @@
+import math
+import argparse
+from array import array
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+from arabic_text import normalize_arabic, strip_alu_markup, tokenize
+from splitter import load_yaml_and_content, create_yaml_header
+from corpus_manifest import CorpusManifest
+
+# --- ثوابت وإعدادات ---
+RELATED_TOP_K = 5               # عدد المواد ذات الصلة المكتوبة في رأس كل ALU
+MIN_SIMILARITY = 0.15           # أقل تشابه (جيب التمام) لاعتبار مادة ذات صلة
+KEYWORD_WEIGHT = 2              # وزن الكلمات المفتاحية مقارنة بكلمات النص
+MIN_DF = 2                      # الكلمات التي تظهر في أقل من هذا العدد من المواد لا تفيد في الربط
+MAX_DF_RATIO = 0.5              # الكلمات الشائعة جداً (كأدوات الربط) تُستبعد
+MEMORY_BUDGET_MB = 256          # سقف ذاكرة كتلة التشابه (صفوف الكتلة × عدد المواد في أسوأ الأحوال)
+MIN_LENGTH_TOKENS = 3           # المواد الأقصر من هذا لا تُربط (مثل "ملغاة")
+# ذاكرة كل قيمة غير صفرية في كتلة التشابه في أسوأ الأحوال: القيمة float32 (4) وفهرس العمود
+# (حتى int64: 8) في ناتج الضرب، ثم مصفوفة رقم الصف int64 (8) وأقنعة الاستبعاد المنطقية (3)
+BYTES_PER_BLOCK_ENTRY = 24
+
+# --- 1. قراءة المواد ---
+
+def iter_alu_files(base_folder):
+    """المرور على ملفات ALU في كل الوثائق بترتيب ثابت (من بيان المدونة)."""
+    yield from CorpusManifest.load(base_folder).iter_alu_paths()
+
+def alu_terms(metadata, text_content):
+    """كلمات المادة المُطبَّعة مع تكرار الكلمات المفتاحية بحسب وزنها."""
+    terms = tokenize(normalize_arabic(strip_alu_markup(text_content)))
+    keywords = metadata.get('keywords') or []
+    if isinstance(keywords, list):
+        keyword_terms = tokenize(normalize_arabic(' '.join(str(k) for k in keywords)))
+        terms.extend(keyword_terms * KEYWORD_WEIGHT)
+    return terms
+
+# --- 2. بناء مصفوفة TF-IDF المتناثرة ---
+
+def build_tfidf_matrix(alu_paths):
+    """
+    بناء مصفوفة TF-IDF (CSR) بمرورين على الملفات بدل الاحتفاظ بالنصوص في الذاكرة:
+    الأول لحساب تكرار الوثائق (DF)، والثاني لبناء الصفوف مباشرة في مصفوفات مضغوطة.
+    الصفوف مُطبَّعة (L2) فيصبح ضرب المصفوفات تشابه جيب التمام.
+    """
+    doc_freq = {}
+    for file_path in alu_paths:
+        metadata, text_content = load_yaml_and_content(file_path)
+        for term in set(alu_terms(metadata, text_content)):
+            doc_freq[term] = doc_freq.get(term, 0) + 1
+
+    total = len(alu_paths)
+    max_df = max(MIN_DF, int(total * MAX_DF_RATIO))
+    vocabulary = {}
+    idf = array('f')
+    for term, df in doc_freq.items():
+        if MIN_DF <= df <= max_df:
+            vocabulary[term] = len(vocabulary)
+            idf.append(math.log((1 + total) / (1 + df)) + 1.0)
+    del doc_freq
+
+    indptr = array('q', [0])
+    indices = array('i')
+    data = array('f')
+    for file_path in alu_paths:
+        metadata, text_content = load_yaml_and_content(file_path)
+        counts = {}
+        terms = alu_terms(metadata, text_content)
+        if len(terms) >= MIN_LENGTH_TOKENS:
+            for term in terms:
+                column = vocabulary.get(term)
+                if column is not None:
+                    counts[column] = counts.get(column, 0) + 1
+
+        weights = [(1.0 + math.log(tf)) * idf[column] for column, tf in counts.items()]
+        norm = math.sqrt(sum(w * w for w in weights)) or 1.0
+        indices.extend(counts.keys())
+        data.extend(w / norm for w in weights)
+        indptr.append(len(indices))
+
+    matrix = sparse.csr_matrix(
+        (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+        shape=(total, len(vocabulary)),
+    )
+    matrix.sort_indices()
+    return matrix, len(vocabulary)
+
+# --- 3. أقرب الجيران بضرب كتلي ---
+
+def block_rows(total, memory_budget_mb=MEMORY_BUDGET_MB):
+    """عدد الصفوف في كل كتلة بحيث لا تتجاوز كتلة التشابه ومؤقتاتها سقف الذاكرة حتى لو امتلأت بالكامل."""
+    return max(1, min(total, memory_budget_mb * 1024 * 1024 // (BYTES_PER_BLOCK_ENTRY * max(total, 1))))
+
+def top_k_neighbors(matrix, top_k=RELATED_TOP_K, min_similarity=MIN_SIMILARITY,
+                    memory_budget_mb=MEMORY_BUDGET_MB):
+    """
+    حساب أقرب k جيران لكل صف: ضرب كتلة من الصفوف في المصفوفة المنقولة،
+    حذف القيم الأقل من min_similarity، ثم argpartition لاختيار الأعلى دون ترتيب الصف كاملاً.
+    يعيد مولّداً يُنتج (رقم الصف، [(رقم الجار، التشابه), ...]) بالترتيب.
+    """
+    total = matrix.shape[0]
+    transposed = matrix.T.tocsr()
+    step = block_rows(total, memory_budget_mb)
+
+    for start in range(0, total, step):
+        stop = min(start + step, total)
+        block = matrix[start:stop] @ transposed
+
+        # استبعاد المادة نفسها والقيم تحت العتبة قبل الاختيار (تصغير الكتلة المتناثرة)
+        rows = np.repeat(np.arange(start, stop), np.diff(block.indptr))
+        block.data[(block.indices == rows) | (block.data < min_similarity)] = 0
+        block.eliminate_zeros()
+
+        for offset in range(stop - start):
+            low, high = block.indptr[offset], block.indptr[offset + 1]
+            scores = block.data[low:high]
+            columns = block.indices[low:high]
+            if len(scores) > top_k:
+                best = np.argpartition(scores, -top_k)[-top_k:]
+                scores, columns = scores[best], columns[best]
+            order = np.argsort(-scores, kind='stable')
+            yield start + offset, list(zip(columns[order].tolist(), scores[order].tolist()))
+
+# --- 4. كتابة الروابط في رؤوس ALU ---
+
+def build_related_index(base_folder="processed_systems_output", top_k=RELATED_TOP_K,
+                        min_similarity=MIN_SIMILARITY, memory_budget_mb=MEMORY_BUDGET_MB):
+    """بناء فهرس المواد ذات الصلة وكتابة الحقل 'related' في الملفات التي تغيرت روابطها فقط."""
+    alu_paths = list(iter_alu_files(base_folder))
+    if not alu_paths:
+        return {'alus': 0, 'vocabulary': 0, 'updated_files': 0}
+
+    matrix, vocabulary_size = build_tfidf_matrix(alu_paths)
+    print(f"  > مصفوفة TF-IDF: {matrix.shape[0]} مادة × {vocabulary_size} كلمة ({matrix.nnz} قيمة غير صفرية).")
+    print(f"  > حجم الكتلة: {block_rows(matrix.shape[0], memory_budget_mb)} صف.")
+
+    updated = 0
+    for row, neighbors in top_k_neighbors(matrix, top_k, min_similarity, memory_budget_mb):
+        file_path = alu_paths[row]
+        metadata, text_content = load_yaml_and_content(file_path)
+        related = [alu_paths[j].stem for j, _ in neighbors]
+        if metadata.get('related', []) == related:
+            continue
+        metadata['related'] = related
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(create_yaml_header(metadata) + text_content.strip())
+        updated += 1
+
+    return {'alus': len(alu_paths), 'vocabulary': vocabulary_size, 'updated_files': updated}
+
+# --- 5. التشغيل ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="بناء روابط المواد ذات الصلة عبر المدونة (TF-IDF محلي).")
+    parser.add_argument("--input", default="processed_systems_output", help="مجلد المخرجات")
+    parser.add_argument("--top-k", type=int, default=RELATED_TOP_K, help="عدد المواد ذات الصلة لكل مادة")
+    parser.add_argument("--min-similarity", type=float, default=MIN_SIMILARITY, help="أقل تشابه مقبول")
+    parser.add_argument("--memory-mb", type=int, default=MEMORY_BUDGET_MB, help="سقف ذاكرة كتلة التشابه")
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        print(f"❌ لم يتم العثور على مجلد المخرجات: {args.input}")
+        exit()
+
+    print("🔗 بدء بناء فهرس المواد ذات الصلة...")
+    stats = build_related_index(args.input, args.top_k, args.min_similarity, args.memory_mb)
+    print(f"✅ تمت معالجة {stats['alus']} مادة. ملفات محدثة: {stats['updated_files']}.")
@@ -0,0 +1,234 @@
+import re
+import json
+
+# --- 1. مخطط الاستجابة (Response Schema) ---
+
+ASPECT_PROCEDURAL = 'إجرائي'
+ASPECT_SUBSTANTIVE = 'موضوعي'
+ASPECT_LABELS = [ASPECT_PROCEDURAL, ASPECT_SUBSTANTIVE]
+
+# التسميات الخاطئة الشائعة وما يقابلها من التصنيف الصحيح
+ASPECT_ALIASES = {
+    'اجرائي': ASPECT_PROCEDURAL, 'إجرائية': ASPECT_PROCEDURAL, 'اجرائية': ASPECT_PROCEDURAL,
+    'إجرائى': ASPECT_PROCEDURAL, 'اجرائى': ASPECT_PROCEDURAL,
+    'procedural': ASPECT_PROCEDURAL, 'procedure': ASPECT_PROCEDURAL,
+    'موضوعية': ASPECT_SUBSTANTIVE, 'موضوعى': ASPECT_SUBSTANTIVE,
+    'substantive': ASPECT_SUBSTANTIVE, 'substantial': ASPECT_SUBSTANTIVE,
+}
+
+OCR_CORRECTION_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'original_word': {'type': 'STRING'},
+        'suggested_correction': {'type': 'STRING'},
+        'context': {'type': 'STRING'},
+    },
+    'required': ['original_word', 'suggested_correction'],
+}
+
+def build_response_schema(include_ocr=True, include_aspect=True):
+    """
+    مخطط JSON المُرسَل إلى Gemini (صيغة OpenAPI المدعومة في response_schema).
+    include_aspect=False عندما يحدد المصنف المحلي الجانب بثقة عالية (انظر aspect_classifier.py).
+    """
+    properties = {
+        'summary': {'type': 'STRING'},
+        'keywords': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+    }
+    required = ['summary', 'keywords']
+    if include_aspect:
+        properties['aspect'] = {'type': 'STRING', 'enum': ASPECT_LABELS}
+        required.append('aspect')
+    if include_ocr:
+        properties['ocr_corrections'] = {'type': 'ARRAY', 'items': OCR_CORRECTION_SCHEMA}
+        required.append('ocr_corrections')
+    return {'type': 'OBJECT', 'properties': properties, 'required': required}
+
+# --- 2. المُتحقِّق المُجمَّع مسبقاً (Precompiled Validator) ---
+
+_TYPE_CHECKS = {
+    'STRING': lambda v: isinstance(v, str),
+    'ARRAY': lambda v: isinstance(v, list),
+    'OBJECT': lambda v: isinstance(v, dict),
+}
+
+def compile_validator(schema, path='$'):
+    """
+    تحويل المخطط إلى دالة تحقق مرة واحدة، بدلاً من تفسير المخطط مع كل استجابة.
+    الدالة الناتجة تعيد قائمة بالأخطاء (فارغة إذا كانت البيانات صالحة).
+    """
+    type_check = _TYPE_CHECKS[schema['type']]
+    type_name = schema['type']
+    enum = set(schema['enum']) if 'enum' in schema else None
+
+    if type_name == 'OBJECT':
+        required = schema.get('required', [])
+        field_validators = [
+            (name, compile_validator(sub_schema, f"{path}.{name}"))
+            for name, sub_schema in schema.get('properties', {}).items()
+        ]
+
+        def validate(value):
+            if not type_check(value):
+                return [f"{path}: يجب أن يكون {type_name}"]
+            errors = [f"{path}.{name}: حقل مطلوب مفقود" for name in required if name not in value]
+            for name, validator in field_validators:
+                if name in value:
+                    errors.extend(validator(value[name]))
+            return errors
+        return validate
+
+    if type_name == 'ARRAY':
+        item_validator = compile_validator(schema['items'], f"{path}[]")
+
+        def validate(value):
+            if not type_check(value):
+                return [f"{path}: يجب أن يكون {type_name}"]
+            errors = []
+            for item in value:
+                errors.extend(item_validator(item))
+            return errors
+        return validate
+
+    def validate(value):
+        if not type_check(value):
+            return [f"{path}: يجب أن يكون {type_name}"]
+        if enum is not None and value not in enum:
+            return [f"{path}: قيمة غير مسموحة '{value}'"]
+        return []
+    return validate
+
+_VALIDATORS = {
+    (include_ocr, include_aspect): compile_validator(build_response_schema(include_ocr, include_aspect))
+    for include_ocr in (True, False) for include_aspect in (True, False)
+}
+
+def validate_response(data, include_ocr=True, include_aspect=True):
+    """التحقق من بيانات LLM بالمتحقق المُجمَّع المناسب."""
+    return _VALIDATORS[include_ocr, include_aspect](data)
+
+# --- 3. الإصلاح المحلي (Local Repair) ---
+
+class ResponseRepairError(ValueError):
+    """تعذر إصلاح استجابة LLM محلياً؛ يلزم إعادة الطلب."""
+
+def extract_json_object(raw_text):
+    """حذف أسوار Markdown والنص قبل أول '{' وبعد آخر '}' المطابق."""
+    text = re.sub(r'^\s*```(?:json)?\s*|\s*```\s*$', '', raw_text.strip())
+    start = text.find('{')
+    if start == -1:
+        raise ResponseRepairError("لا يوجد كائن JSON في الاستجابة.")
+    return text[start:]
+
+def close_truncated_json(text):
+    """
+    إغلاق JSON مقطوع: إنهاء السلسلة المفتوحة، حذف العنصر الأخير غير المكتمل،
+    ثم إغلاق المصفوفات والكائنات المفتوحة بالترتيب الصحيح.
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    last_safe = 0       # آخر موضع انتهى عنده عنصر كامل
+    end = None
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]':
+            if not stack:
+                break
+            stack.pop()
+            last_safe = i + 1
+            if not stack:
+                end = i + 1
+                break
+        elif char == ',':
+            last_safe = i
+
+    if end is not None:
+        return text[:end]  # الكائن مكتمل؛ أي نص بعده زائد
+
+    # كائن مقطوع: الرجوع إلى آخر عنصر كامل وإغلاق الأقواس المفتوحة عنده
+    truncated = text[:last_safe].rstrip().rstrip(',')
+    stack = []
+    in_string = False
+    escaped = False
+    for char in truncated:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]' and stack:
+            stack.pop()
+    return truncated + ''.join(reversed(stack))
+
+def normalize_fields(data, include_ocr=True):
+    """إصلاح العيوب الشائعة في الحقول: تسميات aspect، الكلمات المفتاحية كنص، عناصر OCR ناقصة."""
+    aspect = data.get('aspect')
+    if isinstance(aspect, str):
+        cleaned = aspect.strip().strip("'\"")
+        data['aspect'] = ASPECT_ALIASES.get(cleaned, ASPECT_ALIASES.get(cleaned.lower(), cleaned))
+
+    keywords = data.get('keywords')
+    if isinstance(keywords, str):
+        data['keywords'] = [k.strip() for k in re.split(r'[،,؛;\n]', keywords) if k.strip()]
+    elif isinstance(keywords, list):
+        data['keywords'] = [k.strip() for k in keywords if isinstance(k, str) and k.strip()]
+
+    if include_ocr:
+        corrections = data.get('ocr_corrections')
+        if corrections is None or isinstance(corrections, dict) and not corrections:
+            data['ocr_corrections'] = []
+        elif isinstance(corrections, list):
+            data['ocr_corrections'] = [
+                c for c in corrections
+                if isinstance(c, dict) and isinstance(c.get('original_word'), str)
+                and isinstance(c.get('suggested_correction'), str)
+            ]
+    else:
+        data.pop('ocr_corrections', None)
+    return data
+
+def parse_llm_response(raw_text, include_ocr=True, include_aspect=True):
+    """
+    تحليل استجابة LLM والتحقق منها، مع إصلاح محلي عند الحاجة.
+    يعيد (البيانات، هل تم إصلاحها) أو يرفع ResponseRepairError إذا فشل الإصلاح.
+    """
+    try:
+        data = json.loads(raw_text)
+        repaired = False
+    except json.JSONDecodeError:
+        try:
+            data = json.loads(close_truncated_json(extract_json_object(raw_text)))
+        except json.JSONDecodeError as e:
+            raise ResponseRepairError(f"تعذر إصلاح JSON: {e}")
+        repaired = True
+
+    if not isinstance(data, dict):
+        raise ResponseRepairError("الاستجابة ليست كائن JSON.")
+
+    if not validate_response(data, include_ocr, include_aspect):
+        return data, repaired
+
+    data = normalize_fields(data, include_ocr)
+    errors = validate_response(data, include_ocr, include_aspect)
+    if errors:
+        raise ResponseRepairError("؛ ".join(errors))
+    return data, True
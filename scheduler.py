@@ -0,0 +1,142 @@
+import time
+import heapq
+import argparse
+from pathlib import Path
+
+from corpus import read_header
+from build_state import BuildState
+from corpus_manifest import CorpusManifest
+
+# --- ثوابت وإعدادات ---
+# ترتيب الأولوية حسب حالة الوثيقة (الحقل 'الحالة' في المصدر): الأنظمة السارية أولاً
+STATUS_PRIORITY = {
+    'قيد التطبيق': 0, 'ساري': 0, 'نافذ': 0,
+    'معدل': 1,
+    'معلق': 2,
+    'ملغى': 3, 'ملغي': 3, 'ملغاة': 3,
+}
+DEFAULT_STATUS_RANK = 1
+RECENT_DAYS = 30                  # الوثائق التي أعيد تقسيمها خلال هذه المدة (عُدلت حديثاً) تتقدم
+SLICE_SIZE = 50                   # الوثائق الكبيرة تُعالج على شرائح بهذا العدد من المواد
+ESTIMATED_SECONDS_PER_ALU = 5.0   # متوسط زمن إثراء المادة (لتقدير أوقات الانتهاء)
+
+# --- 1. مهام الوثائق ---
+
+def document_jobs(corpus_manifest, doc_slugs, build_state, prompt_version, model, force=False, pinned=()):
+    """
+    بناء مهمة لكل وثيقة فيها مواد تحتاج إلى إثراء: المواد المعلقة (بترتيب بيان المدونة)،
+    حالة الوثيقة، التثبيت، الحداثة، والكلفة التقديرية (عدد المواد المعلقة).
+    """
+    now = time.time()
+    pinned = set(pinned)
+    jobs = []
+    for doc_slug in doc_slugs:
+        alu_ids = corpus_manifest.alu_ids(doc_slug)
+        stale = None if force else build_state.stale_alus(doc_slug, prompt_version, model)
+        pending = alu_ids if stale is None else [alu_id for alu_id in alu_ids if alu_id in stale]
+        if not pending:
+            continue
+
+        parent_metadata = read_header(corpus_manifest.parent_path(doc_slug))
+        row = build_state.by_slug.get(doc_slug) or {}
+        split_at = row.get('split_at') or 0
+        jobs.append({
+            'doc': doc_slug,
+            'alu_ids': pending,
+            'status': parent_metadata.get('الحالة') or parent_metadata.get('status'),
+            'pinned': doc_slug in pinned,
+            'recent': now - split_at < RECENT_DAYS * 86400,
+            'cost': len(pending),
+        })
+    return jobs
+
+def priority_key(job):
+    """مفتاح الأولوية الصارمة: المثبتة، ثم حسب الحالة، ثم المعدلة حديثاً."""
+    return (
+        0 if job['pinned'] else 1,
+        STATUS_PRIORITY.get(job['status'], DEFAULT_STATUS_RANK),
+        0 if job['recent'] else 1,
+    )
+
+def document_order(jobs):
+    """ترتيب الوثائق كاملة: الأولوية ثم الأقصر أولاً (يُستخدم لأولويات الطابور الموزع)."""
+    return sorted(jobs, key=lambda job: (priority_key(job), job['cost'], job['doc']))
+
+# --- 2. الجدولة على شرائح ---
+
+def build_schedule(jobs, slice_size=SLICE_SIZE):
+    """
+    جدولة الشرائح بالتناوب داخل كل فئة أولوية: في كل دورة تُعالج شريحة واحدة من كل وثيقة
+    لم تنتهِ، الأقصر أولاً (بكلفتها الأصلية). الوثائق التي تتسع لها شريحة واحدة تنتهي في الدورة الأولى
+    فلا تحجبها وثيقة كبيرة، والوثائق الكبيرة تتقدم معاً شريحة بشريحة بدلاً من أن تنتظر كل منها انتهاء الأخرى.
+    يعيد قائمة من {'doc', 'alu_ids', 'final'}.
+    """
+    # رقم الدورة بعد مفتاح الأولوية: الوثيقة تعود بعد شريحتها إلى آخر دورتها التالية،
+    # والكلفة الأصلية (لا المتبقي) ترتبها داخل الدورة، وإلا أعيد اختيار الوثيقة نفسها حتى تنتهي
+    heap = [(priority_key(job), 0, job['cost'], job['doc'], 0) for job in jobs]
+    heapq.heapify(heap)
+    by_doc = {job['doc']: job for job in jobs}
+
+    slices = []
+    while heap:
+        key, round_number, cost, doc_slug, offset = heapq.heappop(heap)
+        alu_ids = by_doc[doc_slug]['alu_ids'][offset:offset + slice_size]
+        offset += len(alu_ids)
+        final = offset >= cost
+        slices.append({'doc': doc_slug, 'alu_ids': alu_ids, 'final': final})
+        if not final:
+            heapq.heappush(heap, (key, round_number + 1, cost, doc_slug, offset))
+    return slices
+
+# --- 3. تقدير أوقات الانتهاء ---
+
+def project_completion(slices, seconds_per_alu=ESTIMATED_SECONDS_PER_ALU, start=None):
+    """وقت الانتهاء المتوقع لكل وثيقة (عند آخر شريحة منها) بافتراض معالجة تسلسلية."""
+    clock = start if start is not None else time.time()
+    projection = []
+    for item in slices:
+        clock += len(item['alu_ids']) * seconds_per_alu
+        if item['final']:
+            projection.append({'doc': item['doc'], 'finish_at': clock})
+    return projection
+
+def print_projection(jobs, projection, start=None, limit=20):
+    """طباعة خطة التشغيل: ترتيب الانتهاء والوقت المتوقع لكل وثيقة."""
+    start = start if start is not None else time.time()
+    by_doc = {job['doc']: job for job in jobs}
+    total_alus = sum(job['cost'] for job in jobs)
+    print(f"🗓️ خطة الإثراء: {len(jobs)} وثيقة، {total_alus} مادة.")
+    for entry in projection[:limit]:
+        job = by_doc[entry['doc']]
+        flags = ('📌 ' if job['pinned'] else '') + (job['status'] or 'غير محدد')
+        minutes = (entry['finish_at'] - start) / 60
+        print(f"  - {entry['doc']} ({job['cost']} مادة، {flags}): "
+              f"الانتهاء المتوقع {time.strftime('%H:%M', time.localtime(entry['finish_at']))} (بعد {minutes:.1f} د)")
+    if len(projection) > limit:
+        print(f"  ... و{len(projection) - limit} وثيقة أخرى.")
+    if projection:
+        print(f"  > الانتهاء المتوقع للتشغيل كاملاً: {time.strftime('%Y-%m-%d %H:%M', time.localtime(projection[-1]['finish_at']))}")
+
+# --- 4. التشغيل المستقل (عرض الخطة دون إثراء) ---
+if __name__ == "__main__":
+    from enricher import PROMPT_VERSION, MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="عرض ترتيب الإثراء وأوقات الانتهاء المتوقعة.")
+    parser.add_argument("--input", default="processed_systems_output", help="مجلد المخرجات")
+    parser.add_argument("--pin", action="append", default=[], help="وثيقة تُقدَّم على غيرها (يمكن تكرارها)")
+    parser.add_argument("--seconds-per-alu", type=float, default=ESTIMATED_SECONDS_PER_ALU)
+    parser.add_argument("--slice-size", type=int, default=SLICE_SIZE)
+    parser.add_argument("--force", action="store_true", help="جدولة كل المواد وليس المتقادمة فقط")
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        print(f"❌ لم يتم العثور على مجلد المخرجات: {args.input}")
+        exit()
+
+    state = BuildState(args.input)
+    corpus_manifest = CorpusManifest.load(args.input)
+    jobs = document_jobs(corpus_manifest, corpus_manifest.doc_slugs, state, PROMPT_VERSION, MODEL_NAME, args.force, args.pin)
+    state.close()
+
+    slices = build_schedule(jobs, args.slice_size)
+    print_projection(jobs, project_completion(slices, args.seconds_per_alu), limit=50)
@@ -1,11 +1,25 @@
 import os
 import re
 import yaml
+import sys
 import json
+import shutil
 import traceback
 from pathlib import Path
 from collections import defaultdict
 
+from dedup_index import find_duplicate_sources
+from build_state import BuildState, text_hash, read_manifest_alus
+from arabic_text import strip_alu_markup
+from corpus_manifest import CorpusManifest, document_entry
+
+# --- ثوابت وإعدادات ---
+SPLITTER_VERSION = "2" # تُرفع عند تغيير منطق التقسيم حتى تُعاد معالجة كل الوثائق
+RETIRED_FOLDER = "retired" # مجلد المواد المحذوفة من النسخ المعدلة (داخل مجلد الوثيقة)
+PARENT_INDEX_HEADING = "## فهرس المواد"
+PARENT_INDEX_PLACEHOLDER = "[يتم تحديث الفهرس لاحقاً بعد الإثراء]" # يستبدله parent_index.py بفهرس المواد بعد الإثراء
+GENERATED_PARENT_FIELDS = ('summary', 'keywords') # يكتبها document_summaries.py في رأس الملف الأم وتُحفظ عند إعادة التقسيم
+
 # --- 1. التوابع المساعدة الأساسية (Core Utility Functions) ---
 
 def slugify(text):
@@ -99,13 +113,68 @@ def save_alu_file(alu_metadata, alu_text_content, output_path):
         f.write(final_content)
     return alu_file_path
 
+def load_existing_alus(doc_output_path, doc_slug):
+    """
+    تحميل ملفات ALU الموجودة مسبقاً للوثيقة (من تقسيم سابق) مع بصمة نصها.
+    يعيد {alu_id: {'metadata': ..., 'hash': ..., 'body_hash': ..., 'path': ...}}.
+    """
+    existing = {}
+    for file_path in doc_output_path.glob(f"{doc_slug}--مادة-*.md"):
+        old_metadata, old_content = load_yaml_and_content(file_path)
+        alu_id = old_metadata.get('id') or file_path.stem
+        existing[alu_id] = {
+            'metadata': old_metadata,
+            'hash': text_hash(old_content),
+            'body_hash': body_hash(old_content),
+            'path': file_path,
+        }
+    return existing
+
+def body_hash(alu_content):
+    """بصمة نص المادة دون عنوانها ومرساتها (لمطابقة المواد المعاد ترقيمها)."""
+    return text_hash(' '.join(strip_alu_markup(alu_content).split()))
+
+def load_ocr_replacer(base_output_folder):
+    """
+    مستبدل التصحيحات المقبولة في ocr_corrections_table.json (أو None): يُطبَّق على نصوص المواد
+    عند كل تقسيم حتى لا تُلغي إعادة التقسيم تصحيحات ocr_applier.py (المصدر نفسه لا يُعدَّل).
+    """
+    # استيراد متأخر: ocr_applier يستورد splitter
+    from ocr_applier import load_corrections_table, accepted_replacements, AhoCorasickReplacer
+    replacements = accepted_replacements(load_corrections_table(base_output_folder))
+    return AhoCorasickReplacer(replacements) if replacements else None
+
+def retire_alu_file(file_path, doc_output_path):
+    """نقل ALU لم تعد موجودة في النسخة الجديدة إلى المجلد الفرعي retired/ (بدلاً من حذفها)."""
+    retired_path = doc_output_path / RETIRED_FOLDER
+    retired_path.mkdir(exist_ok=True)
+    os.replace(file_path, retired_path / file_path.name)
+
+def retire_document(doc_slug, base_output_folder, corpus_manifest, build_state):
+    """
+    وثيقة حُذف ملفها المصدر: تُحذف من بيان المدونة وحالة البناء حتى لا تعالجها الأدوات بعد الآن،
+    وينقل مجلدها إلى retired/ في مجلد المخرجات (بدلاً من حذفه، وخارج ما تسرده إعادة بناء البيان).
+    """
+    corpus_manifest.remove_document(doc_slug)
+    build_state.remove_document(doc_slug)
+    doc_output_path = Path(base_output_folder) / doc_slug
+    if doc_output_path.is_dir():
+        retired_path = Path(base_output_folder) / RETIRED_FOLDER
+        retired_path.mkdir(exist_ok=True)
+        target = retired_path / doc_slug
+        if target.exists():
+            shutil.rmtree(target)
+        os.replace(doc_output_path, target)
+
 # --- 3. الوظيفة الرئيسية (Main Processing Function) ---
 
-def process_split_file(input_file_path, base_output_folder="processed_systems_output"):
+def process_split_file(input_file_path, base_output_folder="processed_systems_output", corpus_manifest=None):
     """
     الوظيفة الرئيسية لقراءة الملف المصدر وتقسيمه إلى وحدات ذرية (ALUs).
     
-    هذه الوظيفة تم تعديلها لتنشئ مجلداً فرعياً لكل وثيقة.
+    هذه الوظيفة تم تعديلها لتنشئ مجلداً فرعياً لكل وثيقة، وتعيد الـ Slug الخاص بها.
+    corpus_manifest: بيان المدونة (CorpusManifest) الذي يحفظه المستدعي دفعة واحدة؛
+                     إذا لم يُمرَّر يُحدَّث البيان ويُحفظ فوراً لهذه الوثيقة.
     """
     
     log_entries = []
@@ -146,7 +215,7 @@ def process_split_file(input_file_path, base_output_folder="processed_systems_ou
     materials_text = materials_section_match.group(1)
     
     # إزالة قسم المواد من المحتوى الأصلي (الذي سيصبح الملف الأم)
-    parent_content = full_content.replace(materials_text, "## فهرس المواد\n\n[يتم تحديث الفهرس لاحقاً بعد الإثراء]")
+    parent_content = full_content.replace(materials_text, f"{PARENT_INDEX_HEADING}\n\n{PARENT_INDEX_PLACEHOLDER}")
     
     # تقسيم نصوص المواد إلى مواد فردية (ALUs)
     alu_splits = re.split(r'\n\s*\*\*المادة\s*(\d+)\s*\*\*\s*\n', materials_text, flags=re.IGNORECASE)
@@ -172,6 +241,15 @@ def process_split_file(input_file_path, base_output_folder="processed_systems_ou
     # 3. حفظ الملفات الذرية والملف الأم
 
     manifest_data = {'doc': doc_slug, 'parent_file': f"{doc_slug}.md", 'alus': []}
+    ocr_replacer = load_ocr_replacer(base_output_folder)
+    
+    # إعادة التقسيم التفاضلي: مطابقة المواد الجديدة بالموجودة (بالرقم ثم ببصمة النص)
+    # للاحتفاظ بإثراء المواد التي لم يتغير نصها بدلاً من الكتابة فوقه
+    existing_alus = load_existing_alus(doc_output_path, doc_slug)
+    existing_by_body = {}
+    for old_id, old in existing_alus.items():
+        existing_by_body.setdefault(old['body_hash'], old_id)
+    diff_counts = {'unchanged': 0, 'renumbered': 0, 'changed': 0, 'added': 0, 'retired': 0}
     
     for i, (article_number, article_content) in enumerate(alu_list):
         # تحديد الـ ID والروابط
@@ -194,16 +272,70 @@ def process_split_file(input_file_path, base_output_folder="processed_systems_ou
             # سيتم إضافة 'summary' و 'keywords' و 'ocr_corrections' لاحقاً بواسطة enricher.py
         }
         
-        # حفظ ملف ALU
+        # إعادة تطبيق تصحيحات OCR المقبولة: بصمة المادة هي بصمة نصها المصحح
+        if ocr_replacer is not None:
+            article_content, ocr_counts = ocr_replacer.replace(article_content)
+            if ocr_counts:
+                alu_metadata['ocr_applied'] = {original: ocr_replacer.replacements[original] for original in ocr_counts}
+        
         alu_content = f"# المادة {article_number}\n{article_content} {{#art-{article_number}}}"
-        save_alu_file(alu_metadata, alu_content, doc_output_path) # <--- حفظ في المجلد الفرعي
+        alu_hash = text_hash(alu_content)
+        
+        manifest_entry = {'id': alu_id, 'file': f"{alu_id}.md", 'hash': alu_hash}
+        
+        # البحث عن نسخة سابقة: نفس المعرف ونفس النص، أو نفس النص تحت رقم مختلف (إعادة ترقيم)
+        old = existing_alus.get(alu_id)
+        if old is not None and old['hash'] == alu_hash:
+            state = 'unchanged'
+        else:
+            old_id = existing_by_body.get(body_hash(alu_content))
+            old = existing_alus[old_id] if old_id and old_id != alu_id else None
+            state = 'renumbered'
         
-        log_entries.append(f"  - Saved ALU: {alu_id}.md")
-        manifest_data['alus'].append({'id': alu_id, 'file': f"{alu_id}.md"})
+        if old is not None:
+            # نحتفظ بحقول الإثراء ونحدّث الحقول التي يتحكم بها المقسِّم فقط
+            preserved = {k: v for k, v in old['metadata'].items() if k not in alu_metadata}
+            alu_metadata.update(preserved)
+            if state == 'renumbered':
+                manifest_entry['previous_hash'] = old['hash']
+            if state == 'renumbered' or alu_metadata != old['metadata']:
+                save_alu_file(alu_metadata, alu_content, doc_output_path)
+            log_entries.append(f"  - Kept ALU: {alu_id}.md ({state})")
+        else:
+            # حفظ ملف ALU
+            state = 'changed' if alu_id in existing_alus else 'added'
+            save_alu_file(alu_metadata, alu_content, doc_output_path) # <--- حفظ في المجلد الفرعي
+            log_entries.append(f"  - Saved ALU: {alu_id}.md ({state})")
+        
+        diff_counts[state] += 1
+        manifest_entry['state'] = state
+        manifest_data['alus'].append(manifest_entry)
+    
+    # المواد التي لم تعد موجودة في النسخة الجديدة تُنقل إلى مجلد retired/
+    new_ids = {entry['id'] for entry in manifest_data['alus']}
+    for old_id, old in existing_alus.items():
+        if old_id not in new_ids and old['path'].exists():
+            retire_alu_file(old['path'], doc_output_path)
+            diff_counts['retired'] += 1
+            log_entries.append(f"  - Retired ALU: {old['path'].name}")
+    manifest_data['diff'] = diff_counts
+    log_entries.append(
+        f"5b. Differential Re-split: {diff_counts['unchanged']} unchanged, {diff_counts['renumbered']} renumbered, "
+        f"{diff_counts['changed']} changed, "
+        f"{diff_counts['added']} added, {diff_counts['retired']} retired."
+    )
 
     # تحديث البيانات الوصفية للملف الأم وإضافة فهرس مبسط
     parent_metadata = metadata.copy()
     parent_metadata['articles'] = f"{alu_list[0][0]}-{alu_list[-1][0]}"
+    # ملخص الوثيقة وكلماتها المفتاحية المولدة سابقاً تُحفظ كما تُحفظ حقول إثراء المواد،
+    # وإلا أعاد كل تقسيم الملخص الثابت بينما يسجل البيان مرحلة التلخيص مكتملة
+    parent_file_path = doc_output_path / f"{doc_slug}.md"
+    if parent_file_path.exists():
+        old_parent_metadata, _ = load_yaml_and_content(parent_file_path)
+        for field in GENERATED_PARENT_FIELDS:
+            if field not in parent_metadata and old_parent_metadata.get(field):
+                parent_metadata[field] = old_parent_metadata[field]
     parent_metadata['summary'] = parent_metadata.get('summary', 'النصوص التمهيدية والديباجة.')
     
     # حفظ الملف الأم المُعالج
@@ -215,8 +347,35 @@ def process_split_file(input_file_path, base_output_folder="processed_systems_ou
     save_manifest_file(doc_slug, [manifest_data], doc_output_path) # <--- حفظ في المجلد الفرعي
     log_entries.append("7. Manifest Generation: Created manifest and log files.")
     
+    # تحديث مدخل الوثيقة في بيان المدونة الموحد (مصدر اكتشاف العمل لكل الأدوات)
+    owns_manifest = corpus_manifest is None
+    if owns_manifest:
+        corpus_manifest = CorpusManifest.load(base_output_folder)
+    corpus_manifest.set_document(doc_slug, document_entry(manifest_data, input_file_path, SPLITTER_VERSION))
+    
+    # فهرس المواد في الملف الأم يُعاد توليده فوراً من رؤوس المواد (المحفوظ إثراؤها) بدلاً من العنصر النائب:
+    # إعادة التقسيم التي لا تغير أي مادة لا يعقبها إثراء للوثيقة يعيد كتابة الفهرس
+    # (استيراد متأخر: parent_index يستورد splitter)
+    from parent_index import update_document_index
+    update_document_index(corpus_manifest, doc_slug)
+    if owns_manifest:
+        corpus_manifest.save()
+    
     print(f"  ✅ اكتمل التقسيم بنجاح. تم حفظ {len(alu_list)} مادة في المجلد الفرعي.")
-    return True
+    return doc_slug
+
+def split_and_record(input_file_path, build_state, base_output_folder="processed_systems_output", corpus_manifest=None):
+    """تقسيم وثيقة ثم تسجيل بصمات موادها في حالة البناء."""
+    doc_slug = process_split_file(input_file_path, base_output_folder, corpus_manifest)
+    alus = read_manifest_alus(Path(base_output_folder) / doc_slug, doc_slug)
+    alu_hashes = {alu['id']: alu.get('hash') for alu in alus}
+    carried_over = {alu['id']: alu['previous_hash'] for alu in alus if alu.get('previous_hash')}
+    # المقسِّم يحتفظ بإثراء المواد غير المتغيرة، فيبقى إثراؤها صالحاً في حالة البناء
+    build_state.record_split(
+        input_file_path, doc_slug, SPLITTER_VERSION, alu_hashes,
+        preserved_enrichment=True, carried_over=carried_over,
+    )
+    return doc_slug
 
 # --- 4. التشغيل الدفعي (Batch Execution) ---
 if __name__ == "__main__":
@@ -235,16 +394,39 @@ if __name__ == "__main__":
         print(f"❌ لم يتم العثور على أي ملفات .md في {source_folder}.")
         exit()
         
-    print(f"✅ تم تحميل الكود بنجاح. بدء معالجة {len(source_files)} ملف بشكل دفعي...")
+    # تحديد الوثائق المتقادمة فقط (فحص الوقت/الحجم ثم البصمة) ما لم يُطلب إعادة البناء بالكامل
+    output_folder = "processed_systems_output"
+    build_state = BuildState(output_folder)
+    force_rebuild = '--force' in sys.argv
+    stale_files = [f for f in source_files if force_rebuild or build_state.is_split_stale(f, SPLITTER_VERSION)]
     
-    for file_path in source_files:
-        print("\n" + "="*70)
-        print(f"--- بدء معالجة الملف: {file_path.name} ---")
-        try:
-            process_split_file(file_path)
-        except Exception as e:
-            print(f"❌ فشل معالجة {file_path.name}. الخطأ: {e}")
-            traceback.print_exc()
+    print(f"✅ تم تحميل الكود بنجاح. {len(stale_files)} من {len(source_files)} ملف تحتاج إلى التقسيم...")
+    
+    # التنبيه على الوثائق المصدرية المكررة قبل التقسيم
+    if stale_files:
+        for original, duplicate, similarity, method in find_duplicate_sources(source_files, stale_files, output_folder):
+            print(f"⚠️ وثيقة مكررة محتملة: {Path(duplicate).name} ≈ {Path(original).name} ({method}, {similarity:.2f})")
+    
+    # بيان المدونة يُحدَّث في الذاكرة لكل وثيقة ويُحفظ مرة واحدة في نهاية الدفعة
+    corpus_manifest = CorpusManifest.load(output_folder)
+    try:
+        for file_path in stale_files:
+            print("\n" + "="*70)
+            print(f"--- بدء معالجة الملف: {file_path.name} ---")
+            try:
+                split_and_record(file_path, build_state, output_folder, corpus_manifest)
+            except Exception as e:
+                print(f"❌ فشل معالجة {file_path.name}. الخطأ: {e}")
+                traceback.print_exc()
+        
+        # الوثائق التي حُذف ملفها المصدر تُزال من البيان (وإلا بقيت الأدوات تعالجها إلى الأبد)
+        for doc_slug in corpus_manifest.doc_slugs:
+            doc_source = corpus_manifest.source_path(doc_slug)
+            if doc_source is not None and not doc_source.exists():
+                retire_document(doc_slug, output_folder, corpus_manifest, build_state)
+                print(f"🗑️ حُذف المصدر {doc_source.name}: أُزيلت الوثيقة {doc_slug} ونُقل مجلدها إلى {RETIRED_FOLDER}/.")
+    finally:
+        corpus_manifest.save()
 
     print("\n" + "="*70)
     print("✅ اكتملت معالجة جميع الملفات في الدفعة.")
@@ -0,0 +1,192 @@
+from collections import Counter
+
+from response_schema import ResponseRepairError
+
+# --- ثوابت وإعدادات ---
+
+# ميزانية كل حقل في الاستجابة: عدد الأحرف داخل السلاسل وعدد عناصر المصفوفة
+FIELD_BUDGETS = {
+    'summary': {'chars': 600},
+    'keywords': {'chars': 600, 'items': 15},
+    'aspect': {'chars': 40},
+    'ocr_corrections': {'chars': 6000, 'items': 40},
+}
+DEFAULT_FIELD_BUDGET = {'chars': 500}
+MAX_TOTAL_CHARS = 10000     # سقف طول الاستجابة كاملة
+REPEAT_WINDOW = 40          # طول المقطع المستخدم لكشف تكرار النص
+REPEAT_LIMIT = 4            # عدد مرات ظهور المقطع داخل الحقل نفسه قبل اعتباره تكراراً منفلتاً
+REPEAT_CHECK_EVERY = 200    # فحص التكرار كل هذا العدد من الأحرف
+
+LITERAL_CHARS = set('0123456789-+.eEtruefalsn')
+
+# تعليمات إضافية لإعادة المحاولة بعد قطع الاستجابة
+TIGHTENED_INSTRUCTION = (
+    "\n    **[تنبيه] تم قطع الاستجابة السابقة لتجاوزها الحدود المسموحة. التزم بدقة بما يلي:**\n"
+    "    - الملخص 30 كلمة كحد أقصى، و5-8 كلمات مفتاحية فقط.\n"
+    "    - 20 تصحيح OCR كحد أقصى، ولا تذكر إلا الأخطاء المؤكدة.\n"
+    "    - لا تكرر أي نص، وأخرج كائن JSON واحداً فقط.\n"
+)
+TIGHTENED_MAX_OUTPUT_TOKENS = 2048
+
+# --- 1. الاستثناءات ---
+
+class StreamAborted(ResponseRepairError):
+    """قُطع البث مبكراً لأن الاستجابة تجاوزت الميزانية أو لم تعد JSON صالحاً."""
+
+    def __init__(self, reason, partial_text='', output_tokens=0):
+        super().__init__(reason)
+        self.reason = reason
+        self.partial_text = partial_text
+        self.output_tokens = output_tokens
+
+# --- 2. المحلل التزايدي (Incremental JSON Guard) ---
+
+class IncrementalJSONGuard:
+    """
+    محلل JSON تزايدي يُغذّى بأجزاء البث حرفاً بحرف.
+    لا يبني الكائن، بل يتتبع البنية والحقل الحالي ليقطع البث فور تجاوز الميزانية.
+    """
+
+    def __init__(self, budgets=FIELD_BUDGETS, max_total_chars=MAX_TOTAL_CHARS):
+        self.budgets = budgets
+        self.max_total_chars = max_total_chars
+        self.stack = []
+        self.in_string = False
+        self.escaped = False
+        self.started = False
+        self.finished = False
+        self.key_buffer = None        # يجمع اسم المفتاح في المستوى الأول
+        self.in_nested_key = False    # مفاتيح الكائنات الداخلية لا تُحتسب ضمن نص الحقل
+        self.current_field = None
+        self.last_sig = None          # آخر حرف مهم خارج السلاسل
+        self.total_chars = 0
+        self.field_chars = Counter()
+        self.field_items = Counter()
+        self.field_text = {}
+
+    def feed(self, chunk):
+        for char in chunk:
+            self._consume(char)
+
+    def _abort(self, reason):
+        raise StreamAborted(reason)
+
+    def _budget(self, field):
+        return self.budgets.get(field, DEFAULT_FIELD_BUDGET)
+
+    def _count_char(self, char):
+        field = self.current_field
+        self.field_chars[field] += 1
+        if self.field_chars[field] > self._budget(field).get('chars', float('inf')):
+            self._abort(f"تجاوز الحقل '{field}' حد الأحرف")
+
+        text = self.field_text.setdefault(field, [])
+        text.append(char)
+        if len(text) % REPEAT_CHECK_EVERY == 0 and len(text) >= REPEAT_WINDOW * REPEAT_LIMIT:
+            joined = ''.join(text)
+            if joined.count(joined[-REPEAT_WINDOW:]) >= REPEAT_LIMIT:
+                self._abort(f"تكرار منفلت للنص في الحقل '{field}'")
+
+    def _value_start(self, depth):
+        # بداية عنصر جديد داخل مصفوفة الحقل (المستوى الثاني)
+        if depth == 2 and self.current_field and self.stack[-1] == '[' and self.last_sig in ('[', ','):
+            field = self.current_field
+            self.field_items[field] += 1
+            if self.field_items[field] > self._budget(field).get('items', float('inf')):
+                self._abort(f"تجاوز الحقل '{field}' حد العناصر")
+
+    def _consume(self, char):
+        self.total_chars += 1
+        if self.total_chars > self.max_total_chars:
+            self._abort("تجاوز طول الاستجابة الحد الأقصى")
+
+        if self.in_string:
+            if self.escaped:
+                self.escaped = False
+            elif char == '\\':
+                self.escaped = True
+            elif char == '"':
+                self.in_string = False
+                if self.key_buffer is not None:
+                    self.current_field = ''.join(self.key_buffer)
+                    self.key_buffer = None
+                self.in_nested_key = False
+                return
+            if self.key_buffer is not None:
+                self.key_buffer.append(char)
+            elif self.current_field and not self.in_nested_key:
+                self._count_char(char)
+            return
+
+        if char.isspace():
+            return
+        if self.finished:
+            self._abort("نص زائد بعد نهاية كائن JSON")
+        if not self.started:
+            if char != '{':
+                self._abort("الاستجابة لا تبدأ بكائن JSON")
+            self.started = True
+
+        depth = len(self.stack)
+        if char == '"':
+            is_key = depth and self.stack[-1] == '{' and self.last_sig in ('{', ',')
+            if is_key and depth == 1:
+                self.key_buffer = []
+            elif is_key:
+                self.in_nested_key = True
+            else:
+                self._value_start(depth)
+            self.in_string = True
+        elif char in '{[':
+            if depth:
+                self._value_start(depth)
+            self.stack.append(char)
+        elif char in '}]':
+            expected = '{' if char == '}' else '['
+            if not self.stack or self.stack[-1] != expected:
+                self._abort("أقواس غير متطابقة في JSON")
+            self.stack.pop()
+            if not self.stack:
+                self.finished = True
+        elif char == ',':
+            if depth == 1:
+                self.current_field = None
+        elif char == ':':
+            pass
+        elif char in LITERAL_CHARS:
+            if self.last_sig not in LITERAL_CHARS:
+                self._value_start(depth)
+        else:
+            self._abort(f"حرف غير متوقع خارج السلاسل: '{char}'")
+        self.last_sig = char
+
+# --- 3. الاستدعاء المتدفق ---
+
+def stream_generate_content(client, model, contents, config, guard=None):
+    """
+    استهلاك generate_content كبث مع مراقبة تزايدية.
+    يعيد (النص الكامل، توكنات المخرج) أو يرفع StreamAborted بعد إغلاق البث.
+    """
+    guard = guard or IncrementalJSONGuard()
+    parts = []
+    usage = None
+    stream = client.models.generate_content_stream(model=model, contents=contents, config=config)
+    try:
+        for chunk in stream:
+            if getattr(chunk, 'usage_metadata', None):
+                usage = chunk.usage_metadata
+            text = chunk.text or ''
+            parts.append(text)
+            guard.feed(text)
+    except StreamAborted as e:
+        partial_text = ''.join(parts)
+        # التوكنات المستهلكة حتى لحظة القطع (أو تقديرها من طول النص إذا لم تصل بيانات الاستخدام)
+        tokens = getattr(usage, 'candidates_token_count', None) or len(partial_text) // 4
+        raise StreamAborted(e.reason, partial_text, tokens)
+    finally:
+        close = getattr(stream, 'close', None)
+        if close:
+            close()
+
+    output_tokens = getattr(usage, 'candidates_token_count', None) or 0
+    return ''.join(parts), output_tokens
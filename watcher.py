@@ -0,0 +1,275 @@
+import os
+import sys
+import json
+import time
+import queue
+import select
+import struct
+import argparse
+import threading
+import traceback
+from pathlib import Path
+
+from splitter import split_and_record, SPLITTER_VERSION
+from build_state import BuildState, file_hash
+from enricher import process_enrichment
+
+# --- ثوابت وإعدادات ---
+DEBOUNCE_SECONDS = 2.0        # انتظار هدوء الأحداث على الملف قبل معالجته
+POLL_INTERVAL = 5.0           # فترة الفحص الدوري عند عدم توفر inotify
+STATUS_INTERVAL = 30.0        # فترة طباعة حالة الطابور
+STATUS_FILE = "watcher_status.json"  # يُكتب داخل مجلد المخرجات لمتابعة عمق الطابور والتأخير
+
+# أحداث inotify المستخدمة (من linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+EVENT_HEADER = struct.Struct('iIII')
+
+# --- 1. مصادر الأحداث (inotify أو الفحص الدوري) ---
+
+class InotifySource:
+    """مراقبة مجلد عبر inotify مباشرة من libc (لينكس فقط، دون مكتبات إضافية)."""
+
+    def __init__(self, folder):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(self.fd, str(folder).encode(), WATCH_MASK)
+        if wd < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+        self.folder = Path(folder)
+
+    def wait(self, timeout):
+        """انتظار الأحداث حتى timeout ثانية. يعيد أسماء الملفات المتأثرة."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        paths = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, _, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b'\0').decode('utf-8', 'replace')
+            offset += name_len
+            if name.endswith('.md'):
+                paths.append(self.folder / name)
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingSource:
+    """بديل الفحص الدوري: مقارنة (وقت التعديل، الحجم) لملفات .md في كل دورة."""
+
+    def __init__(self, folder, interval=POLL_INTERVAL):
+        self.folder = Path(folder)
+        self.interval = interval
+        self.snapshot = self._scan()
+        self.last_scan = time.time()
+
+    def _scan(self):
+        snapshot = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.name.endswith('.md') and entry.is_file():
+                    stat = entry.stat()
+                    snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout):
+        # حلقة المراقبة تنتظر بمهلة قصيرة (للتأخير والحالة)؛ المجلد لا يُفحص إلا مرة كل interval
+        time.sleep(max(0.0, min(timeout, self.last_scan + self.interval - time.time())))
+        if time.time() - self.last_scan < self.interval:
+            return []
+        self.last_scan = time.time()
+        current = self._scan()
+        changed = [Path(p) for p, sig in current.items() if self.snapshot.get(p) != sig]
+        self.snapshot = current
+        return changed
+
+    def close(self):
+        pass
+
+def open_event_source(folder, force_polling=False):
+    """استخدام inotify إن أمكن، وإلا الرجوع إلى الفحص الدوري."""
+    if not force_polling and sys.platform.startswith('linux'):
+        try:
+            return InotifySource(folder), 'inotify'
+        except (OSError, AttributeError) as e:
+            print(f"  ⚠️ تعذر تفعيل inotify ({e}). سيتم استخدام الفحص الدوري.")
+    return PollingSource(folder), 'polling'
+
+# --- 2. طابور العمل ---
+
+class WorkQueue:
+    """
+    طابور الوثائق المتغيرة مع منع التكرار وقياس العمق والتأخير.
+    بصمة المحتوى تُسجل معالَجةً عند نجاح العامل فقط، فالوثيقة التي فشلت (حصة، خطأ API)
+    يُعاد إدراجها مع أول حدث عليها حتى لو لم يتغير محتواها.
+    """
+
+    def __init__(self, digests=None):
+        self.queue = queue.Queue()
+        self.pending = {}         # المسار -> وقت الإدراج
+        self.digests = dict(digests or {})   # المسار -> بصمة آخر معالجة ناجحة
+        self.in_flight = {}       # المسار -> بصمة المحتوى قيد المعالجة
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.last_error = None
+
+    def put(self, path, digest=None):
+        """إدراج وثيقة ما لم تكن في الطابور، أو كان محتواها (digest) قد عولج أو قيد المعالجة."""
+        with self.lock:
+            if path in self.pending:
+                return False
+            if digest is not None and digest in (self.digests.get(path), self.in_flight.get(path)):
+                return False
+            self.pending[path] = time.time()
+        self.queue.put((path, digest))
+        return True
+
+    def get(self):
+        path, digest = self.queue.get()
+        with self.lock:
+            enqueued_at = self.pending.pop(path, time.time())
+            self.in_flight[path] = digest
+        return path, enqueued_at, digest
+
+    def finish(self, path, digest, succeeded):
+        with self.lock:
+            self.in_flight.pop(path, None)
+            if succeeded:
+                self.processed += 1
+                if digest is not None:
+                    self.digests[path] = digest
+            else:
+                self.failed += 1
+
+    def depth(self):
+        with self.lock:
+            return len(self.pending)
+
+    def lag(self):
+        """عمر أقدم عنصر ينتظر في الطابور (بالثواني)."""
+        with self.lock:
+            return time.time() - min(self.pending.values()) if self.pending else 0.0
+
+    def status(self):
+        return {
+            'queue_depth': self.depth(),
+            'lag_seconds': round(self.lag(), 1),
+            'processed': self.processed,
+            'failed': self.failed,
+            'last_error': self.last_error,
+            'updated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+
+def process_source_document(source_path, output_folder):
+    """تقسيم وثيقة مصدرية واحدة ثم إثراء مجلدها فقط."""
+    build_state = BuildState(output_folder)
+    try:
+        doc_slug = split_and_record(source_path, build_state, output_folder)
+    finally:
+        build_state.close()
+    process_enrichment(output_folder, only_docs=[doc_slug])
+    return doc_slug
+
+def worker_loop(work_queue, output_folder):
+    """عامل يستهلك الطابور بالتسلسل (استدعاءات LLM مقيدة بحصة المفتاح أصلاً)."""
+    while True:
+        source_path, enqueued_at, digest = work_queue.get()
+        print("\n" + "="*70)
+        print(f"--- معالجة الوثيقة المتغيرة: {source_path.name} (انتظرت {time.time() - enqueued_at:.1f} ث) ---")
+        try:
+            process_source_document(source_path, output_folder)
+            work_queue.finish(source_path, digest, True)
+        except Exception as e:
+            work_queue.finish(source_path, digest, False)
+            work_queue.last_error = f"{source_path.name}: {e}"
+            print(f"❌ فشل معالجة {source_path.name}. الخطأ: {e}")
+            traceback.print_exc()
+
+# --- 3. حلقة المراقبة ---
+
+def watch(source_folder="source_files", output_folder="processed_systems_output", force_polling=False):
+    """مراقبة مجلد المصدر ومعالجة الوثائق الجديدة أو المعدلة فقط."""
+    source_folder = Path(source_folder)
+    if not source_folder.exists():
+        print(f"❌ لم يتم العثور على مجلد الملفات المصدر: {source_folder}")
+        return
+    Path(output_folder).mkdir(parents=True, exist_ok=True)
+
+    source, mode = open_event_source(source_folder, force_polling)
+    print(f"👀 بدء مراقبة {source_folder} (الوضع: {mode}). اضغط Ctrl+C للإيقاف.")
+
+    # بصمات المحتوى لتجاهل الأحداث التي لا تغير الملف فعلياً (مثل touch)
+    digests = {p: file_hash(p) for p in source_folder.glob("*.md")}
+
+    # الوثائق التي عُدّلت أو أُضيفت أثناء توقف المراقبة لن تصلها أحداث: تُدرج من حالة البناء عند البدء
+    build_state = BuildState(output_folder)
+    try:
+        stale = [p for p in sorted(digests) if build_state.is_split_stale(p, SPLITTER_VERSION)]
+    finally:
+        build_state.close()
+    if stale:
+        print(f"  📥 {len(stale)} وثيقة تغيرت أثناء توقف المراقبة؛ أُضيفت إلى الطابور.")
+    # بصمات الوثائق المتقادمة لا تُعد معالَجة حتى ينجح العامل فيها
+    work_queue = WorkQueue({p: d for p, d in digests.items() if p not in stale})
+    for path in stale:
+        work_queue.put(path, digests[path])
+    threading.Thread(target=worker_loop, args=(work_queue, output_folder), daemon=True).start()
+    last_event = {}
+    last_status = 0.0
+    status_path = Path(output_folder) / STATUS_FILE
+
+    try:
+        while True:
+            for path in source.wait(timeout=DEBOUNCE_SECONDS / 2):
+                last_event[path] = time.time()
+
+            # تمرير الملفات التي هدأت أحداثها (debounce) إلى الطابور
+            now = time.time()
+            for path in [p for p, t in last_event.items() if now - t >= DEBOUNCE_SECONDS]:
+                del last_event[path]
+                if not path.exists():
+                    continue
+                if work_queue.put(path, file_hash(path)):
+                    print(f"  📥 تغيرت الوثيقة: {path.name} (عمق الطابور: {work_queue.depth()})")
+
+            if now - last_status >= STATUS_INTERVAL:
+                last_status = now
+                status = work_queue.status()
+                tmp_path = status_path.with_name(status_path.name + '.tmp')
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(status, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, status_path)
+                if status['queue_depth']:
+                    print(f"  📊 عمق الطابور: {status['queue_depth']} | التأخير: {status['lag_seconds']} ث")
+    except KeyboardInterrupt:
+        print("\n🛑 تم إيقاف المراقبة.")
+    finally:
+        source.close()
+
+# --- 4. التشغيل ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="وضع المراقبة: تقسيم وإثراء الوثائق المتغيرة فقط.")
+    parser.add_argument("--source", default="source_files", help="مجلد الملفات المصدر")
+    parser.add_argument("--output", default="processed_systems_output", help="مجلد المخرجات")
+    parser.add_argument("--poll", action="store_true", help="فرض استخدام الفحص الدوري بدلاً من inotify")
+    args = parser.parse_args()
+
+    watch(args.source, args.output, force_polling=args.poll)